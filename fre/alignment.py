@@ -0,0 +1,198 @@
+from difflib import SequenceMatcher
+from typing import List, Sequence, Tuple
+
+# Maximum number of edits to search for with the Myers algorithm before
+# falling back to difflib (the Myers trace grows quadratically in the
+# number of edits)
+MAX_EDITS_MYERS = 1000
+
+Block = Tuple[int, int, int]
+
+
+# ====================
+def matching_blocks(a: Sequence,
+                    b: Sequence,
+                    max_edits: int = MAX_EDITS_MYERS) -> List[Block]:
+    """Get the blocks of elements that are shared by two sequences in a
+    minimal alignment of the two sequences.
+
+    Common prefixes and suffixes are matched directly, and the
+    remainder is aligned using the Myers O(ND) diff algorithm, which is
+    fast when the sequences only differ in a small number of places.
+
+    Args:
+      a (Sequence):
+        The first sequence (e.g. reference base characters)
+      b (Sequence):
+        The second sequence (e.g. hypothesis base characters)
+      max_edits (int, optional):
+        The maximum number of edits to search for using the Myers
+        algorithm. If the sequences differ by more than this, difflib is
+        used instead. Defaults to MAX_EDITS_MYERS.
+
+    Returns:
+      List[Block]:
+        A list of (a_start, b_start, length) tuples in ascending order.
+    """
+
+    len_a, len_b = len(a), len(b)
+    prefix = 0
+    while prefix < len_a and prefix < len_b and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < len_a - prefix and suffix < len_b - prefix
+           and a[len_a - 1 - suffix] == b[len_b - 1 - suffix]):
+        suffix += 1
+    a_mid = a[prefix:len_a - suffix]
+    b_mid = b[prefix:len_b - suffix]
+    mid_blocks = myers_blocks(a_mid, b_mid, max_edits)
+    if mid_blocks is None:
+        matcher = SequenceMatcher(None, a_mid, b_mid, autojunk=False)
+        mid_blocks = [
+            (i, j, n) for i, j, n in matcher.get_matching_blocks() if n > 0
+        ]
+    blocks = [(0, 0, prefix)]
+    blocks.extend((i + prefix, j + prefix, n) for i, j, n in mid_blocks)
+    blocks.append((len_a - suffix, len_b - suffix, suffix))
+    return merge_blocks(blocks)
+
+
+# ====================
+def myers_blocks(a: Sequence, b: Sequence, max_edits: int) -> List[Block]:
+    """Get matching blocks for two sequences using the Myers diff
+    algorithm, or None if the sequences differ by more than max_edits
+    edits."""
+
+    len_a, len_b = len(a), len(b)
+    v = {1: 0}
+    trace = []
+    for d in range(min(len_a + len_b, max_edits) + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < len_a and y < len_b and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= len_a and y >= len_b:
+                return myers_backtrack(trace, len_a, len_b)
+    return None
+
+
+# ====================
+def myers_backtrack(trace: List[dict], len_a: int, len_b: int) -> List[Block]:
+    """Recover matching blocks from the trace of the Myers algorithm."""
+
+    blocks = []
+    x, y = len_a, len_b
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        snake_len = min(x - prev_x, y - prev_y) if d > 0 else x
+        if snake_len > 0:
+            blocks.append((x - snake_len, y - snake_len, snake_len))
+        x, y = prev_x, prev_y
+    return blocks[::-1]
+
+
+# ====================
+def merge_blocks(blocks: List[Block]) -> List[Block]:
+    """Remove empty blocks and merge blocks that are contiguous in both
+    sequences."""
+
+    merged = []
+    for i, j, n in blocks:
+        if n == 0:
+            continue
+        if merged and merged[-1][0] + merged[-1][2] == i \
+                and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + n)
+        else:
+            merged.append((i, j, n))
+    return merged
+
+
+# ====================
+def skipped_spans(blocks: List[Block],
+                  a: Sequence,
+                  b: Sequence) -> List[dict]:
+    """Get the spans of each sequence that are not covered by any
+    matching block.
+
+    Args:
+      blocks (List[Block]):
+        Matching blocks, as returned by matching_blocks
+      a (Sequence):
+        The first (reference) sequence
+      b (Sequence):
+        The second (hypothesis) sequence
+
+    Returns:
+      List[dict]:
+        A list of skipped spans, with start and end positions and text
+        for the reference and hypothesis.
+    """
+
+    spans = []
+    a_pos, b_pos = 0, 0
+    for i, j, n in blocks + [(len(a), len(b), 0)]:
+        if i > a_pos or j > b_pos:
+            spans.append({
+                'ref_start': a_pos,
+                'ref_end': i,
+                'hyp_start': b_pos,
+                'hyp_end': j,
+                'ref_text': ''.join(a[a_pos:i]),
+                'hyp_text': ''.join(b[b_pos:j])
+            })
+        a_pos, b_pos = i + n, j + n
+    return spans
+
+
+# ====================
+def alignment_info(blocks: List[Block], a: Sequence, b: Sequence) -> dict:
+    """Get coverage statistics and skipped spans for an alignment.
+
+    Args:
+      blocks (List[Block]):
+        Matching blocks, as returned by matching_blocks
+      a (Sequence):
+        The first (reference) sequence
+      b (Sequence):
+        The second (hypothesis) sequence
+
+    Returns:
+      dict:
+        The number of aligned, reference, and hypothesis characters,
+        the proportion of the reference and hypothesis covered by the
+        alignment, and the skipped spans.
+    """
+
+    num_aligned = sum(n for _, _, n in blocks)
+    return {
+        'aligned_chars': num_aligned,
+        'ref_chars': len(a),
+        'hyp_chars': len(b),
+        'ref_coverage': coverage(num_aligned, len(a)),
+        'hyp_coverage': coverage(num_aligned, len(b)),
+        'skipped_spans': skipped_spans(blocks, a, b)
+    }
+
+
+# ====================
+def coverage(num_aligned: int, num_total: int) -> float:
+    """Get the proportion of characters covered by an alignment."""
+
+    if num_total == 0:
+        return 1.0
+    return num_aligned / num_total
@@ -0,0 +1,143 @@
+import unicodedata
+from typing import List, Tuple
+
+import numpy as np
+
+# Case classes
+UNCASED = 0
+LOWER = 1
+UPPER = 2
+
+# Languages in which dotted and dotless i are distinct letters
+DOTTED_I_LANGUAGES = ['tr', 'az']
+# Languages in which accents are conventionally dropped in upper case
+ACCENTLESS_UPPER_CASE_LANGUAGES = ['el']
+
+
+# ====================
+class Casing:
+    """Language-aware case analysis of grapheme clusters.
+
+    The case class and case-folded form of each distinct grapheme
+    cluster are computed once and stored in a lookup table, so that the
+    case classes for a whole document can be built as a NumPy array in a
+    single pass."""
+
+    # ====================
+    def __init__(self, language: str = None):
+        """Initializes an instance of Casing.
+
+        Args:
+          language (str, optional):
+            An ISO 639-1 language code (e.g. 'tr') used to select
+            language-specific case folding rules. If None, default Unicode
+            case folding is used. Defaults to None.
+        """
+
+        self.language = language
+        self.lookup = {}
+
+    # ====================
+    def analyse_grapheme(self, grapheme: str) -> Tuple[str, int, bool]:
+        """Get the case-folded form, case class, and whether or not a
+        grapheme cluster is alphanumeric."""
+
+        analysis = self.lookup.get(grapheme)
+        if analysis is None:
+            analysis = (
+                self.fold(grapheme),
+                case_class(grapheme),
+                grapheme[0].isalnum()
+            )
+            self.lookup[grapheme] = analysis
+        return analysis
+
+    # ====================
+    def fold(self, grapheme: str) -> str:
+        """Case-fold a grapheme cluster for comparison.
+
+        Unicode case folding maps German 'ß' and 'ẞ' to the same form and
+        Greek final sigma to sigma. For Turkish and Azerbaijani, 'I' is
+        folded to dotless 'ı' and 'İ' to 'i'. For Greek, accents are
+        removed, as they are usually omitted in upper case."""
+
+        if self.language in DOTTED_I_LANGUAGES:
+            grapheme = grapheme.replace('I', 'ı').replace('İ', 'i')
+        folded = grapheme.casefold()
+        if self.language in ACCENTLESS_UPPER_CASE_LANGUAGES:
+            folded = ''.join(
+                c for c in unicodedata.normalize('NFD', folded)
+                if unicodedata.category(c) != 'Mn'
+            )
+        return folded
+
+    # ====================
+    def analyse(self, graphemes: List[str]) \
+            -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Analyse the case of a list of (base) grapheme clusters.
+
+        Args:
+          graphemes (List[str]):
+            The grapheme clusters
+
+        Returns:
+          Tuple[List[str], np.ndarray, np.ndarray]:
+            The case-folded grapheme clusters, an array of case classes
+            (UNCASED, LOWER, or UPPER), and a boolean array indicating
+            which grapheme clusters are alphanumeric.
+        """
+
+        if len(graphemes) == 0:
+            return [], np.zeros(0, dtype=np.int8), np.zeros(0, dtype=bool)
+        folded, classes, alnum = zip(
+            *[self.analyse_grapheme(g) for g in graphemes])
+        return (
+            list(folded),
+            np.array(classes, dtype=np.int8),
+            np.array(alnum, dtype=bool)
+        )
+
+
+# ====================
+def case_class(grapheme: str) -> int:
+    """Get the case class of a grapheme cluster from its first character.
+    Title case letters (e.g. 'ǅ') are treated as upper case."""
+
+    char = grapheme[0]
+    if char.isupper() or unicodedata.category(char) == 'Lt':
+        return UPPER
+    elif char.islower():
+        return LOWER
+    else:
+        return UNCASED
+
+
+# ====================
+def word_case_flags(case_classes: np.ndarray,
+                    word_starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Find words with an upper case initial and words written entirely in
+    upper case.
+
+    Args:
+      case_classes (np.ndarray):
+        Case classes of each position in a document.
+      word_starts (np.ndarray):
+        Positions at which words start.
+
+    Returns:
+      Tuple[np.ndarray, np.ndarray]:
+        Boolean arrays with an entry for each word indicating whether the
+        word is capitalized (first letter upper case, but not all capitals)
+        and whether it is an all-caps token (two or more cased letters,
+        all upper case).
+    """
+
+    if len(word_starts) == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+    upper = (case_classes == UPPER).astype(np.int64)
+    cased = (case_classes != UNCASED).astype(np.int64)
+    num_upper = np.add.reduceat(upper, word_starts)
+    num_cased = np.add.reduceat(cased, word_starts)
+    all_caps = (num_cased >= 2) & (num_upper == num_cased)
+    initial = (case_classes[word_starts] == UPPER) & ~all_caps
+    return initial, all_caps
@@ -3,9 +3,13 @@ from typing import Dict, List, Tuple, Union
 import jinja2
 import numpy as np
 import pandas as pd
-from sklearn.metrics import confusion_matrix
 
+from fre.alignment import alignment_info, matching_blocks
+from fre.feature_set import (ERROR_FIRST_CHAR_FEATURE_CHAR, Feature,
+                             FeatureSet, compile_features)
 from fre.misc import CAPS, display_or_print, list_gclust
+from fre.prf import prf_arrays
+from fre.result_store import PRF_COLUMNS, counts_to_cms
 
 environment = jinja2.Environment()
 template_latex = environment.from_string("""
@@ -18,9 +22,22 @@ template_latex = environment.from_string("""
 {{ "%.2f"|format(scores['F-score']) }}
 {% endfor %}
 """)  # noqa: W605
+template_latex_class_cm = environment.from_string(r"""
+\begin{tabular}{l|{% for _ in labels %}r{% endfor %}}
+\hline
+& {{ labels|join(' & ') }}\\
+\hline
+{% for label, row in rows -%}
+{{ label }} & {{ row|join(' & ') }}\\
+{% endfor -%}
+\hline
+\end{tabular}
+""")
 
 FEATURE_DISPLAY_NAMES = {
     'CAPS': "Capitalization",
+    'CAPS_INITIAL': "Capitalized words",
+    'CAPS_ALL': "All-caps words",
     ' ': "Spaces (' ')",
     ',': "Commas (',')",
     '.': "Periods ('.')",
@@ -33,8 +50,6 @@ FEATURE_DISPLAY_NAMES_LATEX = {
     'all': 'All'
 }
 
-ERROR_FIRST_CHAR_FEATURE_CHAR = """
-The first character in the document is a feature character!"""
 WARNING_DIFFERENT_CHARS = """
 'WARNING: The below characters appear in either the reference or \
 hypothesis string but not in both in doc with index {}: {}. \
@@ -46,7 +61,9 @@ Returning None.
 
 # ========================
 def show_cms(cms: dict,
-             features_to_show: List[str] = None):
+             features_to_show: List[str] = None,
+             class_cm: np.ndarray = None,
+             class_features: List[str] = None):
     """Show confusion matrices for evaluation results.
 
     Args:
@@ -55,6 +72,11 @@ def show_cms(cms: dict,
       features_to_show (List[str]):
         Features to show confusion matrices for. If None, show
         confusion matrics for all features. Defaults to None.
+      class_cm (np.ndarray, optional):
+        A multi-class confusion matrix over class_features to show after
+        the binary confusion matrices. Defaults to None.
+      class_features (List[str], optional):
+        The class features for class_cm. Defaults to None.
     """
 
     if features_to_show is None:
@@ -72,6 +94,54 @@ def show_cms(cms: dict,
         display_or_print(pd.DataFrame(
             cm, index=row_index, columns=col_index))
         print()
+    if class_cm is not None:
+        display_name = 'Feature classes'
+        print(display_name)
+        print('=' * len(display_name))
+        print()
+        show_class_cm(class_cm, class_features)
+        print()
+
+
+# ====================
+def show_class_cm(class_cm: np.ndarray,
+                  class_features: List[str],
+                  for_latex: bool = False):
+    """Show a multi-class confusion matrix over feature classes, showing
+    which feature was predicted at each position in place of which.
+
+    Args:
+      class_cm (np.ndarray):
+        The confusion matrix, of shape (N+1, N+1) for N class features.
+        Rows are reference classes and columns are hypothesis classes,
+        with 'none' first.
+      class_features (List[str]):
+        The class features, in order.
+      for_latex (bool, optional):
+        Whether or not to render the output for LaTeX. Defaults to False.
+    """
+
+    labels = [class_label(f, for_latex) for f in [None] + class_features]
+    if for_latex is True:
+        print(template_latex_class_cm.render(
+            labels=labels, rows=zip(labels, class_cm.tolist())))
+    else:
+        col_index = pd.MultiIndex.from_product([['Hypothesis'], labels])
+        row_index = pd.MultiIndex.from_product([['Reference'], labels])
+        display_or_print(pd.DataFrame(
+            class_cm, index=row_index, columns=col_index))
+
+
+# ====================
+def class_label(feature: str, latex: bool = False) -> str:
+    """Get a short label for a feature class (or 'none' for None)"""
+
+    if feature is None:
+        return 'none'
+    elif latex is True:
+        return f"'{feature}'".replace(' ', r'{\ }')
+    else:
+        return f"'{feature}'"
 
 
 # ====================
@@ -96,22 +166,408 @@ def get_cms(ref: str,
         The confusion matrices for the document
     """
 
-    chars_ref, feature_lists_ref = get_chars_and_feature_lists(ref, features)
-    chars_hyp, feature_lists_hyp = get_chars_and_feature_lists(hyp, features)
-    if chars_ref != chars_hyp:
-        different_chars = set(chars_ref).symmetric_difference(set(chars_hyp))
-        print(WARNING_DIFFERENT_CHARS.format(doc_idx, different_chars))
+    counts, _ = get_doc_counts(ref, hyp, features, doc_idx)
+    if counts is None:
         return None
-    confusion_matrices = {
-        f: confusion_matrix(
-            [f in x for x in feature_lists_ref],
-            [f in x for x in feature_lists_hyp],
-            labels=[True, False]
+    return counts_to_cms(counts['char'], features)
+
+
+# ====================
+def get_cms_aligned(ref: str,
+                    hyp: str,
+                    features: list) -> Tuple[Dict[str, np.ndarray], dict]:
+    """Get confusion matrices for reference and hypothesis strings whose
+    base characters may differ, scoring features only in the regions
+    where the base characters of the two strings can be aligned.
+
+    Args:
+      ref (str):
+        Reference string
+      hyp (str):
+        Hypothesis string
+      features (list):
+        List of features
+
+    Returns:
+      Tuple[Dict[str, np.ndarray], dict]:
+        The confusion matrices for the document, and alignment info
+        (coverage statistics and skipped spans) for the document.
+    """
+
+    counts, alignment_info_ = get_doc_counts(
+        ref, hyp, features, alignment=True)
+    return counts_to_cms(counts['char'], features), alignment_info_
+
+
+# ====================
+def get_doc_counts(ref: str,
+                   hyp: str,
+                   features: Union[List[Feature], FeatureSet],
+                   doc_idx: int = None,
+                   word_level: bool = False,
+                   alignment: bool = False,
+                   class_features: List[str] = None) \
+        -> Tuple[Dict[str, np.ndarray], dict]:
+    """Get confusion matrix counts for all features for reference and
+    hypothesis strings at character level and, optionally, word level.
+
+    Both granularities are derived from the same per-position feature
+    codes, so each document is only parsed once.
+
+    Args:
+      ref (str):
+        Reference string
+      hyp (str):
+        Hypothesis string
+      features (Union[List[Feature], FeatureSet]):
+        List of features, or a compiled FeatureSet
+      doc_idx (int, optional):
+        The index of the document (used only for warning messages).
+        Defaults to None.
+      word_level (bool, optional):
+        Whether or not to also get word-level counts. Defaults to False.
+      alignment (bool, optional):
+        Whether or not to align the base characters of the reference and
+        hypothesis strings and score features on the aligned regions
+        only. If False, None is returned for documents whose base
+        characters differ. Defaults to False.
+      class_features (List[str], optional):
+        Features to get a multi-class confusion matrix for. If None, no
+        multi-class confusion matrix is returned. Defaults to None.
+
+    Returns:
+      Tuple[Dict[str, np.ndarray], dict]:
+        A counts array of shape (num_features, 2, 2) for each granularity
+        ('char', and 'word' if word_level is True), edit counts for
+        character and feature error rates ('edits', see
+        edit_counts_from_codes) and a multi-class confusion matrix
+        ('class', if class_features are given), or None if the document
+        was skipped; and alignment info for the document, or None if
+        alignment is False.
+    """
+
+    feature_set = compile_features(features)
+    return get_parsed_doc_counts(
+        feature_set.parse(ref, case_info=True),
+        feature_set.parse(hyp, case_info=True), feature_set,
+        doc_idx, word_level, alignment, class_features)
+
+
+# ====================
+def get_parsed_doc_counts(parsed_ref: Tuple[List[str], np.ndarray],
+                          parsed_hyp: Tuple[List[str], np.ndarray],
+                          feature_set: FeatureSet,
+                          doc_idx: int = None,
+                          word_level: bool = False,
+                          alignment: bool = False,
+                          class_features: List[str] = None) \
+        -> Tuple[Dict[str, np.ndarray], dict]:
+    """Get counts as get_doc_counts does, for reference and hypothesis
+    documents that have already been parsed with FeatureSet.parse (or
+    projected from cached grapheme clusters by a GraphemeCache) with
+    case_info=True.
+
+    CAPS_INITIAL and CAPS_ALL are scored on the word starts of the
+    reference, so that a feature missing between two words of the
+    hypothesis counts against that feature only."""
+
+    features = feature_set.features
+    chars_ref, codes_ref, _ = parsed_ref
+    chars_hyp, codes_hyp, _ = parsed_hyp
+    case_mask = sum(feature_set.case_bits.values())
+    ref_lengths = reference_lengths(len(chars_ref), codes_ref, case_mask)
+    base_edits = 0
+    alignment_info_ = None
+    if chars_ref != chars_hyp:
+        if alignment is not True:
+            different_chars = \
+                set(chars_ref).symmetric_difference(set(chars_hyp))
+            print(WARNING_DIFFERENT_CHARS.format(doc_idx, different_chars))
+            return None, None
+        blocks = matching_blocks(chars_ref, chars_hyp)
+        alignment_info_ = alignment_info(blocks, chars_ref, chars_hyp)
+        codes_hyp = feature_set.reference_word_codes(
+            parsed_ref, parsed_hyp,
+            aligned_positions([(i, n) for i, _, n in blocks]),
+            aligned_positions([(j, n) for _, j, n in blocks]))
+        codes_ref = aligned_codes(codes_ref, [(i, n) for i, _, n in blocks])
+        base_edits = sum(
+            max(span['ref_end'] - span['ref_start'],
+                span['hyp_end'] - span['hyp_start'])
+            for span in alignment_info_['skipped_spans']
         )
-        for f in features
+        chars_ref = [c for i, _, n in blocks for c in chars_ref[i:i+n]]
+    else:
+        if alignment is True:
+            alignment_info_ = alignment_info(
+                [(0, 0, len(chars_ref))], chars_ref, chars_hyp)
+        codes_hyp = feature_set.reference_word_codes(parsed_ref, parsed_hyp)
+    counts = {
+        'char': counts_from_codes(codes_ref, codes_hyp, len(features)),
+        'edits': edit_counts_from_codes(
+            codes_ref, codes_hyp, len(features), case_mask, ref_lengths,
+            base_edits)
     }
-    confusion_matrices['all'] = sum(confusion_matrices[f] for f in features)
-    return confusion_matrices
+    if class_features:
+        counts['class'] = class_cm_from_codes(
+            codes_ref, codes_hyp, features, class_features)
+    if word_level is True:
+        word_starts_ = word_starts(chars_ref, codes_ref, features)
+        counts['word'] = counts_from_codes(
+            reduce_codes(codes_ref, word_starts_),
+            reduce_codes(codes_hyp, word_starts_),
+            len(features)
+        )
+    return counts, alignment_info_
+
+
+# ====================
+def get_chars_and_feature_codes(doc: str,
+                                features: Union[List[Feature], FeatureSet]) \
+                                    -> Tuple[List[str], np.ndarray]:
+    """Split a document into base (non-feature) characters and an array
+    of feature codes for each base character.
+
+    Bit i of the code for a base character is set if features[i] is
+    present at that position (i.e. the character is upper case for CAPS,
+    or the feature immediately follows it).
+
+    Args:
+      doc (str):
+        The document
+      features (Union[List[Feature], FeatureSet]):
+        List of features, or a compiled FeatureSet
+
+    Returns:
+      Tuple[List[str], np.ndarray]:
+        The lower-cased base characters, and the feature codes.
+    """
+
+    return compile_features(features).parse(doc)
+
+
+# ====================
+def counts_from_codes(codes_ref: np.ndarray,
+                      codes_hyp: np.ndarray,
+                      num_features: int) -> np.ndarray:
+    """Get confusion matrix counts of shape (num_features, 2, 2) from
+    aligned arrays of reference and hypothesis feature codes."""
+
+    shifts = np.arange(num_features, dtype=np.int64)
+    in_ref = ((codes_ref[:, None] >> shifts) & 1).astype(bool)
+    in_hyp = ((codes_hyp[:, None] >> shifts) & 1).astype(bool)
+    tp = np.count_nonzero(in_ref & in_hyp, axis=0)
+    fn = np.count_nonzero(in_ref & ~in_hyp, axis=0)
+    fp = np.count_nonzero(~in_ref & in_hyp, axis=0)
+    tn = len(codes_ref) - tp - fn - fp
+    return np.stack([tp, fn, fp, tn], axis=1).reshape(num_features, 2, 2)
+
+
+# ====================
+def reference_lengths(num_chars: int,
+                      codes_ref: np.ndarray,
+                      case_mask: int) -> Tuple[int, int]:
+    """Get the length of a reference document in graphemes (base
+    characters plus feature occurrences other than case features) and
+    the number of feature occurrences (including case features)."""
+
+    num_features = popcount(codes_ref)
+    num_case_features = popcount(codes_ref & case_mask)
+    return (num_chars + int(num_features.sum() - num_case_features.sum()),
+            int(num_features.sum()))
+
+
+# ====================
+def popcount(codes: np.ndarray) -> np.ndarray:
+    """Get the number of bits set in each feature code."""
+
+    bits = np.unpackbits(
+        codes.astype('<i8').view(np.uint8).reshape(-1, 8), axis=1)
+    return bits.sum(axis=1)
+
+
+# ====================
+def edit_counts_from_codes(codes_ref: np.ndarray,
+                           codes_hyp: np.ndarray,
+                           num_features: int,
+                           case_mask: int,
+                           ref_lengths: Tuple[int, int],
+                           base_edits: int = 0) -> np.ndarray:
+    """Get edit counts for character error rate (CER) and feature error
+    rate (FER) from aligned arrays of reference and hypothesis feature
+    codes, without a separate edit distance calculation.
+
+    At each aligned position, a case feature error is one substitution of
+    the base character. The other features that follow the base character
+    are compared as a set: features missing from the hypothesis and
+    features added to it are paired up as substitutions, and the
+    remainder are deletions or insertions, so the number of edits is the
+    larger of the two numbers. Each feature counts as one grapheme, even
+    if it is a multi-character mark. Where documents were aligned, each
+    pair of skipped spans counts as max(reference length, hypothesis
+    length) edits of base characters.
+
+    Args:
+      codes_ref (np.ndarray):
+        Reference feature codes at aligned positions.
+      codes_hyp (np.ndarray):
+        Hypothesis feature codes at aligned positions.
+      num_features (int):
+        The number of features.
+      case_mask (int):
+        A bitmask of the case features.
+      ref_lengths (Tuple[int, int]):
+        The length of the whole reference document in graphemes and its
+        number of feature occurrences, from reference_lengths.
+      base_edits (int, optional):
+        The number of edits of base characters in skipped spans. Defaults
+        to 0.
+
+    Returns:
+      np.ndarray:
+        An array of [reference length in graphemes, character edits,
+        number of reference features, feature edits].
+    """
+
+    errors = codes_ref ^ codes_hyp
+    case_errors = errors & case_mask
+    other_mask = ((1 << num_features) - 1) & ~case_mask
+    deleted = popcount(codes_ref & errors & other_mask)
+    inserted = popcount(codes_hyp & errors & other_mask)
+    other_edits = int(np.maximum(deleted, inserted).sum())
+    char_edits = base_edits + int(np.count_nonzero(case_errors)) \
+        + other_edits
+    feature_edits = int(popcount(case_errors).sum()) + other_edits
+    return np.array(
+        [ref_lengths[0], char_edits, ref_lengths[1], feature_edits],
+        dtype=np.int64)
+
+
+# ====================
+def show_error_rates_table(error_rate_info: Dict[str, dict],
+                           for_latex: bool = False):
+    """Show reference lengths, numbers of edits, and character and feature
+    error rates in a table.
+
+    Args:
+      error_rate_info (Dict[str, dict]):
+        Error rate info from ResultStore.get_error_rate_info.
+      for_latex (bool, optional):
+        Whether or not to format the output for LaTeX. Defaults to False.
+    """
+
+    cer = error_rate_info['CER']['cer']
+    fer = error_rate_info['FER']['fer']
+    if for_latex is True:
+        print(rf"\textbf{{CER:}} {cer:.2f}\%\\")
+        print(rf"\textbf{{FER:}} {fer:.2f}\%\\")
+        return
+    row_labels = [
+        'Length of reference',
+        'Number of edits (S+D+I)',
+        'Error rate (%)'
+    ]
+    columns = {
+        'CER (graphemes)': [
+            f"{error_rate_info['CER']['len_ref']:,}",
+            f"{error_rate_info['CER']['num_edits']:,}",
+            f"{cer:.2f}%"
+        ],
+        'FER (features)': [
+            f"{error_rate_info['FER']['len_ref']:,}",
+            f"{error_rate_info['FER']['num_edits']:,}",
+            f"{fer:.2f}%"
+        ]
+    }
+    display_or_print(pd.DataFrame(columns, index=row_labels))
+
+
+# ====================
+def class_cm_from_codes(codes_ref: np.ndarray,
+                        codes_hyp: np.ndarray,
+                        features: List[str],
+                        class_features: List[str]) -> np.ndarray:
+    """Get a multi-class confusion matrix of shape (N+1, N+1) over N class
+    features from aligned arrays of reference and hypothesis feature
+    codes."""
+
+    num_classes = len(class_features) + 1
+    cls_ref = class_codes(codes_ref, features, class_features)
+    cls_hyp = class_codes(codes_hyp, features, class_features)
+    return np.bincount(
+        cls_ref * num_classes + cls_hyp, minlength=num_classes ** 2
+    ).reshape(num_classes, num_classes)
+
+
+# ====================
+def class_codes(codes: np.ndarray,
+                features: List[str],
+                class_features: List[str]) -> np.ndarray:
+    """Get the class of each position, where class i+1 means that
+    class_features[i] is the first class feature (in the order of
+    features) present at the position, and 0 means that no class feature
+    is present."""
+
+    bit_to_class = np.zeros(len(features), dtype=np.int64)
+    class_mask = 0
+    for i, f in enumerate(class_features):
+        bit_to_class[features.index(f)] = i + 1
+        class_mask |= 1 << features.index(f)
+    masked = codes & class_mask
+    # Isolate the lowest set bit, and get its index
+    lowest_bit = masked & -masked
+    bit_idx = np.log2(np.maximum(lowest_bit, 1)).astype(np.int64)
+    return np.where(masked > 0, bit_to_class[bit_idx], 0)
+
+
+# ====================
+def aligned_positions(spans: List[Tuple[int, int]]) -> np.ndarray:
+    """Get the positions in the (start, length) spans of a document."""
+
+    if len(spans) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(
+        [np.arange(start, start + n, dtype=np.int64) for start, n in spans])
+
+
+# ====================
+def aligned_codes(codes: np.ndarray, spans: List[Tuple[int, int]]) \
+        -> np.ndarray:
+    """Concatenate the (start, length) spans of a feature code array."""
+
+    if len(spans) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([codes[start:start+n] for start, n in spans])
+
+
+# ====================
+def word_starts(chars: List[str],
+                codes_ref: np.ndarray,
+                features: List[str]) -> np.ndarray:
+    """Get the positions at which words start in a document, based on the
+    spaces in the reference.
+
+    A word ends at a position followed by a space feature or, if spaces
+    are not features, at a whitespace base character."""
+
+    if len(codes_ref) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if ' ' in features:
+        word_ends = ((codes_ref >> features.index(' ')) & 1).astype(bool)
+    else:
+        word_ends = np.array([c.isspace() for c in chars], dtype=bool)
+    return np.concatenate([[0], np.flatnonzero(word_ends[:-1]) + 1])
+
+
+# ====================
+def reduce_codes(codes: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Combine the feature codes of each span starting at the given
+    positions, so that a feature is present in a span if it is present at
+    any position in the span."""
+
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.bitwise_or.reduceat(codes, starts)
 
 
 # ====================
@@ -141,7 +597,8 @@ def get_chars_and_feature_lists(doc: str,
 
 # ====================
 def show_prfs(cms: Dict[str, np.ndarray],
-              for_latex: bool = False):
+              for_latex: bool = False,
+              beta: float = 1.0):
     """Display a table showing precision, recall, and F-score table.
 
     Args:
@@ -149,9 +606,13 @@ def show_prfs(cms: Dict[str, np.ndarray],
         Confusion matrices.
       for_latex (bool, optional):
         Whether or not to render the output for LaTeX. Defaults to False.
+      beta (float, optional):
+        The weight of recall relative to precision in the F-score.
+        Defaults to 1.0.
     """
 
-    prfs = prfs_all_features(cms, display_names=True, for_latex=for_latex)
+    prfs = prfs_all_features(
+        cms, display_names=True, for_latex=for_latex, beta=beta)
     if for_latex is True:
         print(template_latex.render(prfs=prfs))
     else:
@@ -161,10 +622,13 @@ def show_prfs(cms: Dict[str, np.ndarray],
 # ====================
 def prfs_all_features(cms: Dict[str, np.ndarray],
                       display_names: bool = False,
-                      for_latex: bool = False) -> Dict[str, dict]:
+                      for_latex: bool = False,
+                      beta: float = 1.0) -> Dict[str, dict]:
     """Get precision, recall, and F-score for all features from multiple
     confusion matrics.
 
+    Metrics for all features are calculated at once with prf_arrays.
+
     Args:
       cms (Dict[str, np.ndarray]):
         The confusion matrics.
@@ -172,58 +636,55 @@ def prfs_all_features(cms: Dict[str, np.ndarray],
         Whether or not to use display names. Defaults to False.
       for_latex (bool, optional):
         Whether or not to use display names for LaTeX. Defaults to False.
+      beta (float, optional):
+        The weight of recall relative to precision in the F-score.
+        Defaults to 1.0.
 
     Returns:
       Dict[str, dict]:
         The precision, recall, and F-score for each feature
     """
 
+    features = list(cms)
+    values = np.stack(
+        prf_arrays(np.stack([cms[f] for f in features]), beta), axis=1)
     if display_names is True:
-        prfs = {
-            feature_display_name(feature, for_latex):
-                prf_single_feature(cm)
-            for feature, cm in cms.items()
-        }
-    else:
-        prfs = {
-            feature: prf_single_feature(cm)
-            for feature, cm in cms.items()
-        }
-    return prfs
+        features = [feature_display_name(f, for_latex) for f in features]
+    return {
+        feature: prf_dict(values_)
+        for feature, values_ in zip(features, values.tolist())
+    }
 
 
 # ====================
-def prf_single_feature(cm: np.ndarray) -> Dict[str, Union[float, str]]:
+def prf_single_feature(cm: np.ndarray,
+                       beta: float = 1.0) -> Dict[str, Union[float, str]]:
     """Calculate precision, recall, and F-score from a confusion matrix.
 
     Args:
       cm (np.ndarray):
         A confusion matrix
+      beta (float, optional):
+        The weight of recall relative to precision in the F-score.
+        Defaults to 1.0.
 
     Returns:
       Dict[str, Union[float, str]]:
         Precision, recall, and F-score.
     """
 
-    tp = float(cm[0][0])
-    fp = float(cm[1][0])
-    fn = float(cm[0][1])
-    try:
-        precision = tp / (tp + fp)
-    except ZeroDivisionError:
-        precision = 'N/A'
-    try:
-        recall = tp / (tp + fn)
-    except ZeroDivisionError:
-        recall = 'N/A'
-    try:
-        fscore = (2*precision*recall) / (precision+recall)
-    except (TypeError, ZeroDivisionError):
-        fscore = 'N/A'
+    return prf_dict([
+        float(value) for value in prf_arrays(np.asarray(cm), beta)])
+
+
+# ====================
+def prf_dict(values: List[float]) -> Dict[str, Union[float, str]]:
+    """Get a dictionary of precision, recall, and F-score, with 'N/A' for
+    undefined values."""
+
     return {
-        'Precision': precision,
-        'Recall': recall,
-        'F-score': fscore,
+        metric: 'N/A' if np.isnan(value) else value
+        for metric, value in zip(PRF_COLUMNS, values)
     }
 
 
@@ -0,0 +1,540 @@
+import mmap
+import os
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Union
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ModuleNotFoundError:
+    pa = None
+    pc = None
+    pq = None
+
+ERROR_NO_PYARROW = """
+The pyarrow library is required to read Arrow and Parquet corpora."""
+ERROR_COLUMN_REQUIRED = """
+A column name must be specified to read a corpus from a table."""
+ERROR_ARROW_TYPE = """
+Arrow corpora must be created from a pyarrow Array, ChunkedArray, Table, \
+or RecordBatch."""
+ERROR_INDEX_STALE = """
+The line offset index at {index_path} does not match {path}. Rebuild it \
+with rebuild_index=True."""
+MESSAGE_BUILDING_INDEX = "Building line offset index for {path}..."
+MESSAGE_INDEX_NOT_SAVED = """Could not save line offset index to \
+{index_path} ({error}). The index will be kept in memory."""
+# Number of bytes to scan for line breaks at a time when building an index
+INDEX_CHUNK_SIZE = 64 * 1024 * 1024
+ERROR_DOC_IDX = """
+Document index {doc_idx} is out of range for a corpus of {num_docs} \
+documents."""
+
+
+# ====================
+class Corpus(ABC):
+    """Abstract base class for corpora whose documents are read on demand
+    rather than held in memory as a list of strings.
+
+    Subclasses must implement __len__ and get_doc. Corpora can be passed to
+    FeatureRestorationEvaluator in place of lists of strings."""
+
+    # ====================
+    @abstractmethod
+    def __len__(self) -> int:
+
+        pass
+
+    # ====================
+    @abstractmethod
+    def get_doc(self, doc_idx: int) -> str:
+        """Get a single document by (non-negative) index."""
+
+        pass
+
+    # ====================
+    def __getitem__(self, doc_idx: Union[int, slice]) \
+            -> Union[str, List[str]]:
+
+        if isinstance(doc_idx, slice):
+            return [
+                self.get_doc(i) for i in range(*doc_idx.indices(len(self)))
+            ]
+        num_docs = len(self)
+        if doc_idx < 0:
+            doc_idx += num_docs
+        if not 0 <= doc_idx < num_docs:
+            raise IndexError(
+                ERROR_DOC_IDX.format(doc_idx=doc_idx, num_docs=num_docs))
+        return self.get_doc(doc_idx)
+
+    # ====================
+    def __iter__(self) -> Iterator[str]:
+
+        for doc_idx in range(len(self)):
+            yield self.get_doc(doc_idx)
+
+    # ====================
+    def doc_lengths(self) -> np.ndarray:
+        """Get the length of every document. Subclasses can override this
+        to get lengths without reading every document."""
+
+        return np.fromiter(
+            (len(doc) for doc in self), dtype=np.int64, count=len(self))
+
+
+# ====================
+class ArrowCorpus(Corpus):
+    """A corpus backed by a column of strings in Arrow memory.
+
+    Documents are converted to Python strings one at a time when they
+    are accessed, so the column is never converted to a list of Python
+    objects as a whole. Row-range selection is zero-copy."""
+
+    # ====================
+    def __init__(self,
+                 data,
+                 column: str = None,
+                 start: int = 0,
+                 stop: int = None):
+        """Initializes an instance of ArrowCorpus.
+
+        Args:
+          data (Union[pa.Array, pa.ChunkedArray, pa.Table, pa.RecordBatch]):
+            An Arrow array of strings, or a table or record batch
+            containing a column of strings.
+          column (str, optional):
+            The column of data to use, if data is a table or record batch.
+            Defaults to None.
+          start (int, optional):
+            The first row to use. Defaults to 0.
+          stop (int, optional):
+            The row to stop before. If None, use all rows from start.
+            Defaults to None.
+        """
+
+        if pa is None:
+            raise ImportError(ERROR_NO_PYARROW)
+        if isinstance(data, (pa.Table, pa.RecordBatch)):
+            if column is None:
+                raise ValueError(ERROR_COLUMN_REQUIRED)
+            data = data.column(column)
+        if isinstance(data, pa.Array):
+            data = pa.chunked_array([data])
+        if not isinstance(data, pa.ChunkedArray):
+            raise TypeError(ERROR_ARROW_TYPE)
+        start, stop, _ = slice(start, stop).indices(len(data))
+        self.data = data.slice(start, max(stop - start, 0))
+        self.chunks = [c for c in self.data.chunks if len(c) > 0]
+        self.chunk_starts = np.cumsum(
+            [0] + [len(c) for c in self.chunks[:-1]], dtype=np.int64)
+
+    # ====================
+    def __len__(self) -> int:
+
+        return len(self.data)
+
+    # ====================
+    def get_doc(self, doc_idx: int) -> str:
+
+        chunk_idx = int(np.searchsorted(
+            self.chunk_starts, doc_idx, side='right')) - 1
+        doc = self.chunks[chunk_idx][
+            doc_idx - int(self.chunk_starts[chunk_idx])].as_py()
+        return '' if doc is None else doc
+
+    # ====================
+    def __iter__(self) -> Iterator[str]:
+
+        # Convert one chunk at a time
+        for chunk in self.chunks:
+            for doc in chunk.to_pylist():
+                yield '' if doc is None else doc
+
+    # ====================
+    def doc_lengths(self) -> np.ndarray:
+        """Get the length of every document in characters from the Arrow
+        column, without converting documents to Python strings."""
+
+        return arrow_lengths(self.data)
+
+
+# ====================
+class ParquetCorpus(Corpus):
+    """A corpus backed by a column of strings in a Parquet file.
+
+    Only the row group containing the most recently accessed document is
+    held in memory, and iteration reads the file in record batches, so
+    memory use is proportional to the row group or batch size rather than
+    the size of the corpus."""
+
+    # ====================
+    def __init__(self,
+                 path: str,
+                 column: str,
+                 start: int = 0,
+                 stop: int = None,
+                 batch_size: int = 10000):
+        """Initializes an instance of ParquetCorpus.
+
+        Args:
+          path (str):
+            The path to the Parquet file.
+          column (str):
+            The column containing the documents.
+          start (int, optional):
+            The first row to use. Defaults to 0.
+          stop (int, optional):
+            The row to stop before. If None, use all rows from start.
+            Defaults to None.
+          batch_size (int, optional):
+            The number of rows to read at a time when iterating over the
+            corpus. Defaults to 10000.
+        """
+
+        if pq is None:
+            raise ImportError(ERROR_NO_PYARROW)
+        self.path = path
+        self.column = column
+        self.batch_size = batch_size
+        self.open()
+        num_rows = self.file.metadata.num_rows
+        self.start, self.stop, _ = slice(start, stop).indices(num_rows)
+        self.stop = max(self.stop, self.start)
+        metadata = self.file.metadata
+        self.row_group_starts = np.cumsum(
+            [0] + [metadata.row_group(i).num_rows
+                   for i in range(metadata.num_row_groups - 1)],
+            dtype=np.int64)
+
+    # ====================
+    def open(self):
+        """Open the Parquet file and clear the row group cache."""
+
+        self.file = pq.ParquetFile(self.path)
+        self.cached_row_group = None
+        self.cached_docs = None
+
+    # ====================
+    def __getstate__(self) -> dict:
+
+        state = self.__dict__.copy()
+        for key in ['file', 'cached_row_group', 'cached_docs']:
+            del state[key]
+        return state
+
+    # ====================
+    def __setstate__(self, state: dict):
+
+        self.__dict__.update(state)
+        self.open()
+
+    # ====================
+    def __len__(self) -> int:
+
+        return self.stop - self.start
+
+    # ====================
+    def get_doc(self, doc_idx: int) -> str:
+
+        row = self.start + doc_idx
+        row_group = int(np.searchsorted(
+            self.row_group_starts, row, side='right')) - 1
+        if row_group != self.cached_row_group:
+            self.cached_docs = self.file.read_row_group(
+                row_group, columns=[self.column]).column(0)
+            self.cached_row_group = row_group
+        doc = self.cached_docs[
+            row - int(self.row_group_starts[row_group])].as_py()
+        return '' if doc is None else doc
+
+    # ====================
+    def __iter__(self) -> Iterator[str]:
+
+        for batch in self.iter_arrow_batches():
+            for doc in batch.to_pylist():
+                yield '' if doc is None else doc
+
+    # ====================
+    def doc_lengths(self) -> np.ndarray:
+        """Get the length of every document in characters, reading the
+        file in record batches without converting documents to Python
+        strings."""
+
+        lengths = [arrow_lengths(b) for b in self.iter_arrow_batches()]
+        return np.concatenate(lengths) if lengths \
+            else np.zeros(0, dtype=np.int64)
+
+    # ====================
+    def iter_arrow_batches(self) -> Iterator['pa.Array']:
+        """Read the rows of the corpus from the file in Arrow arrays of
+        up to batch_size documents."""
+
+        first = int(np.searchsorted(
+            self.row_group_starts, self.start, side='right')) - 1
+        last = int(np.searchsorted(
+            self.row_group_starts, self.stop - 1, side='right')) - 1
+        if len(self) == 0:
+            return
+        row = int(self.row_group_starts[first])
+        batches = self.file.iter_batches(
+            batch_size=self.batch_size,
+            row_groups=list(range(first, last + 1)),
+            columns=[self.column]
+        )
+        for batch in batches:
+            batch_start = row
+            row += batch.num_rows
+            if row <= self.start:
+                continue
+            yield batch.column(0).slice(
+                max(self.start - batch_start, 0),
+                self.stop - max(self.start, batch_start))
+            if row >= self.stop:
+                return
+
+
+# ====================
+class TextFileCorpus(Corpus):
+    """A corpus backed by a plain text file with one document per line.
+
+    The file is memory-mapped, and the byte offset of the start of every
+    line is stored in an index that is saved alongside the file, so that
+    any document can be read without reading the rest of the file, and
+    the file only needs to be scanned once. If the index cannot be saved,
+    it is kept in memory (and pickled with the corpus) instead.
+
+    Call close (or use the corpus as a context manager) to release the
+    file and memory map."""
+
+    # ====================
+    def __init__(self,
+                 path: str,
+                 start: int = 0,
+                 stop: int = None,
+                 index_path: str = None,
+                 rebuild_index: bool = False,
+                 encoding: str = 'utf-8'):
+        """Initializes an instance of TextFileCorpus.
+
+        Args:
+          path (str):
+            The path to the text file.
+          start (int, optional):
+            The first line to use. Defaults to 0.
+          stop (int, optional):
+            The line to stop before. If None, use all lines from start.
+            Defaults to None.
+          index_path (str, optional):
+            The path to save the line offset index to (or load it from),
+            used exactly as given. If None, path + '.lineidx.npz' is used.
+            Defaults to None.
+          rebuild_index (bool, optional):
+            Whether or not to rebuild the index even if a saved index
+            matching the size and modification time of the file exists.
+            Defaults to False.
+          encoding (str, optional):
+            The encoding of the file. Defaults to 'utf-8'.
+        """
+
+        self.path = path
+        self.index_path = \
+            index_path if index_path is not None else path + '.lineidx.npz'
+        self.encoding = encoding
+        self.open()
+        self.line_starts = self.load_index(rebuild_index)
+        num_lines = len(self.line_starts) - 1
+        self.start, self.stop, _ = slice(start, stop).indices(num_lines)
+        self.stop = max(self.stop, self.start)
+
+    # ====================
+    def open(self):
+        """Memory-map the file."""
+
+        self.file = open(self.path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        # Empty files cannot be memory-mapped
+        self.mmap = mmap.mmap(
+            self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    # ====================
+    def file_stats(self) -> np.ndarray:
+        """Get the size and modification time of the file, which are
+        saved with the index to detect stale indexes."""
+
+        stat = os.stat(self.path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    # ====================
+    def close(self):
+        """Close the memory map and the file."""
+
+        if isinstance(self.mmap, mmap.mmap):
+            self.mmap.close()
+        self.file.close()
+
+    # ====================
+    def __enter__(self) -> 'TextFileCorpus':
+
+        return self
+
+    # ====================
+    def __exit__(self, *args):
+
+        self.close()
+
+    # ====================
+    def load_index(self, rebuild_index: bool) -> np.ndarray:
+        """Load the line offset index if a saved index matches the file,
+        or otherwise build and save it.
+
+        The index is written through an open file handle so that numpy
+        does not add a .npz suffix to custom index paths. If it cannot be
+        written, it is kept in memory."""
+
+        self.index_stats = self.file_stats()
+        self.index_saved = True
+        if not rebuild_index and os.path.exists(self.index_path):
+            with np.load(self.index_path) as index:
+                if np.array_equal(index['stats'], self.index_stats):
+                    return index['line_starts']
+        print(MESSAGE_BUILDING_INDEX.format(path=self.path))
+        line_starts = line_offsets(self.mmap)
+        try:
+            with open(self.index_path, 'wb') as f:
+                np.savez(f, line_starts=line_starts, stats=self.index_stats)
+        except OSError as e:
+            print(MESSAGE_INDEX_NOT_SAVED.format(
+                index_path=self.index_path, error=e))
+            self.index_saved = False
+        return line_starts
+
+    # ====================
+    def __getstate__(self) -> dict:
+
+        state = self.__dict__.copy()
+        del state['file']
+        del state['mmap']
+        if self.index_saved:
+            del state['line_starts']
+        return state
+
+    # ====================
+    def __setstate__(self, state: dict):
+
+        self.__dict__.update(state)
+        if not np.array_equal(self.index_stats, self.file_stats()):
+            raise ValueError(ERROR_INDEX_STALE.format(
+                index_path=self.index_path, path=self.path))
+        if self.index_saved:
+            with np.load(self.index_path) as index:
+                if not np.array_equal(index['stats'], self.index_stats):
+                    raise ValueError(ERROR_INDEX_STALE.format(
+                        index_path=self.index_path, path=self.path))
+                self.line_starts = index['line_starts']
+        self.open()
+
+    # ====================
+    def __len__(self) -> int:
+
+        return self.stop - self.start
+
+    # ====================
+    def get_doc(self, doc_idx: int) -> str:
+
+        line = self.start + doc_idx
+        line_bytes = self.mmap[
+            self.line_starts[line]:self.line_starts[line + 1]]
+        return line_bytes.rstrip(b'\r\n').decode(self.encoding)
+
+    # ====================
+    def doc_lengths(self) -> np.ndarray:
+        """Get the length of every document in bytes (including line
+        breaks) from the line index, without reading the documents."""
+
+        return np.diff(self.line_starts[self.start:self.stop + 1])
+
+    # ====================
+    def shard(self, num_shards: int, shard_idx: int) -> 'TextFileCorpus':
+        """Get a TextFileCorpus for one of num_shards contiguous ranges of
+        lines of approximately equal size, which shares the index of this
+        corpus.
+
+        Args:
+          num_shards (int):
+            The number of shards to split the corpus into.
+          shard_idx (int):
+            The index of the shard to get.
+
+        Returns:
+          TextFileCorpus:
+            The shard.
+        """
+
+        bounds = np.linspace(
+            self.start, self.stop, num_shards + 1).astype(np.int64)
+        shard = self.__class__.__new__(self.__class__)
+        shard.__dict__.update(self.__getstate__())
+        shard.open()
+        shard.line_starts = self.line_starts
+        shard.start = int(bounds[shard_idx])
+        shard.stop = int(bounds[shard_idx + 1])
+        return shard
+
+
+# ====================
+def line_offsets(buffer) -> np.ndarray:
+    """Get the byte offsets of the starts of all lines in a buffer, plus
+    the offset of the end of the buffer.
+
+    The buffer is scanned for line feeds in chunks of INDEX_CHUNK_SIZE
+    bytes with NumPy, so that memory use is bounded for very large files.
+    A final line without a trailing line feed is included."""
+
+    size = len(buffer)
+    ends = []
+    for chunk_start in range(0, size, INDEX_CHUNK_SIZE):
+        chunk = np.frombuffer(
+            buffer, dtype=np.uint8,
+            count=min(INDEX_CHUNK_SIZE, size - chunk_start),
+            offset=chunk_start)
+        ends.append(np.flatnonzero(chunk == ord('\n')) + chunk_start + 1)
+    line_ends = np.concatenate(ends) if ends else np.zeros(0, np.int64)
+    if size > 0 and (len(line_ends) == 0 or line_ends[-1] != size):
+        line_ends = np.append(line_ends, size)
+    return np.concatenate([[0], line_ends]).astype(np.int64)
+
+
+# ====================
+def arrow_lengths(array) -> np.ndarray:
+    """Get the length in characters of every string in an Arrow array,
+    with null strings counted as empty."""
+
+    lengths = pc.fill_null(pc.utf8_length(array), 0)
+    return np.asarray(lengths.to_numpy(), dtype=np.int64)
+
+
+# ====================
+def doc_lengths(docs) -> np.ndarray:
+    """Get the length of every document in a list or Corpus."""
+
+    if isinstance(docs, Corpus):
+        return docs.doc_lengths()
+    return np.fromiter(
+        (len(doc) for doc in docs), dtype=np.int64, count=len(docs))
+
+
+# ====================
+def doc_sizes(reference, hypothesis) -> np.ndarray:
+    """Get the size of every document as the total length of its
+    reference and hypothesis versions, for weighting progress and
+    scheduling by the amount of text to be processed rather than by the
+    number of documents.
+
+    Lengths are in characters, or in bytes for corpora that measure
+    documents without reading them (e.g. TextFileCorpus)."""
+
+    return doc_lengths(reference) + doc_lengths(hypothesis)
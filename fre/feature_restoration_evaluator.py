@@ -1,20 +1,50 @@
-from fre.char_level_metrics import (get_cms, prfs_all_features, show_cms,
+from fre.char_level_metrics import (get_parsed_doc_counts,
+                                    prfs_all_features, show_class_cm,
+                                    show_cms, show_error_rates_table,
                                     show_prfs)
-from fre.misc import (CAPS, Int_or_Str, Str_or_List, Str_or_List_or_Series,
-                      get_tqdm, load_pickle, save_pickle,
+from fre.corpus import doc_sizes
+from fre.feature_set import FeatureSet
+from fre.grapheme_cache import GraphemeCache
+from fre.html_report import DEFAULT_CHARS_PER_PAGE, write_html_report_
+from fre.misc import (CASE_FEATURES, Int_or_Str, Str_or_List,
+                      Str_or_List_or_Series, display_or_print,
+                      get_capitalization, get_case_features,
+                      load_pickle, save_pickle, size_progress,
                       str_or_list_or_series_to_list)
+from fre.parallel import WorkerPool
+from fre.partial_results import PartialResults
+from fre.position_profile import PositionProfile
+from fre.prf import AVERAGES
+from fre.result_store import NOT_SCORED, PRF_COLUMNS, ResultStore
+from fre.sampling import SampleEstimate, estimate_metrics
+from fre.spill_store import SpillStore
+from fre.system_diff import SystemDiff
 from fre.text_display import show_feature_errors_, show_text_display_
-from fre.word_error_rate import show_wer_info_table, wer, wer_info
+from fre.triage import Triage
+from fre.word_error_rate import show_wer_info_table, wer_info
 
-from typing import List
+from typing import Callable, List, Union
 
-tqdm_ = get_tqdm()
+import numpy as np
+import pandas as pd
 
 # Messages
 MESSAGE_CALCULATING_ALL_WERS = """Calculating word error rates for all \
 documents..."""
 MESSAGE_GETTING_ALL_CMS = "Getting confusion matrices for all documents..."
 MESSAGE_INIT_COMPLETE = "Initialisation complete."
+ERROR_CLASS_FEATURES = """
+Class features must all be feature characters."""
+MESSAGE_NO_SKIPPED_SPANS = "No skipped spans."
+MESSAGE_DOC_SKIPPED = """Document {doc_idx} was skipped because its base \
+characters differ from the reference."""
+ERROR_ALIGNMENT_MODE = """
+Alignment info is only available when alignment is set to True."""
+# Shares of memory_budget for per-document results, cached grapheme ids,
+# and alignment info
+RESULTS_BUDGET_SHARE = 0.5
+GRAPHEME_BUDGET_SHARE = 0.4
+ALIGNMENT_BUDGET_SHARE = 0.1
 
 
 # ====================
@@ -24,25 +54,43 @@ class FeatureRestorationEvaluator:
     def __init__(self,
                  reference: Str_or_List_or_Series,
                  hypothesis: Str_or_List_or_Series,
-                 capitalization: bool,
+                 capitalization: Union[bool, str],
                  feature_chars: Str_or_List,
                  get_cms_on_init: bool = True,
-                 get_wer_info_on_init: bool = True):
+                 get_wer_info_on_init: bool = True,
+                 alignment: bool = False,
+                 word_level: bool = False,
+                 class_features: Str_or_List = None,
+                 language: str = None,
+                 cache_graphemes: bool = None,
+                 memory_budget: int = None,
+                 spill_dir: str = None):
         """Initializes an instance of FeatureRestorationEvaluator.
 
         Args:
           reference (Str_or_List_or_Series):
             Either a single string, or a list or pandas.Series object of
-            strings ('documents') to use as the reference corpus.
+            strings ('documents') to use as the reference corpus. A
+            pyarrow array of strings or a Corpus object (e.g.
+            fre.corpus.ParquetCorpus) can also be passed, in which case
+            documents are read one at a time as they are needed.
           hypothesis (Str_or_List_or_Series):
             Either a single string, or a list or pandas.Series object of
-            strings ('documents') to use as the hypothesis corpus.
-            (Number of documents must be the same as reference.)
-          capitalization (bool):
+            strings ('documents') to use as the hypothesis corpus, or a
+            pyarrow array or Corpus object. (Number of documents must be
+            the same as reference.)
+          capitalization (Union[bool, str]):
             Whether or not to treat capitalization as a feature to be assessed.
+            If 'word', word-initial capitalization (CAPS_INITIAL) and
+            all-caps tokens (CAPS_ALL) are assessed as separate features
+            instead of upper case characters (CAPS).
           feature_chars (Str_or_List):
             A string or list of characters containing other characters to treat
-            as features (e.g. '., ' for periods, commas, and spaces.)
+            as features (e.g. '., ' for periods, commas, and spaces.) Lists
+            may also contain multi-character marks (e.g. '...' or '?!') and
+            FeatureClass objects that match any one of a class of
+            characters (e.g. fre.feature_set.DASHES for any Unicode
+            dash).
           get_cms_on_init (bool, optional):
             Whether or not to get confusion matrices for all
             reference/hypothesis documents on intiialization. Set to False to
@@ -54,10 +102,62 @@ class FeatureRestorationEvaluator:
             documents on initialization. Set to False to save time if you do
             not need WER information or only need WER information for a subset
             of documents. Defaults to True.
+          alignment (bool, optional):
+            Whether or not to align the base (non-feature) characters of
+            reference and hypothesis documents before scoring. If False,
+            documents whose base characters differ are skipped. If True,
+            features are scored in the regions that can be aligned, and
+            the skipped spans and coverage statistics for each document are
+            stored. Defaults to False.
+          word_level (bool, optional):
+            Whether or not to also get word-level confusion matrices, in
+            which a feature is counted once for each word (as delimited by
+            spaces in the reference) that it appears in. Word-level
+            confusion matrices are derived from the same per-position
+            feature codes as character-level ones. Defaults to False.
+          class_features (Str_or_List, optional):
+            A string or list of feature characters to get multi-class
+            confusion matrices for, showing which feature was predicted in
+            place of which (e.g. commas in place of periods). If None, all
+            feature characters other than whitespace are used. Defaults to
+            None.
+          language (str, optional):
+            An ISO 639-1 language code (e.g. 'tr') used to select
+            language-specific case folding rules when comparing reference
+            and hypothesis characters. If None, default Unicode case
+            folding is used. Defaults to None.
+          cache_graphemes (bool, optional):
+            Whether or not to keep each document as an array of grapheme
+            ids after it is first parsed, so that documents can be scored
+            again under a different feature set (see change_features)
+            without being read or segmented again. Uses two or four bytes
+            per grapheme for each of the reference and hypothesis, which
+            is only bounded if memory_budget is set. If None, graphemes
+            are cached only when memory_budget is set, so that corpora
+            read on demand (e.g. fre.corpus.TextFileCorpus) are not copied
+            into memory. Defaults to None.
+          memory_budget (int, optional):
+            An approximate limit in bytes on the memory used for
+            per-document results, cached grapheme ids, and alignment info.
+            If the per-document results arrays would take more than half
+            of the budget, they are kept in memory-mapped temporary files.
+            Cached grapheme ids and alignment info for the most recently
+            used documents are kept in memory, and those for other
+            documents are spilled to temporary files and read back in
+            when they are needed. Corpus totals and per-document results
+            are available as usual. To keep the corpora themselves out of
+            memory, pass Corpus objects (e.g. fre.corpus.TextFileCorpus).
+            If None, everything is kept in memory. Defaults to None.
+          spill_dir (str, optional):
+            The directory to create temporary files in when memory_budget
+            is set. If None, the default temporary directory is used.
+            Defaults to None.
 
         Raises:
           ValueError:
             Hypothesis and reference lists must have equal length.
+          ValueError:
+            Class features must all be feature characters.
         """
 
         self.reference = str_or_list_or_series_to_list(reference)
@@ -67,9 +167,24 @@ class FeatureRestorationEvaluator:
                 "Hypothesis and reference lists must have equal length."
             )
         self.feature_chars = list(feature_chars)
+        self.language = language
         self.set_features(capitalization)
-        self.wer_info = {}
-        self.cms = {}
+        self.set_class_features(class_features)
+        self.alignment = alignment
+        self.word_level = word_level
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.sizes = None
+        self.results = self.new_result_store(
+            ['char', 'word'] if word_level else ['char'])
+        self.alignment_info = self.new_doc_store(ALIGNMENT_BUDGET_SHARE)
+        if cache_graphemes is None:
+            cache_graphemes = memory_budget is not None
+        if cache_graphemes:
+            self.grapheme_cache = GraphemeCache(
+                self.new_doc_store(GRAPHEME_BUDGET_SHARE))
+        else:
+            self.grapheme_cache = None
         if get_wer_info_on_init:
             self.get_wer_info_all()
         if get_cms_on_init:
@@ -91,8 +206,61 @@ class FeatureRestorationEvaluator:
         self = cls.__new__(cls)
         data = load_pickle(load_path)
         self.__dict__.update(data)
+        if 'results' not in data:
+            self.upgrade_old_state()
         return self
 
+    # ====================
+    def upgrade_old_state(self):
+        """Convert the attributes of an evaluator pickled by an earlier
+        version, which kept results in cms and wer_info dictionaries, to
+        those of the current version."""
+
+        cms = self.__dict__.pop('cms', {})
+        wer_info_ = self.__dict__.pop('wer_info', {})
+        self.language = None
+        self.set_features(get_capitalization(self.features))
+        self.set_class_features(None)
+        self.alignment = False
+        self.word_level = False
+        self.memory_budget = None
+        self.spill_dir = None
+        self.sizes = None
+        self.results = ResultStore.from_dicts(
+            len(self.reference), self.features, cms, wer_info_)
+        self.alignment_info = {}
+        self.grapheme_cache = None
+
+    # ====================
+    @property
+    def cms(self) -> dict:
+        """Confusion matrices for each document that has been scored (None
+        for skipped documents) and summed over all documents ('all'), as
+        dictionaries mapping each feature and 'all' to a confusion matrix.
+        Read-only: computed from the result store."""
+
+        cms = {
+            int(doc_idx): self.results[int(doc_idx)]
+            for doc_idx in np.flatnonzero(self.results.status != NOT_SCORED)
+        }
+        cms['all'] = self.results['all']
+        return cms
+
+    # ====================
+    @property
+    def wer_info(self) -> dict:
+        """Reference length, minimum number of edits, and word error rate
+        for each document with WER info and summed over all documents
+        ('all'). Read-only: computed from the result store."""
+
+        wer_info_ = {
+            int(doc_idx): self.results.get_wer_info(int(doc_idx))
+            for doc_idx in np.flatnonzero(self.results.wer_status)
+        }
+        if wer_info_:
+            wer_info_['all'] = self.results.get_wer_info('all')
+        return wer_info_
+
     # ====================
     def to_pickle(self, save_path: str):
         """Save the attributes of the current class instance to a pickle file.
@@ -106,19 +274,113 @@ class FeatureRestorationEvaluator:
         save_pickle(data, save_path)
 
     # ====================
-    def set_features(self, capitalization: bool):
-        """Set self.features attribute
+    def set_features(self, capitalization: Union[bool, str]):
+        """Set self.features and self.feature_set attributes
 
         Args:
-          capitalization (bool):
-            If True, add CAPS to the list of feature_chars.
+          capitalization (Union[bool, str]):
+            If True, add CAPS to the list of feature_chars. If 'word', add
+            CAPS_INITIAL and CAPS_ALL.
         """
 
-        if capitalization:
-            self.features = \
-                [CAPS] + self.feature_chars.copy()
+        self.feature_set = FeatureSet(
+            get_case_features(capitalization) + self.feature_chars.copy(),
+            self.language)
+        self.features = self.feature_set.features
+
+    # ====================
+    def new_result_store(self, granularities: List[str]) -> ResultStore:
+        """Get an empty ResultStore for the current features, moved to disk
+        if it would take more than its share of the memory budget."""
+
+        results = ResultStore(
+            len(self.reference), self.features, granularities,
+            self.class_features)
+        memory_budget = getattr(self, 'memory_budget', None)
+        if memory_budget is not None \
+                and results.nbytes() > memory_budget * RESULTS_BUDGET_SHARE:
+            results.move_to_disk(self.spill_dir)
+        return results
+
+    # ====================
+    def new_doc_store(self, budget_share: float) -> dict:
+        """Get an empty store for per-document details: a SpillStore with a
+        share of the memory budget, or a dictionary if there is no
+        budget."""
+
+        memory_budget = getattr(self, 'memory_budget', None)
+        if memory_budget is None:
+            return {}
+        return SpillStore(int(memory_budget * budget_share), self.spill_dir)
+
+    # ====================
+    def set_class_features(self, class_features: Str_or_List = None):
+        """Set self.class_features, checking that they are all feature
+        characters.
+
+        Args:
+          class_features (Str_or_List, optional):
+            The features to get multi-class confusion matrices for. If
+            None, all feature characters other than whitespace are used.
+            Defaults to None.
+
+        Raises:
+          ValueError:
+            Class features must all be feature characters.
+        """
+
+        feature_names = [f for f in self.features if f not in CASE_FEATURES]
+        if class_features is None:
+            self.class_features = \
+                [f for f in feature_names if not f.isspace()]
         else:
-            self.features = self.feature_chars.copy()
+            self.class_features = list(class_features)
+            if not set(self.class_features) <= set(feature_names):
+                raise ValueError(ERROR_CLASS_FEATURES)
+
+    # ====================
+    def change_features(self,
+                        feature_chars: Str_or_List = None,
+                        capitalization: Union[bool, str] = None,
+                        class_features: Str_or_List = None,
+                        get_cms: bool = True):
+        """Change the features that are assessed and score the corpus
+        again.
+
+        Word error rates do not depend on the features, so they are kept.
+        All other results are discarded. Documents in the grapheme cache
+        are scored by projecting their cached grapheme ids onto the new
+        feature set, without reading or segmenting them again.
+
+        Args:
+          feature_chars (Str_or_List, optional):
+            The new feature characters (see __init__). If None, the
+            current feature characters are kept. Defaults to None.
+          capitalization (Union[bool, str], optional):
+            The new capitalization setting (see __init__). If None, the
+            current setting is kept. Defaults to None.
+          class_features (Str_or_List, optional):
+            Features to get multi-class confusion matrices for. If None,
+            all feature characters other than whitespace are used.
+            Defaults to None.
+          get_cms (bool, optional):
+            Whether or not to get confusion matrices for all documents
+            straight away. Defaults to True.
+        """
+
+        if feature_chars is not None:
+            self.feature_chars = list(feature_chars)
+        if capitalization is None:
+            capitalization = get_capitalization(self.features)
+        self.set_features(capitalization)
+        self.set_class_features(class_features)
+        old_results = self.results
+        self.results = self.new_result_store(old_results.granularities)
+        self.results.wer_counts[:] = old_results.wer_counts
+        self.results.wer_status[:] = old_results.wer_status
+        self.alignment_info = self.new_doc_store(ALIGNMENT_BUDGET_SHARE)
+        if get_cms:
+            self.get_cms_all()
 
     # === WORD ERROR RATE ===
 
@@ -139,7 +401,7 @@ class FeatureRestorationEvaluator:
         """
 
         self.get_wer_info(doc_idx)
-        wer_info = self.wer_info[doc_idx]
+        wer_info = self.results.get_wer_info(doc_idx)
         if for_latex is True:
             print(rf"\textbf{{WER:}} {wer_info['wer']:.2f}\%\\")
         else:
@@ -159,25 +421,12 @@ class FeatureRestorationEvaluator:
         error rate for all documents.
         """
 
-        # Get WER info for each document
+        # Get WER info for each document. Overall WER info is summed from
+        # the result store when requested.
         print(MESSAGE_CALCULATING_ALL_WERS)
-        for doc_idx in tqdm_(range(len(self.hypothesis))):
-            if doc_idx not in self.wer_info:
-                self.get_wer_info_doc(doc_idx)
-        # Get overall WER info
-        all_doc_idxs = range(len(self.reference))
-        len_ref_all = sum([
-            self.wer_info[doc_idx]['len_ref'] for doc_idx in all_doc_idxs
-        ])
-        num_edits_all = sum([
-            self.wer_info[doc_idx]['num_edits'] for doc_idx in all_doc_idxs
-        ])
-        wer_all = wer(num_edits_all, len_ref_all)
-        self.wer_info['all'] = {
-            'len_ref': len_ref_all,
-            'num_edits': num_edits_all,
-            'wer': wer_all
-        }
+        self.process_by_size(
+            np.flatnonzero(~self.results.wer_status),
+            self.get_wer_info_doc)
 
     # ====================
     def get_wer_info_doc(self, doc_idx: int):
@@ -188,14 +437,63 @@ class FeatureRestorationEvaluator:
         ref = self.reference[doc_idx].strip()
         hyp = self.hypothesis[doc_idx].strip()
         wer_info_ = wer_info(ref, hyp)
-        self.wer_info[doc_idx] = wer_info_
+        self.results.set_wer(
+            doc_idx, wer_info_['len_ref'], wer_info_['num_edits'])
+
+    # === CHARACTER AND FEATURE ERROR RATES ===
+
+    # ====================
+    def show_error_rates(self,
+                         doc_idx: Int_or_Str = 'all',
+                         for_latex: bool = False):
+        """Show reference lengths, numbers of edits, character error rate
+        (CER), and feature error rate (FER) for either a single document or
+        all documents.
+
+        Both error rates are calculated from the same feature codes as the
+        confusion matrices, so no additional edit distance calculation is
+        needed. CER counts edits of graphemes (base characters and
+        features), and FER counts insertions, deletions, and substitutions
+        of features only.
+
+        Args:
+          doc_idx (Int_or_Str, optional):
+            Either an integer indicating the index of a document, or 'all'
+            to show error rates for all documents in the corpus. Defaults
+            to 'all'.
+          for_latex (bool, optional):
+            Whether or not to format the output for LaTeX. Defaults to False.
+        """
+
+        self.get_cms(doc_idx)
+        error_rate_info = self.results.get_error_rate_info(doc_idx)
+        if error_rate_info is None:
+            print(MESSAGE_DOC_SKIPPED.format(doc_idx=doc_idx))
+            return
+        show_error_rates_table(error_rate_info, for_latex)
+
+    # ====================
+    def get_error_rates(self, doc_idx: Int_or_Str = 'all') -> dict:
+        """Get reference lengths, numbers of edits, and error rates for CER
+        and FER, for either a single document or all documents.
+
+        Returns:
+          dict:
+            A dictionary with keys 'CER' and 'FER', or None if the document
+            was skipped.
+        """
+
+        self.get_cms(doc_idx)
+        return self.results.get_error_rate_info(doc_idx)
 
     # === CONFUSION MATRICES ===
 
     # ====================
     def show_confusion_matrices(self,
                                 doc_idx: Int_or_Str = 'all',
-                                features_to_show: List[str] = None):
+                                features_to_show: List[str] = None,
+                                granularity: str = 'char',
+                                show_classes: bool = False):
         """Show confusion matrices for each feature, for either a
         single document or all documents.
 
@@ -207,11 +505,45 @@ class FeatureRestorationEvaluator:
           features_to_show (List[str]):
             Features to show confusion matrices for. If None, show
             confusion matrics for all features. Defaults to None.
+          granularity (str, optional):
+            Either 'char' for character-level confusion matrices, or
+            'word' for word-level confusion matrices (only available if
+            word_level was set to True on initialization). Defaults to
+            'char'.
+          show_classes (bool, optional):
+            Whether or not to also show the multi-class confusion matrix
+            over class features. Defaults to False.
+        """
+
+        self.get_cms(doc_idx)
+        cms = self.results.get_cms(doc_idx, granularity)
+        if show_classes is True:
+            show_cms(cms, features_to_show,
+                     self.results.get_class_cm(doc_idx), self.class_features)
+        else:
+            show_cms(cms, features_to_show)
+
+    # ====================
+    def show_class_confusion_matrix(self,
+                                    doc_idx: Int_or_Str = 'all',
+                                    for_latex: bool = False):
+        """Show a multi-class confusion matrix over class features,
+        showing which feature was predicted in place of which, for either a
+        single document or all documents.
+
+        Args:
+          doc_idx (Int_or_Str, optional):
+            Either an integer indicating the index of the document to
+            show the confusion matrix for, or 'all' to show the confusion
+            matrix for all documents in the corpus. Defaults to 'all'.
+          for_latex (bool, optional):
+            Whether or not to format the output for LaTeX.
+            Defaults to False.
         """
 
         self.get_cms(doc_idx)
-        cms = self.cms[doc_idx]
-        show_cms(cms, features_to_show)
+        class_cm = self.results.get_class_cm(doc_idx)
+        show_class_cm(class_cm, self.class_features, for_latex)
 
     # ====================
     def get_cms(self, scope: Int_or_Str):
@@ -222,23 +554,53 @@ class FeatureRestorationEvaluator:
             self.get_cms_doc(scope)
 
     # ====================
-    def get_cms_all(self):
+    def get_cms_all(self, pool: WorkerPool = None):
         """Get confusion matrices for all documents.
+
+        Args:
+          pool (WorkerPool, optional):
+            A fre.parallel.WorkerPool to get confusion matrices for
+            documents in parallel. The same pool can be reused for
+            multiple evaluators. If None, documents are processed in the
+            current process. Defaults to None.
         """
 
-        # Get confusion matrices for each document
+        if pool is not None:
+            pool.score(self)
+            return
+        # Get confusion matrices for each document. Overall confusion
+        # matrices are summed from the result store when requested.
         print(MESSAGE_GETTING_ALL_CMS)
-        for doc_idx in tqdm_(range(len(self.hypothesis))):
-            if doc_idx not in self.cms:
-                self.get_cms_doc(doc_idx)
-        all_docs = {}
-        # Get overall confusion matrices
-        for f in self.features + ['all']:
-            all_docs[f] = \
-                sum([self.cms[doc_idx][f]
-                    for doc_idx in range(len(self.reference))
-                    if self.cms[doc_idx] is not None])
-        self.cms['all'] = all_docs
+        self.process_by_size(
+            np.flatnonzero(self.results.status == NOT_SCORED),
+            self.get_cms_doc)
+
+    # ====================
+    def process_by_size(self, doc_idxs: np.ndarray, func: Callable):
+        """Call a function for each of a number of documents in order,
+        showing progress, throughput, and time remaining in characters
+        rather than documents."""
+
+        if len(doc_idxs) == 0:
+            return
+        sizes = self.get_doc_sizes()[doc_idxs]
+        with size_progress(sizes.sum()) as progress:
+            for doc_idx, size in zip(doc_idxs.tolist(), sizes.tolist()):
+                func(doc_idx)
+                progress.update(size)
+
+    # ====================
+    def get_doc_sizes(self) -> np.ndarray:
+        """Get the size of every document (see fre.corpus.doc_sizes).
+
+        Sizes are computed once per evaluator, because getting them can
+        mean reading every document of a corpus."""
+
+        # Evaluators pickled before sizes were cached have no sizes
+        # attribute
+        if getattr(self, 'sizes', None) is None:
+            self.sizes = doc_sizes(self.reference, self.hypothesis)
+        return self.sizes
 
     # ====================
     def get_cms_doc(self, doc_idx: int):
@@ -247,26 +609,130 @@ class FeatureRestorationEvaluator:
         Args:
           doc_idx (int): The index of the document to get
           confusion matrics for.
+        """
+
+        parsed_ref, parsed_hyp = self.parse_doc(doc_idx, case_info=True)
+        counts, alignment_info = get_parsed_doc_counts(
+            parsed_ref,
+            parsed_hyp,
+            self.feature_set,
+            doc_idx,
+            word_level=self.word_level,
+            alignment=self.alignment,
+            class_features=self.class_features
+        )
+        if alignment_info is not None:
+            self.alignment_info[doc_idx] = alignment_info
+        self.results.set_doc(doc_idx, counts)
+
+    # ====================
+    def parse_doc(self, doc_idx: int, case_info: bool = False) -> tuple:
+        """Parse the reference and hypothesis versions of a document with
+        the current feature set, using the grapheme cache if there is one.
+
+        Args:
+          doc_idx (int):
+            The index of the document.
+          case_info (bool, optional):
+            Whether or not to also return case classes and alphanumeric
+            flags (see FeatureSet.parse). Defaults to False.
 
         Returns:
-          dict:
-            A dictionary containing the confusion matrices.
+          tuple:
+            The case-folded base characters and feature codes of the
+            reference and hypothesis documents (see FeatureSet.parse).
         """
 
-        cm_doc = get_cms(
-            self.reference[doc_idx].strip(),
-            self.hypothesis[doc_idx].strip(),
-            self.features,
-            doc_idx
-        )
-        self.cms[doc_idx] = cm_doc
+        # Evaluators pickled before the grapheme cache was added have no
+        # grapheme_cache attribute
+        cache = getattr(self, 'grapheme_cache', None)
+        if cache is None:
+            return (
+                self.feature_set.parse(
+                    self.reference[doc_idx].strip(), case_info),
+                self.feature_set.parse(
+                    self.hypothesis[doc_idx].strip(), case_info)
+            )
+        if doc_idx not in cache:
+            cache.add(doc_idx, self.reference[doc_idx].strip(),
+                      self.hypothesis[doc_idx].strip())
+        return cache.parse(doc_idx, self.feature_set, case_info)
+
+    # === ALIGNMENT ===
+
+    # ====================
+    def show_alignment_info(self, doc_idx: Int_or_Str = 'all'):
+        """Show alignment coverage statistics for each document, or the
+        skipped spans for a single document.
+
+        Only available when the evaluator was initialized with
+        alignment=True.
+
+        Args:
+          doc_idx (Int_or_Str, optional):
+            Either an integer indicating the index of the document to
+            show coverage statistics and skipped spans for, or 'all' to
+            show coverage statistics for all documents in the corpus.
+            Defaults to 'all'.
+        """
+
+        if self.alignment is not True:
+            raise ValueError(ERROR_ALIGNMENT_MODE)
+        self.get_cms(doc_idx)
+        if doc_idx == 'all':
+            display_or_print(self.get_coverage_df())
+        else:
+            alignment_info = self.alignment_info[doc_idx]
+            display_or_print(pd.DataFrame(
+                [{k: v for k, v in alignment_info.items()
+                  if k != 'skipped_spans'}],
+                index=[doc_idx]
+            ))
+            print()
+            if alignment_info['skipped_spans']:
+                display_or_print(
+                    pd.DataFrame(alignment_info['skipped_spans']))
+            else:
+                print(MESSAGE_NO_SKIPPED_SPANS)
+
+    # ====================
+    def get_coverage_df(self) -> pd.DataFrame:
+        """Get a dataframe of alignment coverage statistics for all
+        documents, with totals for the corpus in the final row.
+
+        Returns:
+          pd.DataFrame:
+            The coverage statistics, indexed by document index.
+        """
+
+        if self.alignment is not True:
+            raise ValueError(ERROR_ALIGNMENT_MODE)
+        self.get_cms_all()
+        rows = {
+            doc_idx: {
+                'aligned_chars': info['aligned_chars'],
+                'ref_chars': info['ref_chars'],
+                'hyp_chars': info['hyp_chars'],
+                'num_skipped_spans': len(info['skipped_spans'])
+            }
+            for doc_idx, info in sorted(self.alignment_info.items())
+        }
+        coverage_df = pd.DataFrame.from_dict(rows, orient='index')
+        coverage_df.loc['all'] = coverage_df.sum()
+        coverage_df['ref_coverage'] = \
+            coverage_df['aligned_chars'] / coverage_df['ref_chars']
+        coverage_df['hyp_coverage'] = \
+            coverage_df['aligned_chars'] / coverage_df['hyp_chars']
+        return coverage_df
 
     # === PRECISON, RECALL, AND F-SCORE ===
 
     # ====================
     def show_prfs(self,
                   doc_idx: Int_or_Str = 'all',
-                  for_latex: bool = False):
+                  for_latex: bool = False,
+                  granularity: str = 'char',
+                  beta: float = 1.0):
         """Show precision, recall and F-score for each feature, for
         either a single document all documents.
 
@@ -278,22 +744,379 @@ class FeatureRestorationEvaluator:
           for_latex (bool, optional):
             Whether or not to format the output for LaTeX.
             Defaults to False.
+          granularity (str, optional):
+            Either 'char' for character-level metrics, or 'word' for
+            word-level metrics (only available if word_level was set to
+            True on initialization). Defaults to 'char'.
+          beta (float, optional):
+            The weight of recall relative to precision in the F-score
+            (e.g. 0.5 to weight precision more heavily). Defaults to 1.0.
         """
 
         self.get_cms(doc_idx)
-        cms = self.cms[doc_idx]
-        show_prfs(cms, for_latex)
+        cms = self.results.get_cms(doc_idx, granularity)
+        show_prfs(cms, for_latex, beta)
 
     # ====================
     def get_prfs(self,
                  doc_idx: Int_or_Str = 'all',
-                 display_names: bool = False) -> dict:
+                 display_names: bool = False,
+                 granularity: str = 'char',
+                 beta: float = 1.0) -> dict:
         """Only used for testing.
         """
 
         self.get_cms(doc_idx)
-        cms = self.cms[doc_idx]
-        return prfs_all_features(cms, display_names)
+        cms = self.results.get_cms(doc_idx, granularity)
+        return prfs_all_features(cms, display_names, beta=beta)
+
+    # ====================
+    def show_prf_averages(self,
+                          granularity: str = 'char',
+                          beta: float = 1.0):
+        """Show micro, macro, weighted, and document-level macro averages
+        of precision, recall, and F-score over all documents.
+
+        - micro: metrics of the counts summed over all documents and
+          features (the 'All features' row of show_prfs)
+        - macro: the mean over features of each feature's metrics
+        - weighted: the mean over features of each feature's metrics,
+          weighted by the number of times the feature appears in the
+          reference
+        - macro_docs: the mean over documents of each document's metrics
+          (over all features)
+
+        Undefined values are left out of macro and weighted averages.
+
+        Args:
+          granularity (str, optional):
+            Either 'char' for character-level metrics, or 'word' for
+            word-level metrics (only available if word_level was set to
+            True on initialization). Defaults to 'char'.
+          beta (float, optional):
+            The weight of recall relative to precision in the F-score.
+            Defaults to 1.0.
+        """
+
+        display_or_print(self.get_prf_averages(granularity, beta))
+
+    # ====================
+    def get_prf_averages(self,
+                         granularity: str = 'char',
+                         beta: float = 1.0) -> pd.DataFrame:
+        """Get a dataframe of micro, macro, weighted, and document-level
+        macro averages of precision, recall, and F-score over all
+        documents, indexed by average. See show_prf_averages."""
+
+        self.get_cms_all()
+        return pd.DataFrame(
+            self.results.get_prf_averages(granularity, beta),
+            index=AVERAGES, columns=PRF_COLUMNS)
+
+    # ====================
+    def estimate_metrics(self,
+                         target_width: float = 0.02,
+                         time_budget: float = None,
+                         confidence: float = 0.95,
+                         include_wer: bool = True,
+                         num_strata: int = 5,
+                         batch_size: int = 50,
+                         seed: int = 0) -> SampleEstimate:
+        """Estimate F-score for each feature (and WER) over the whole
+        corpus, with bootstrap confidence intervals, by scoring a
+        stratified random sample of documents.
+
+        Documents are stratified by length and sampled in a fixed order
+        for a given seed. Sampling continues in rounds of batch_size
+        documents until every confidence interval is no wider than
+        target_width, the time budget runs out, or all documents have
+        been scored. Documents scored while sampling are stored as usual,
+        so they are not scored again by other methods.
+
+        Args:
+          target_width (float, optional):
+            The confidence interval width to stop at, for F-scores and for
+            WER as a fraction (0.02 is 2 percentage points of WER).
+            Defaults to 0.02.
+          time_budget (float, optional):
+            The maximum time to spend scoring, in seconds. If None, there
+            is no time limit. Defaults to None.
+          confidence (float, optional):
+            The confidence level of the intervals. Defaults to 0.95.
+          include_wer (bool, optional):
+            Whether or not to estimate WER. Defaults to True.
+          num_strata (int, optional):
+            The number of length strata. Defaults to 5.
+          batch_size (int, optional):
+            The number of documents to score between checks of the
+            interval widths. Defaults to 50.
+          seed (int, optional):
+            The random seed. Defaults to 0.
+
+        Returns:
+          SampleEstimate:
+            The estimates. Use its show method to display them, or
+            to_dataframe to get a dataframe of estimates and interval
+            bounds.
+        """
+
+        return estimate_metrics(
+            self, target_width, time_budget, confidence, include_wer,
+            num_strata, batch_size, seed=seed)
+
+    # === EXPORT ===
+
+    # ====================
+    def to_dataframe(self,
+                     granularity: str = 'char',
+                     include_wer: bool = True,
+                     include_error_rates: bool = True) -> pd.DataFrame:
+        """Get a dataframe of precision, recall, F-score, WER, CER, and FER
+        for each document.
+
+        Confusion matrices (and word error rates, if include_wer is True)
+        are first calculated for any documents that they have not yet been
+        calculated for. All metrics are then computed in a single
+        vectorized pass over the stored counts.
+
+        Args:
+          granularity (str, optional):
+            Either 'char' for character-level metrics, or 'word' for
+            word-level metrics (only available if word_level was set to
+            True on initialization). Defaults to 'char'.
+          include_wer (bool, optional):
+            Whether or not to include WER columns. Defaults to True.
+          include_error_rates (bool, optional):
+            Whether or not to include CER and FER columns. Defaults to
+            True.
+
+        Returns:
+          pd.DataFrame:
+            A dataframe indexed by document index, with (feature, metric)
+            columns for each feature and 'all', where metric is one of TP,
+            FP, FN, Precision, Recall, F-score, followed by ('WER',
+            'len_ref'), ('WER', 'num_edits') and ('WER', 'wer'), and
+            similar columns for 'CER' and 'FER'. Undefined values are NaN.
+        """
+
+        self.get_cms_all()
+        if include_wer:
+            self.get_wer_info_all()
+        return self.results.to_dataframe(
+            granularity, include_wer, include_error_rates)
+
+    # ====================
+    def to_arrow(self,
+                 granularity: str = 'char',
+                 include_wer: bool = True,
+                 include_error_rates: bool = True):
+        """Get a pyarrow.Table of precision, recall, F-score, WER, CER, and
+        FER for each document, with a doc_idx column and a struct column
+        for each feature, 'all', 'WER', 'CER', and 'FER'.
+
+        Requires the pyarrow library.
+
+        Args:
+          granularity (str, optional):
+            Either 'char' for character-level metrics, or 'word' for
+            word-level metrics (only available if word_level was set to
+            True on initialization). Defaults to 'char'.
+          include_wer (bool, optional):
+            Whether or not to include a WER column. Defaults to True.
+          include_error_rates (bool, optional):
+            Whether or not to include CER and FER columns. Defaults to
+            True.
+
+        Returns:
+          pyarrow.Table:
+            The table.
+        """
+
+        self.get_cms_all()
+        if include_wer:
+            self.get_wer_info_all()
+        return self.results.to_arrow(
+            granularity, include_wer, include_error_rates)
+
+    # ====================
+    def to_partial_results(self,
+                           doc_offset: int = None,
+                           doc_idxs: List[int] = None,
+                           num_docs: int = None,
+                           include_wer: bool = True) -> PartialResults:
+        """Get mergeable partial results for the documents of this
+        evaluator, e.g. to evaluate one shard of a large test set on each
+        of several machines and combine the results.
+
+        Confusion matrices (and word error rates, if include_wer is True)
+        are first calculated for any documents that they have not yet been
+        calculated for.
+
+        Args:
+          doc_offset (int, optional):
+            The global index of the first document of this evaluator. If
+            None, the start attribute of the reference corpus (e.g. of a
+            TextFileCorpus shard) is used, or 0 if it has none. Defaults
+            to None.
+          doc_idxs (List[int], optional):
+            The global index of every document of this evaluator, for
+            shards that are not contiguous ranges of documents. Overrides
+            doc_offset. Defaults to None.
+          num_docs (int, optional):
+            The number of documents in the whole corpus, if known.
+            Defaults to None.
+          include_wer (bool, optional):
+            Whether or not to calculate WERs. Defaults to True.
+
+        Returns:
+          PartialResults:
+            The partial results. Use their save method to write them to a
+            file, and PartialResults.merge (or python -m
+            fre.partial_results merge) to combine them.
+        """
+
+        self.get_cms_all()
+        if include_wer:
+            self.get_wer_info_all()
+        return PartialResults.from_evaluator(
+            self, doc_offset, doc_idxs, num_docs)
+
+    # ====================
+    def write_html_report(self,
+                          save_path: str,
+                          chars_per_page: int = DEFAULT_CHARS_PER_PAGE,
+                          include_wer: bool = True,
+                          ignore: list = None,
+                          title: str = 'Feature restoration report'):
+        """Write a self-contained HTML report with corpus-level metrics,
+        a table of per-document metrics, and a paged text view of each
+        document with false positives and false negatives highlighted.
+
+        Labelled text is stored in the report as compressed pages that
+        are only decoded in the browser when viewed, so that reports for
+        very long documents (e.g. hour-long transcripts) remain
+        responsive.
+
+        Args:
+          save_path (str):
+            The path to save the report to.
+          chars_per_page (int, optional):
+            The approximate number of characters of text to show on each
+            page of the text view. Defaults to DEFAULT_CHARS_PER_PAGE.
+          include_wer (bool, optional):
+            Whether or not to include word error rates. Defaults to True.
+          ignore (list, optional):
+            A list of features to ignore in the text view (e.g. ['.',
+            ',']). Defaults to None.
+          title (str, optional):
+            The title of the report. Defaults to 'Feature restoration
+            report'.
+        """
+
+        self.get_cms_all()
+        if include_wer:
+            self.get_wer_info_all()
+        write_html_report_(
+            self, save_path, chars_per_page=chars_per_page,
+            include_wer=include_wer, ignore=ignore, title=title
+        )
+
+    # === TRIAGE ===
+
+    # ====================
+    def triage(self,
+               granularity: str = 'char',
+               include_wer: bool = True) -> Triage:
+        """Get a Triage object for ranking documents by metric and
+        displaying the worst documents.
+
+        Confusion matrices (and word error rates, if include_wer is True)
+        are first calculated for any documents that they have not yet been
+        calculated for.
+
+        Args:
+          granularity (str, optional):
+            Either 'char' for character-level metrics, or 'word' for
+            word-level metrics (only available if word_level was set to
+            True on initialization). Defaults to 'char'.
+          include_wer (bool, optional):
+            Whether or not to calculate WERs so that documents can be
+            ranked by WER. Defaults to True.
+
+        Returns:
+          Triage:
+            The Triage object.
+        """
+
+        self.get_cms_all()
+        if include_wer:
+            self.get_wer_info_all()
+        return Triage(self, granularity)
+
+    # ====================
+    def position_profile(self,
+                         by: str = 'absolute',
+                         bin_size: int = None,
+                         num_bins: int = None,
+                         chunk_size: int = None) -> PositionProfile:
+        """Get counts of TPs, FPs, and FNs for each feature, binned by
+        the position in the reference documents at which they occur, to
+        see where in long documents errors are concentrated.
+
+        Args:
+          by (str, optional):
+            How to bin positions: 'absolute' (characters from the start of
+            the document), 'relative' (fraction of the document length),
+            'chunk' (offset within a chunk of chunk_size characters), or
+            'boundary' (distance to the nearest chunk boundary). Defaults
+            to 'absolute'.
+          bin_size (int, optional):
+            The width of each bin in characters, for all modes except
+            'relative'. If None, defaults to 1000 for 'absolute', and to
+            1/16 of chunk_size for 'chunk' and 'boundary'. Defaults to
+            None.
+          num_bins (int, optional):
+            The number of bins in 'relative' mode. If None, defaults to
+            10. Defaults to None.
+          chunk_size (int, optional):
+            The chunk size in characters, for 'chunk' and 'boundary'
+            modes (e.g. the input length of a model that is run on fixed
+            size chunks). Defaults to None.
+
+        Returns:
+          PositionProfile:
+            The profile. Use its to_dataframe method to get a table, and
+            plot_arrays to get arrays for plotting.
+        """
+
+        return PositionProfile(self, by, bin_size, num_bins, chunk_size)
+
+    # === SYSTEM COMPARISON ===
+
+    # ====================
+    def compare(self, other: 'FeatureRestorationEvaluator',
+                alignment: bool = None) -> SystemDiff:
+        """Get a SystemDiff object for comparing the restorations of this
+        evaluator's hypothesis (system A) with those of another evaluator
+        for the same reference (system B), position by position.
+
+        Args:
+          other (FeatureRestorationEvaluator):
+            The evaluator for system B. Must have the same features and
+            number of documents as this evaluator.
+          alignment (bool, optional):
+            Whether or not to align hypotheses whose base characters
+            differ from the reference. If None, the alignment setting of
+            this evaluator is used. Defaults to None.
+
+        Returns:
+          SystemDiff:
+            The SystemDiff object. Use get_counts for the numbers of
+            fixed, regressed, and unchanged errors for each feature, and
+            show_diff to display a document with changes highlighted.
+        """
+
+        return SystemDiff(self, other, alignment)
 
     # === TEXT_DISPLAY ===
 
@@ -304,10 +1127,14 @@ class FeatureRestorationEvaluator:
                           chars_per_row: int = None,
                           num_rows: int = None,
                           for_latex: bool = False,
-                          ignore: list = None):
+                          ignore: list = None,
+                          pager: bool = False):
         """Display a hypothesis document with false positives and false
         negatives highlighted.
 
+        In notebooks, the display is rendered as HTML. Elsewhere, it is
+        written to the terminal a row at a time with ANSI colours.
+
         Args:
           doc_idx (int):
             The index of the document to display.
@@ -324,14 +1151,18 @@ class FeatureRestorationEvaluator:
             Whether to render the output for LaTeX. Defaults to False.
           ignore (list, optional):
             A list of features to ignore (e.g. ['.', ',']). Defaults to None.
+          pager (bool, optional):
+            Outside notebooks, whether to write the display to a pager
+            ($PAGER, or less) instead of stdout. Defaults to False.
         """
         ref = self.reference[doc_idx].strip()
         hyp = self.hypothesis[doc_idx].strip()
         show_text_display_(
             ref, hyp,
-            features=self.features, feature_chars=self.feature_chars,
+            features=self.feature_set,
             start_char=start_char, chars_per_row=chars_per_row,
-            num_rows=num_rows, ignore=ignore, for_latex=for_latex
+            num_rows=num_rows, ignore=ignore, for_latex=for_latex,
+            pager=pager
         )
 
     # ====================
@@ -356,7 +1187,7 @@ class FeatureRestorationEvaluator:
         hyp = self.hypothesis[doc_idx].strip()
         show_feature_errors_(
             ref, hyp,
-            features=self.features,
+            features=self.feature_set,
             feature_to_check=feature_to_check,
             chars_either_side=chars_either_side
         )
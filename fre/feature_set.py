@@ -0,0 +1,622 @@
+import re
+import unicodedata
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from fre.casing import UPPER, Casing, word_case_flags
+from fre.misc import CAPS, CAPS_ALL, CAPS_INITIAL, CASE_FEATURES, list_gclust
+
+ERROR_FIRST_CHAR_FEATURE_CHAR = """
+The first character in the document is a feature character!"""
+ERROR_FEATURE_TYPE = """
+Features must be strings or FeatureClass objects."""
+ERROR_EMPTY_FEATURE = """
+Features cannot be empty strings."""
+ERROR_TOO_MANY_FEATURES = """
+At most 63 features are supported."""
+
+NO_FEATURE = -1
+# The approximate number of characters in each block of a document that is
+# split lazily by FeatureSet.iter_split
+SPLIT_BLOCK_SIZE = 4096
+# The maximum length of a block, as a multiple of the block size, for text
+# without whitespace (e.g. CJK text or long URLs)
+MAX_BLOCK_SIZE_FACTOR = 4
+# The number of characters after the maximum length of a block in which to
+# look for a grapheme boundary to end the block at
+BLOCK_CUT_LOOKAHEAD = 256
+# Positions at which blocks can start: a word character after whitespace
+BLOCK_START = re.compile(r'\s(?=\w)')
+
+
+# ====================
+class FeatureClass:
+    """A feature that is present when any one of a class of characters
+    follows a base character (e.g. any Unicode dash)."""
+
+    # ====================
+    def __init__(self,
+                 name: str,
+                 chars: str = None,
+                 categories: List[str] = None,
+                 pattern: str = None):
+        """Initializes an instance of FeatureClass.
+
+        A single grapheme cluster belongs to the class if it matches any
+        of chars, categories, or pattern.
+
+        Args:
+          name (str):
+            The name of the feature (e.g. 'DASH'), used in place of a
+            feature character in confusion matrices and metrics.
+          chars (str, optional):
+            Characters in the class. Defaults to None.
+          categories (List[str], optional):
+            Unicode general categories or major classes of characters in
+            the class (e.g. ['Pd'] for dashes or ['P'] for all
+            punctuation). Defaults to None.
+          pattern (str, optional):
+            A regular expression that matches (the whole of) grapheme
+            clusters in the class. Defaults to None.
+        """
+
+        self.name = name
+        self.chars = set(list_gclust(chars)) if chars else set()
+        self.categories = list(categories or [])
+        self.pattern = re.compile(pattern) if pattern else None
+
+    # ====================
+    def __repr__(self) -> str:
+
+        return f"FeatureClass({self.name!r})"
+
+    # ====================
+    def matches(self, grapheme: str) -> bool:
+        """Check whether a grapheme cluster belongs to the class."""
+
+        if grapheme in self.chars:
+            return True
+        category = unicodedata.category(grapheme[0])
+        if any(category.startswith(c) for c in self.categories):
+            return True
+        if self.pattern is not None and self.pattern.fullmatch(grapheme):
+            return True
+        return False
+
+
+DASHES = FeatureClass('DASH', categories=['Pd'])
+CJK_PUNCTUATION = FeatureClass(
+    'CJK_PUNCT', pattern='[\u3000-\u303f\uff01-\uff0f\uff1a-\uff20]')
+
+Feature = Union[str, FeatureClass]
+
+
+# ====================
+class FeatureSet:
+    """A compiled set of feature definitions, shared by metric
+    calculation and text display.
+
+    Features can be CAPS, single characters (e.g. '.'), multi-character
+    marks (e.g. '...' or '?!'), or FeatureClass objects. Single grapheme
+    clusters are looked up in a table that is filled in as new grapheme
+    clusters are encountered, and multi-character marks are looked up by
+    their first grapheme cluster, so matching takes constant time per
+    position. Where marks overlap, the longest mark is matched."""
+
+    # ====================
+    def __init__(self, features: List[Feature], language: str = None):
+        """Initializes an instance of FeatureSet.
+
+        Args:
+          features (List[Feature]):
+            The features, in the order in which they should be numbered.
+            May include the case features CAPS (any upper case
+            character), CAPS_INITIAL (the first letter of a word that is
+            capitalized but not written in all capitals) and CAPS_ALL (the
+            first letter of a word written in all capitals).
+          language (str, optional):
+            An ISO 639-1 language code used to select language-specific
+            case folding rules when comparing base characters (e.g. 'tr'
+            for Turkish dotted and dotless i). Defaults to None.
+        """
+
+        if len(features) > 63:
+            raise ValueError(ERROR_TOO_MANY_FEATURES)
+        self.specs = list(features)
+        self.language = language
+        self.features = [feature_name(f) for f in features]
+        self.casing = Casing(language)
+        self.case_bits = {
+            f: 1 << self.features.index(f)
+            for f in CASE_FEATURES if f in self.features
+        }
+        self.classes = []
+        self.lookup = {}
+        self.multi_char = {}
+        for idx, f in enumerate(features):
+            if f in CASE_FEATURES:
+                continue
+            elif isinstance(f, FeatureClass):
+                self.classes.append((f, idx))
+                continue
+            graphemes = tuple(list_gclust(f))
+            if len(graphemes) == 1:
+                self.lookup[graphemes[0]] = idx
+            else:
+                self.multi_char.setdefault(graphemes[0], []).append(
+                    (graphemes, idx))
+        for candidates in self.multi_char.values():
+            candidates.sort(key=lambda x: len(x[0]), reverse=True)
+
+    # ====================
+    def __len__(self) -> int:
+
+        return len(self.features)
+
+    # ====================
+    def match(self, graphemes: List[str], i: int) -> Tuple[int, int]:
+        """Get the index of the feature that starts at position i in a list
+        of grapheme clusters, and the number of grapheme clusters that it
+        spans, or (NO_FEATURE, 1) if there is no feature at position i."""
+
+        grapheme = graphemes[i]
+        candidates = self.multi_char.get(grapheme)
+        if candidates is not None:
+            for seq, idx in candidates:
+                if tuple(graphemes[i:i+len(seq)]) == seq:
+                    return idx, len(seq)
+        idx = self.lookup.get(grapheme)
+        if idx is None:
+            idx = self.lookup_class(grapheme)
+        return idx, 1
+
+    # ====================
+    def lookup_class(self, grapheme: str) -> int:
+        """Get the index of the first feature class that a grapheme cluster
+        belongs to, and add the result to the lookup table."""
+
+        idx = NO_FEATURE
+        for feature_class, class_idx in self.classes:
+            if feature_class.matches(grapheme):
+                idx = class_idx
+                break
+        self.lookup[grapheme] = idx
+        return idx
+
+    # ====================
+    def fold(self, char: str) -> str:
+        """Case-fold a base character for comparison, using the
+        language-specific rules for this feature set."""
+
+        return self.casing.analyse_grapheme(char)[0]
+
+    # ====================
+    def parse(self, doc: str, case_info: bool = False) \
+            -> Tuple[List[str], np.ndarray]:
+        """Split a document into base (non-feature) characters and an
+        array of feature codes for each base character.
+
+        Bit i of the code for a base character is set if features[i] is
+        present at that position (i.e. the character meets the case
+        condition for a case feature, or the feature immediately follows
+        it).
+
+        Args:
+          doc (str):
+            The document
+          case_info (bool, optional):
+            Whether or not to also return the case class of each base
+            character and whether or not it is alphanumeric, which are
+            needed to apply the word boundaries of another document to
+            CAPS_INITIAL and CAPS_ALL (see word_case_codes). Defaults to
+            False.
+
+        Returns:
+          Tuple[List[str], np.ndarray]:
+            The case-folded base characters, and the feature codes,
+            followed by a (case classes, alphanumeric) tuple of arrays if
+            case_info is True.
+        """
+
+        return self.parse_graphemes(list_gclust(doc.strip()), case_info)
+
+    # ====================
+    def parse_graphemes(self, graphemes: List[str],
+                        case_info: bool = False) \
+            -> Tuple[List[str], np.ndarray]:
+        """Parse a document that has already been split into grapheme
+        clusters (see parse)."""
+
+        if graphemes and self.match(graphemes, 0)[0] != NO_FEATURE:
+            raise ValueError(ERROR_FIRST_CHAR_FEATURE_CHAR)
+        chars = []
+        codes = []
+        i = 0
+        while i < len(graphemes):
+            idx, length = self.match(graphemes, i)
+            if idx == NO_FEATURE:
+                chars.append(graphemes[i])
+                codes.append(0)
+            else:
+                codes[-1] |= 1 << idx
+            i += length
+        folded, case_classes, alnum = self.casing.analyse(chars)
+        codes = self.case_codes(
+            case_classes, alnum, np.array(codes, dtype=np.int64))
+        if case_info:
+            return folded, codes, (case_classes, alnum)
+        return folded, codes
+
+    # ====================
+    def split(self, doc: str, case_info: bool = False) \
+            -> Tuple[List[str], List[Dict[str, str]]]:
+        """Split a document into base characters and the features present
+        at each base character, keeping the original text of each feature
+        for display.
+
+        Unlike parse, the case of base characters is kept and the first
+        character is always treated as a base character.
+
+        Args:
+          doc (str):
+            The document
+          case_info (bool, optional):
+            Whether or not to also return the feature codes of the base
+            characters and their case classes and alphanumeric flags (see
+            parse). Defaults to False.
+
+        Returns:
+          Tuple[List[str], List[Dict[str, str]]]:
+            The base characters, and a dictionary mapping the name of each
+            feature present at each base character to its text (an empty
+            string for case features), followed by the feature codes and
+            a (case classes, alphanumeric) tuple of arrays if case_info is
+            True.
+        """
+
+        graphemes = list_gclust(doc)
+        chars = []
+        codes = []
+        feature_dicts = []
+        i = 0
+        while i < len(graphemes):
+            idx, length = self.match(graphemes, i)
+            if idx == NO_FEATURE or i == 0:
+                length = 1
+                chars.append(graphemes[i])
+                codes.append(0)
+                feature_dicts.append({})
+            else:
+                name = self.features[idx]
+                feature_dicts[-1][name] = feature_dicts[-1].get(name, '') + \
+                    ''.join(graphemes[i:i+length])
+                codes[-1] |= 1 << idx
+            i += length
+        _, case_classes, alnum = self.casing.analyse(chars)
+        codes = self.case_codes(
+            case_classes, alnum, np.array(codes, dtype=np.int64))
+        self.set_case_features(feature_dicts, codes)
+        if case_info:
+            return chars, feature_dicts, codes, (case_classes, alnum)
+        return chars, feature_dicts
+
+    # ====================
+    def split_pair(self, ref: str, hyp: str) \
+            -> Tuple[Tuple[List[str], List[Dict[str, str]]],
+                     Tuple[List[str], List[Dict[str, str]]]]:
+        """Split a reference and hypothesis document as split does, with
+        CAPS_INITIAL and CAPS_ALL in the hypothesis on the word starts of
+        the reference, as they are scored (see reference_word_codes)."""
+
+        chars_ref, features_ref, *case_ref = self.split(ref, True)
+        chars_hyp, features_hyp, *case_hyp = self.split(hyp, True)
+        self.set_reference_word_case(case_ref, features_hyp, case_hyp)
+        return (chars_ref, features_ref), (chars_hyp, features_hyp)
+
+    # ====================
+    def iter_split(self, doc: str, block_size: int = SPLIT_BLOCK_SIZE) \
+            -> Iterator[Tuple[str, Dict[str, str]]]:
+        """Split a document lazily into base characters and the features
+        present at each base character, as split does, yielding a
+        (base character, features) tuple for each base character.
+
+        The document is split in blocks of about block_size characters
+        that each start at the beginning of a word, so that case features
+        are unaffected and only one block is held in memory at a time.
+        Where there is no whitespace (e.g. in CJK text or long URLs),
+        blocks are cut at a grapheme boundary once they reach
+        MAX_BLOCK_SIZE_FACTOR times block_size characters (see
+        block_end).
+
+        Args:
+          doc (str):
+            The document
+          block_size (int, optional):
+            The minimum number of characters in each block (except the
+            last). Defaults to 4096.
+
+        Yields:
+          Tuple[str, Dict[str, str]]:
+            A base character, and a dictionary mapping the name of each
+            feature present at the base character to its text.
+        """
+
+        for chars, feature_dicts, _, _ in self.iter_split_blocks(
+                doc, block_size):
+            yield from zip(chars, feature_dicts)
+
+    # ====================
+    def iter_split_pair(self, ref: str, hyp: str,
+                        block_size: int = SPLIT_BLOCK_SIZE) \
+            -> Iterator[Tuple[Tuple[str, Dict[str, str]],
+                              Tuple[str, Dict[str, str]]]]:
+        """Split a reference and hypothesis document lazily, as iter_split
+        does, with CAPS_INITIAL and CAPS_ALL in the hypothesis on the word
+        starts of the reference (see split_pair), yielding a pair of
+        (base character, features) tuples for each base character.
+
+        The reference is split in blocks as for iter_split, and the same
+        number of base characters is taken from the hypothesis for each
+        block, so only one block of each document is held in memory at a
+        time. Iteration stops at the end of the shorter document."""
+
+        hyp_entries = (
+            entry
+            for chars, feature_dicts, codes, (case_classes, alnum)
+            in self.iter_split_blocks(hyp, block_size)
+            for entry in zip(chars, feature_dicts, codes, case_classes,
+                             alnum)
+        )
+        for chars_ref, features_ref, *case_ref in self.iter_split_blocks(
+                ref, block_size):
+            entries = list(islice(hyp_entries, len(chars_ref)))
+            if not entries:
+                return
+            chars_hyp, features_hyp, codes, case_classes, alnum = \
+                zip(*entries)
+            features_hyp = list(features_hyp)
+            self.set_reference_word_case(
+                case_ref, features_hyp,
+                [np.array(codes, dtype=np.int64),
+                 (np.array(case_classes), np.array(alnum, dtype=bool))])
+            yield from zip(zip(chars_ref, features_ref),
+                           zip(chars_hyp, features_hyp))
+
+    # ====================
+    def iter_split_blocks(self, doc: str, block_size: int) -> Iterator[tuple]:
+        """Split a document lazily in blocks that each start at the
+        beginning of a word (see iter_split), yielding the result of split
+        with case_info=True for each block."""
+
+        start = 0
+        while start < len(doc):
+            end = self.block_end(doc, start, block_size)
+            yield self.split(doc[start:end], True)
+            start = end
+
+    # ====================
+    def block_end(self, doc: str, start: int, block_size: int) -> int:
+        """Get the position at which a block of a document that starts at
+        start ends.
+
+        This is the first start of a word that does not begin with a
+        feature at least block_size characters after start. If there is
+        none before MAX_BLOCK_SIZE_FACTOR times block_size characters,
+        the block is cut at the first grapheme boundary after that which
+        is not followed by a feature (preferring a boundary next to a
+        non-alphanumeric character, so that case features of words are
+        unaffected), so that text without whitespace is not held in
+        memory as a whole."""
+
+        max_end = start + MAX_BLOCK_SIZE_FACTOR * block_size
+        for match in BLOCK_START.finditer(doc, start + block_size, max_end):
+            if self.can_start_block(
+                    list_gclust(doc[match.end():match.end() + 8])[0]):
+                return match.end()
+        if max_end >= len(doc):
+            return len(doc)
+        # Segment from the start of the block, which is a grapheme
+        # boundary. Only the last grapheme can be cut short.
+        graphemes = list_gclust(doc[start:max_end + BLOCK_CUT_LOOKAHEAD])
+        if max_end + BLOCK_CUT_LOOKAHEAD < len(doc):
+            graphemes = graphemes[:-1]
+        offsets = np.cumsum([0] + [len(g) for g in graphemes]) + start
+        candidates = [
+            i for i in range(1, len(graphemes))
+            if offsets[i] >= max_end and self.can_start_block(graphemes[i])
+        ]
+        for i in candidates:
+            if not (graphemes[i - 1].isalnum() and graphemes[i].isalnum()):
+                return int(offsets[i])
+        if candidates:
+            return int(offsets[candidates[0]])
+        # A run of features longer than the lookahead cannot be cut
+        return len(doc)
+
+    # ====================
+    def can_start_block(self, grapheme: str) -> bool:
+        """Whether or not a block can start with a grapheme cluster, i.e.
+        the grapheme cluster does not start a feature."""
+
+        return grapheme not in self.multi_char \
+            and self.match([grapheme], 0)[0] == NO_FEATURE
+
+    # ====================
+    def case_codes(self, case_classes: np.ndarray, alnum: np.ndarray,
+                   codes: np.ndarray) -> np.ndarray:
+        """Add the bits for case features to the feature codes of base
+        characters, given the case class of each base character and whether
+        or not it is alphanumeric (see Casing.analyse)."""
+
+        if len(codes) == 0:
+            return codes
+        if CAPS in self.case_bits:
+            codes = codes | np.where(
+                case_classes == UPPER, self.case_bits[CAPS], 0)
+        if self.has_word_case():
+            codes = self.word_case_codes(
+                codes, case_classes, self.word_starts(codes, alnum))
+        return codes
+
+    # ====================
+    def has_word_case(self) -> bool:
+        """Whether or not CAPS_INITIAL or CAPS_ALL is a feature."""
+
+        return CAPS_INITIAL in self.case_bits or CAPS_ALL in self.case_bits
+
+    # ====================
+    def word_starts(self, codes: np.ndarray, alnum: np.ndarray) \
+            -> np.ndarray:
+        """Get the positions at which words start for CAPS_INITIAL and
+        CAPS_ALL: after any feature other than a case feature, and where
+        an alphanumeric base character follows a non-alphanumeric one."""
+
+        if len(codes) == 0:
+            return np.zeros(0, dtype=np.int64)
+        feature_codes = codes & ~sum(self.case_bits.values())
+        breaks = (feature_codes[:-1] != 0) | ~alnum[:-1] | ~alnum[1:]
+        return np.concatenate([[0], np.flatnonzero(breaks) + 1])
+
+    # ====================
+    def word_case_codes(self, codes: np.ndarray, case_classes: np.ndarray,
+                        word_starts: np.ndarray) -> np.ndarray:
+        """Set the CAPS_INITIAL and CAPS_ALL bits of feature codes for
+        words starting at the given positions, replacing any that are
+        already set.
+
+        Documents are compared with the word starts of the reference, so
+        that a missing or extra feature between two words of the
+        hypothesis (e.g. 'NASAteam' for 'NASA team') does not also change
+        the case features of the words.
+        """
+
+        word_bits = self.case_bits.get(CAPS_INITIAL, 0) \
+            | self.case_bits.get(CAPS_ALL, 0)
+        codes = codes & ~word_bits
+        initial, all_caps = word_case_flags(case_classes, word_starts)
+        if CAPS_INITIAL in self.case_bits:
+            codes[word_starts[initial]] |= self.case_bits[CAPS_INITIAL]
+        if CAPS_ALL in self.case_bits:
+            codes[word_starts[all_caps]] |= self.case_bits[CAPS_ALL]
+        return codes
+
+    # ====================
+    def reference_word_codes(self,
+                             parsed_ref: tuple,
+                             parsed_hyp: tuple,
+                             ref_positions: np.ndarray = None,
+                             hyp_positions: np.ndarray = None) -> np.ndarray:
+        """Get the feature codes of a hypothesis document with CAPS_INITIAL
+        and CAPS_ALL set on the word starts of the reference document.
+
+        All consumers of hypothesis case features (scoring, profiles,
+        system comparisons, and text displays) use this, so that they
+        agree on documents such as 'The NASAteam' for 'The NASA team'.
+
+        Args:
+          parsed_ref (tuple):
+            The reference document, parsed with case_info=True (see
+            parse).
+          parsed_hyp (tuple):
+            The hypothesis document, parsed with case_info=True.
+          ref_positions (np.ndarray, optional):
+            Aligned positions in the reference. A word also starts
+            wherever the aligned positions of either document are not
+            consecutive. If None, the documents are assumed to have the
+            same base characters and positions up to the length of the
+            shorter document are used. Defaults to None.
+          hyp_positions (np.ndarray, optional):
+            The hypothesis position aligned with each of ref_positions.
+            Defaults to None.
+
+        Returns:
+          np.ndarray:
+            The feature codes of the hypothesis at hyp_positions.
+        """
+
+        _, codes_ref, (_, alnum_ref) = parsed_ref
+        _, codes_hyp, (case_classes_hyp, _) = parsed_hyp
+        if ref_positions is None:
+            ref_positions = hyp_positions = np.arange(
+                min(len(codes_ref), len(codes_hyp)), dtype=np.int64)
+        codes = codes_hyp[hyp_positions]
+        if not self.has_word_case() or len(codes) == 0:
+            return codes
+        is_start = np.zeros(len(codes_ref), dtype=bool)
+        is_start[self.word_starts(codes_ref, alnum_ref)] = True
+        is_start = is_start[ref_positions]
+        is_start[0] = True
+        is_start[1:] |= (np.diff(ref_positions) != 1) \
+            | (np.diff(hyp_positions) != 1)
+        return self.word_case_codes(
+            codes, case_classes_hyp[hyp_positions], np.flatnonzero(is_start))
+
+    # ====================
+    def set_case_features(self,
+                          feature_dicts: List[Dict[str, str]],
+                          codes: np.ndarray,
+                          old_codes: np.ndarray = None):
+        """Add case features to the feature dictionaries of base
+        characters (see split) from their feature codes, removing any
+        that were set from old_codes and are no longer present."""
+
+        for case_feature, bit in self.case_bits.items():
+            if old_codes is not None:
+                for pos in np.flatnonzero(old_codes & bit & ~codes):
+                    del feature_dicts[pos][case_feature]
+            for pos in np.flatnonzero(codes & bit):
+                feature_dicts[pos][case_feature] = ''
+
+    # ====================
+    def set_reference_word_case(self,
+                                case_ref: list,
+                                features_hyp: List[Dict[str, str]],
+                                case_hyp: list):
+        """Set the CAPS_INITIAL and CAPS_ALL features of a hypothesis
+        split with case_info=True (see split) on the word starts of the
+        reference, given the feature codes and case information of both
+        documents."""
+
+        if not self.has_word_case():
+            return
+        codes_ref, info_ref = case_ref
+        codes_hyp, info_hyp = case_hyp
+        codes = self.reference_word_codes(
+            (None, codes_ref, info_ref), (None, codes_hyp, info_hyp))
+        self.set_case_features(
+            features_hyp[:len(codes)], codes, codes_hyp[:len(codes)])
+
+
+# ====================
+def feature_name(feature: Feature) -> str:
+    """Get the name of a feature (the feature itself for strings)"""
+
+    if isinstance(feature, FeatureClass):
+        return feature.name
+    elif isinstance(feature, str):
+        if len(feature) == 0:
+            raise ValueError(ERROR_EMPTY_FEATURE)
+        return feature
+    else:
+        raise TypeError(ERROR_FEATURE_TYPE)
+
+
+# ====================
+def compile_features(features: Union[List[Feature], FeatureSet],
+                     language: str = None) -> FeatureSet:
+    """Get a FeatureSet for a list of features, or return the FeatureSet
+    if one is passed."""
+
+    if isinstance(features, FeatureSet):
+        return features
+    return compile_features_cached(tuple(features), language)
+
+
+# ====================
+@lru_cache(maxsize=32)
+def compile_features_cached(features: tuple, language: str) -> FeatureSet:
+
+    return FeatureSet(list(features), language)
@@ -0,0 +1,188 @@
+from typing import Dict, List, MutableMapping, Tuple
+
+import numpy as np
+
+from fre.feature_set import (ERROR_FIRST_CHAR_FEATURE_CHAR, NO_FEATURE,
+                             FeatureSet)
+from fre.misc import list_gclust
+
+# Grapheme ids are stored in the smallest of these types that can hold
+# every id in the vocabulary when a document is added
+SMALL_ID_DTYPE = np.uint16
+LARGE_ID_DTYPE = np.int32
+
+Parsed = Tuple[List[str], np.ndarray]
+
+
+# ====================
+class GraphemeCache:
+    """Reference and hypothesis documents split into grapheme clusters
+    and stored as arrays of ids in a shared vocabulary, so that documents
+    can be parsed under any feature set without segmenting them again.
+
+    Parsing a cached document (see parse) is a vectorized projection:
+    grapheme ids index into tables with an entry for each distinct
+    grapheme cluster, giving the feature it belongs to (if any), its
+    case-folded form, its case class, and whether it is alphanumeric.
+    The tables are built once for each feature set. Feature sets with
+    multi-character features (e.g. '...') fall back to matching grapheme
+    clusters one at a time, still without segmenting the document."""
+
+    # ====================
+    def __init__(self, docs: MutableMapping = None):
+        """Initializes an empty GraphemeCache.
+
+        Args:
+          docs (MutableMapping, optional):
+            An empty mapping to hold the grapheme ids of each document
+            (e.g. a fre.spill_store.SpillStore). If None, a dictionary is
+            used. Defaults to None.
+        """
+
+        self.vocab: List[str] = []
+        self.grapheme_ids: Dict[str, int] = {}
+        self.docs: MutableMapping[int, Tuple[np.ndarray, np.ndarray]] = \
+            {} if docs is None else docs
+        self.tables = None
+        self.tables_feature_set = None
+
+    # ====================
+    def __contains__(self, doc_idx: int) -> bool:
+
+        return doc_idx in self.docs
+
+    # ====================
+    def __len__(self) -> int:
+
+        return len(self.docs)
+
+    # ====================
+    def __getstate__(self) -> dict:
+
+        # Tables are rebuilt when they are next needed
+        state = self.__dict__.copy()
+        state['tables'] = None
+        state['tables_feature_set'] = None
+        return state
+
+    # ====================
+    def add(self, doc_idx: int, ref: str, hyp: str):
+        """Split the reference and hypothesis versions of a document into
+        grapheme clusters and store them."""
+
+        self.docs[doc_idx] = (self.encode(ref), self.encode(hyp))
+
+    # ====================
+    def encode(self, doc: str) -> np.ndarray:
+        """Get the grapheme ids of a document, adding new grapheme clusters
+        to the vocabulary."""
+
+        graphemes = list_gclust(doc.strip())
+        for grapheme in dict.fromkeys(graphemes):
+            if grapheme not in self.grapheme_ids:
+                self.grapheme_ids[grapheme] = len(self.vocab)
+                self.vocab.append(grapheme)
+        if len(self.vocab) <= np.iinfo(SMALL_ID_DTYPE).max + 1:
+            dtype = SMALL_ID_DTYPE
+        else:
+            dtype = LARGE_ID_DTYPE
+        return np.fromiter(
+            map(self.grapheme_ids.__getitem__, graphemes), dtype=dtype,
+            count=len(graphemes))
+
+    # ====================
+    def nbytes(self) -> int:
+        """Get the number of bytes used by the grapheme id arrays."""
+
+        return sum(ref.nbytes + hyp.nbytes for ref, hyp in self.docs.values())
+
+    # ====================
+    def parse(self, doc_idx: int, feature_set: FeatureSet,
+              case_info: bool = False) -> Tuple[Parsed, Parsed]:
+        """Parse the reference and hypothesis versions of a cached
+        document with a feature set.
+
+        Args:
+          doc_idx (int):
+            The index of the document.
+          feature_set (FeatureSet):
+            The feature set.
+          case_info (bool, optional):
+            Whether or not to also return case classes and alphanumeric
+            flags, as FeatureSet.parse does. Defaults to False.
+
+        Returns:
+          Tuple[Parsed, Parsed]:
+            The case-folded base characters and feature codes of the
+            reference and hypothesis documents, exactly as returned by
+            FeatureSet.parse.
+
+        Raises:
+          ValueError:
+            The first character of a document is a feature character.
+        """
+
+        if feature_set.multi_char:
+            return tuple(
+                feature_set.parse_graphemes(
+                    [self.vocab[i] for i in ids], case_info)
+                for ids in self.docs[doc_idx])
+        tables = self.get_tables(feature_set)
+        return tuple(
+            project(ids, tables, feature_set, case_info)
+            for ids in self.docs[doc_idx])
+
+    # ====================
+    def get_tables(self, feature_set: FeatureSet) -> Dict[str, np.ndarray]:
+        """Get lookup tables indexed by grapheme id for a feature set,
+        rebuilding them if the feature set or the vocabulary has changed
+        since they were last built."""
+
+        if self.tables is None or self.tables_feature_set is not feature_set \
+                or len(self.tables['feature']) != len(self.vocab):
+            analysed = [
+                feature_set.casing.analyse_grapheme(g) for g in self.vocab]
+            self.tables = {
+                'feature': np.array(
+                    [feature_set.match([g], 0)[0] for g in self.vocab],
+                    dtype=np.int64),
+                'folded': np.array(
+                    [folded for folded, _, _ in analysed], dtype=object),
+                'case_class': np.array(
+                    [case_class for _, case_class, _ in analysed],
+                    dtype=np.int8),
+                'alnum': np.array(
+                    [alnum for _, _, alnum in analysed], dtype=bool)
+            }
+            self.tables_feature_set = feature_set
+        return self.tables
+
+
+# ====================
+def project(ids: np.ndarray,
+            tables: Dict[str, np.ndarray],
+            feature_set: FeatureSet,
+            case_info: bool = False) -> Parsed:
+    """Get the case-folded base characters and feature codes of a document
+    (and case classes and alphanumeric flags if case_info is True) from
+    its grapheme ids and the lookup tables for a feature set with no
+    multi-character features."""
+
+    feature_idxs = tables['feature'][ids]
+    is_base = feature_idxs == NO_FEATURE
+    if len(ids) and not is_base[0]:
+        raise ValueError(ERROR_FIRST_CHAR_FEATURE_CHAR)
+    base_ids = ids[is_base]
+    codes = np.zeros(len(base_ids), dtype=np.int64)
+    # Each feature belongs to the last base character before it
+    is_feature = ~is_base
+    np.bitwise_or.at(
+        codes, np.cumsum(is_base)[is_feature] - 1,
+        np.left_shift(1, feature_idxs[is_feature]))
+    case_classes = tables['case_class'][base_ids]
+    alnum = tables['alnum'][base_ids]
+    codes = feature_set.case_codes(case_classes, alnum, codes)
+    if case_info:
+        return tables['folded'][base_ids].tolist(), codes, \
+            (case_classes, alnum)
+    return tables['folded'][base_ids].tolist(), codes
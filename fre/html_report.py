@@ -0,0 +1,420 @@
+import base64
+import json
+import zlib
+from typing import List, Tuple
+
+import jinja2
+import numpy as np
+import pandas as pd
+
+from fre.char_level_metrics import feature_display_name, prfs_all_features
+from fre.feature_set import FeatureSet
+from fre.result_store import SCORED, SKIPPED
+from fre.text_display import display_feature_set, get_labels
+
+DEFAULT_CHARS_PER_PAGE = 5000
+# Label codes used in the compressed page data
+LABEL_CODES = {'': 0, 'fp': 1, 'fn': 2}
+STATUS_NAMES = {SCORED: 'scored', SKIPPED: 'skipped'}
+MESSAGE_REPORT_SAVED = "HTML report saved to {save_path}."
+
+environment = jinja2.Environment(autoescape=True)
+template_html_report = environment.from_string("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{{ title }}</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; margin-bottom: 1em; }
+td, th { border: 1px solid #ccc; padding: 0.2em 0.6em; text-align: right; }
+th { background-color: #eee; }
+#docs tbody tr { cursor: pointer; }
+#docs tbody tr:hover { background-color: #f4f4f4; }
+#docs tbody tr.selected { background-color: #dde; }
+.fp { background-color: green; }
+.fn { background-color: purple; }
+pre { white-space: pre-wrap; border: 1px solid #ccc; padding: 0.5em; }
+.nav { margin: 0.5em 0; }
+</style>
+</head>
+<body>
+<h1>{{ title }}</h1>
+{% for heading, table in corpus_tables %}
+<h2>{{ heading }}</h2>
+{{ table|safe }}
+{% endfor %}
+<h2>Documents</h2>
+<div class="nav">
+<button id="docs-prev">&lt;</button>
+<span id="docs-page"></span>
+<button id="docs-next">&gt;</button>
+</div>
+<table id="docs"><thead></thead><tbody></tbody></table>
+<h2 id="text-heading">Text</h2>
+<p>Select a document above to view its text. False positives are shown in
+<span class="fp">green</span> and false negatives in
+<span class="fn">purple</span>.</p>
+<div class="nav">
+<button id="text-prev">&lt;</button>
+<span id="text-page"></span>
+<button id="text-next">&gt;</button>
+<button id="text-next-error">Next page with errors</button>
+</div>
+<pre id="text"></pre>
+<script type="application/json" id="summary">{{ summary|safe }}</script>
+{% for doc_idx, doc_data in docs %}
+<script type="application/json" id="doc-{{ doc_idx }}">
+{{- doc_data|safe -}}
+</script>
+{% endfor %}
+<script>
+const ROWS_PER_PAGE = {{ rows_per_page }};
+const LABEL_CLASSES = ['', 'fp', 'fn'];
+const summary = JSON.parse(document.getElementById('summary').textContent);
+const docCache = new Map();
+const pageCache = new Map();
+let docsPage = 0;
+let current = null;
+
+function getDoc(docIdx) {
+  // Each document's page list is only parsed when it is first opened
+  if (!docCache.has(docIdx)) {
+    const el = document.getElementById('doc-' + docIdx);
+    docCache.set(docIdx, el ? JSON.parse(el.textContent) : null);
+  }
+  return docCache.get(docIdx);
+}
+
+async function inflate(b64) {
+  const bytes = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream()
+    .pipeThrough(new DecompressionStream('deflate'));
+  return JSON.parse(await new Response(stream).text());
+}
+
+async function getPage(docIdx, pageIdx) {
+  const key = docIdx + ':' + pageIdx;
+  if (!pageCache.has(key)) {
+    pageCache.set(key, await inflate(getDoc(docIdx).pages[pageIdx]));
+  }
+  return pageCache.get(key);
+}
+
+function renderDocs() {
+  const thead = document.querySelector('#docs thead');
+  const tbody = document.querySelector('#docs tbody');
+  thead.innerHTML = '';
+  const headRow = thead.insertRow();
+  for (const column of summary.columns) {
+    const th = document.createElement('th');
+    th.textContent = column;
+    headRow.appendChild(th);
+  }
+  tbody.innerHTML = '';
+  const start = docsPage * ROWS_PER_PAGE;
+  const rows = summary.rows.slice(start, start + ROWS_PER_PAGE);
+  for (const row of rows) {
+    const tr = tbody.insertRow();
+    if (current && current.docIdx === row[0]) tr.className = 'selected';
+    for (const value of row) {
+      const td = tr.insertCell();
+      td.textContent = typeof value === 'number' && !Number.isInteger(value)
+        ? value.toFixed(3) : (value === null ? 'N/A' : value);
+    }
+    tr.addEventListener('click', () => openDoc(row[0]));
+  }
+  const numPages = Math.max(1, Math.ceil(summary.rows.length / ROWS_PER_PAGE));
+  document.getElementById('docs-page').textContent =
+    'Rows ' + (start + 1) + '-' + (start + rows.length) + ' of ' +
+    summary.rows.length + ' (page ' + (docsPage + 1) + '/' + numPages + ')';
+}
+
+async function renderText() {
+  const pre = document.getElementById('text');
+  const doc = getDoc(current.docIdx);
+  document.getElementById('text-heading').textContent =
+    'Text (document ' + current.docIdx + ')';
+  pre.textContent = '';
+  if (doc === null || doc.pages.length === 0) {
+    pre.textContent = 'No text view is available for this document ' +
+      '(reference and hypothesis base characters differ).';
+    document.getElementById('text-page').textContent = '';
+    return;
+  }
+  const segments = await getPage(current.docIdx, current.pageIdx);
+  const fragment = document.createDocumentFragment();
+  for (const [label, text] of segments) {
+    if (label === 0) {
+      fragment.appendChild(document.createTextNode(text));
+    } else {
+      const span = document.createElement('span');
+      span.className = LABEL_CLASSES[label];
+      span.textContent = text;
+      fragment.appendChild(span);
+    }
+  }
+  pre.appendChild(fragment);
+  document.getElementById('text-page').textContent =
+    'Page ' + (current.pageIdx + 1) + '/' + doc.pages.length +
+    ' (' + doc.errors[current.pageIdx] + ' errors on this page)';
+}
+
+function openDoc(docIdx) {
+  current = {docIdx: docIdx, pageIdx: 0};
+  renderDocs();
+  renderText();
+}
+
+function moveText(step) {
+  if (current === null) return;
+  const numPages = getDoc(current.docIdx)?.pages.length || 0;
+  const pageIdx = current.pageIdx + step;
+  if (pageIdx >= 0 && pageIdx < numPages) {
+    current.pageIdx = pageIdx;
+    renderText();
+  }
+}
+
+function nextErrorPage() {
+  if (current === null) return;
+  const doc = getDoc(current.docIdx);
+  if (doc === null) return;
+  for (let i = current.pageIdx + 1; i < doc.pages.length; i++) {
+    if (doc.errors[i] > 0) {
+      current.pageIdx = i;
+      renderText();
+      return;
+    }
+  }
+}
+
+document.getElementById('docs-prev').addEventListener('click', () => {
+  if (docsPage > 0) { docsPage--; renderDocs(); }
+});
+document.getElementById('docs-next').addEventListener('click', () => {
+  if ((docsPage + 1) * ROWS_PER_PAGE < summary.rows.length) {
+    docsPage++;
+    renderDocs();
+  }
+});
+document.getElementById('text-prev').addEventListener('click',
+  () => moveText(-1));
+document.getElementById('text-next').addEventListener('click',
+  () => moveText(1));
+document.getElementById('text-next-error').addEventListener('click',
+  nextErrorPage);
+renderDocs();
+</script>
+</body>
+</html>
+""")
+
+
+# ====================
+def write_html_report_(evaluator,
+                       save_path: str,
+                       chars_per_page: int = DEFAULT_CHARS_PER_PAGE,
+                       rows_per_page: int = 100,
+                       include_wer: bool = True,
+                       ignore: list = None,
+                       title: str = 'Feature restoration report'):
+    """Write a self-contained HTML report for a FeatureRestorationEvaluator.
+
+    The report contains corpus-level metrics tables, a paged table of
+    per-document metrics, and a text view with false positives and false
+    negatives highlighted. Labelled text for each document is split into
+    pages of around chars_per_page characters, and each page is stored as
+    a zlib-compressed, base64-encoded JSON array of (label, text)
+    segments. Pages are only decompressed and rendered in the browser
+    when they are viewed, so that long documents can be browsed without
+    building the whole labelled document at once.
+
+    Confusion matrices (and word error rates, if include_wer is True)
+    should already have been calculated for all documents.
+    """
+
+    if ignore is None:
+        ignore = []
+    results = evaluator.results
+    feature_set = display_feature_set(evaluator.feature_set, ignore)
+    corpus_tables = [
+        (heading, corpus_prf_table(results, granularity))
+        for heading, granularity in [
+            ('Character-level metrics', 'char'),
+            ('Word-level metrics', 'word')
+        ]
+        if granularity in results.counts
+    ]
+    if include_wer:
+        wer_info = results.get_wer_info('all')
+        corpus_tables.append((
+            'Word error rate',
+            pd.DataFrame([wer_info], index=['all']).to_html(
+                float_format='{:.2f}'.format)
+        ))
+    docs = []
+    num_chars = np.zeros(len(results), dtype=np.int64)
+    for doc_idx in range(len(results)):
+        if results.status[doc_idx] != SCORED:
+            continue
+        pages, errors, num_chars[doc_idx] = doc_pages(
+            evaluator.reference[doc_idx].strip(),
+            evaluator.hypothesis[doc_idx].strip(),
+            feature_set, ignore, chars_per_page
+        )
+        docs.append((doc_idx, to_script_json(
+            {'pages': pages, 'errors': errors})))
+    summary = doc_summary(results, num_chars, include_wer)
+    html = template_html_report.render(
+        title=title,
+        corpus_tables=corpus_tables,
+        summary=to_script_json(summary),
+        docs=docs,
+        rows_per_page=rows_per_page
+    )
+    with open(save_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    print(MESSAGE_REPORT_SAVED.format(save_path=save_path))
+
+
+# ====================
+def corpus_prf_table(results, granularity: str) -> str:
+    """Get an HTML table of precision, recall, and F-score for each
+    feature over all documents."""
+
+    cms = results.get_cms('all', granularity)
+    prfs = prfs_all_features(cms, display_names=True)
+    return pd.DataFrame(prfs).transpose().to_html(
+        float_format='{:.3f}'.format)
+
+
+# ====================
+def doc_summary(results, num_chars: np.ndarray, include_wer: bool) -> dict:
+    """Get column names and a row for each document for the per-document
+    table, with the status, length, F-score for each feature and overall,
+    and WER."""
+
+    columns, data = results.metric_arrays('char', include_wer)
+    keep = [
+        i for i, (group, metric) in enumerate(columns)
+        if metric == 'F-score' or (group, metric) == ('WER', 'wer')
+    ]
+    names = [
+        'WER' if columns[i][0] == 'WER'
+        else f"F-score: {feature_display_name(columns[i][0])}"
+        for i in keep
+    ]
+    values = np.stack([data[i] for i in keep], axis=1).round(4)
+    # NaN is not valid JSON
+    values = values.astype(object)
+    values[pd.isna(values)] = None
+    status = [STATUS_NAMES.get(s, 'not scored') for s in results.status]
+    rows = [
+        [doc_idx, status[doc_idx], int(num_chars[doc_idx])] + row
+        for doc_idx, row in enumerate(values.tolist())
+    ]
+    return {
+        'columns': ['Document', 'Status', 'Characters'] + names,
+        'rows': rows
+    }
+
+
+# ====================
+def doc_pages(ref: str,
+              hyp: str,
+              feature_set: FeatureSet,
+              ignore: list,
+              chars_per_page: int) -> Tuple[List[str], List[int], int]:
+    """Get the compressed pages of labelled text for a document.
+
+    Returns:
+      Tuple[List[str], List[int], int]:
+        The compressed pages, the number of false positives and false
+        negatives on each page, and the number of characters in the
+        labelled text. If the base characters of the reference and
+        hypothesis differ, no pages are returned.
+    """
+
+    labels = get_labels(ref, hyp, feature_set, ignore)
+    if labels is None:
+        return [], [], 0
+    pages = []
+    errors = []
+    num_chars = 0
+    for page in paginate(labels, chars_per_page):
+        segments = merge_segments(page)
+        pages.append(compress_page(segments))
+        errors.append(sum(1 for _, label, _ in page if label))
+        num_chars += sum(len(text) for text, _ in segments)
+    return pages, errors, num_chars
+
+
+# ====================
+def paginate(labels: List[Tuple[str, str, bool]],
+             chars_per_page: int) -> List[List[Tuple[str, str, bool]]]:
+    """Split labelled entries into pages of at least chars_per_page
+    characters (except for the last page), breaking after whitespace
+    where possible."""
+
+    pages = []
+    start = 0
+    page_len = 0
+    for i, (text, _, _) in enumerate(labels):
+        page_len += len(text)
+        if page_len >= chars_per_page and text.isspace():
+            pages.append(labels[start:i+1])
+            start = i + 1
+            page_len = 0
+        elif page_len >= 2 * chars_per_page:
+            # No whitespace for a long time, so break anyway
+            pages.append(labels[start:i+1])
+            start = i + 1
+            page_len = 0
+    if start < len(labels) or not pages:
+        pages.append(labels[start:])
+    return pages
+
+
+# ====================
+def merge_segments(labels: List[Tuple[str, str, bool]]) \
+        -> List[Tuple[str, int]]:
+    """Merge consecutive entries with the same label into (text, label
+    code) segments."""
+
+    segments = []
+    for text, label, _ in labels:
+        code = LABEL_CODES[label]
+        if segments and segments[-1][1] == code:
+            segments[-1][0].append(text)
+        else:
+            segments.append(([text], code))
+    return [(''.join(texts), code) for texts, code in segments]
+
+
+# ====================
+def compress_page(segments: List[Tuple[str, int]]) -> str:
+    """Encode a page of segments as zlib-compressed, base64-encoded JSON
+    of [label code, text] pairs."""
+
+    page_json = json.dumps(
+        [[code, text] for text, code in segments],
+        ensure_ascii=False, separators=(',', ':'))
+    compressed = zlib.compress(page_json.encode('utf-8'), 9)
+    return base64.b64encode(compressed).decode('ascii')
+
+
+# ====================
+def decompress_page(page: str) -> List[Tuple[str, int]]:
+    """Decode a page encoded by compress_page into (text, label code)
+    segments."""
+
+    page_json = zlib.decompress(base64.b64decode(page)).decode('utf-8')
+    return [(text, code) for code, text in json.loads(page_json)]
+
+
+# ====================
+def to_script_json(data) -> str:
+    """Encode data as JSON that can be embedded in a script element."""
+
+    return json.dumps(data, separators=(',', ':')).replace('</', '<\\/')
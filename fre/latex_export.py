@@ -0,0 +1,240 @@
+import os
+import re
+from typing import TYPE_CHECKING, Dict, List
+
+import jinja2
+import numpy as np
+
+from fre.char_level_metrics import feature_display_name
+from fre.prf import prf_arrays
+from fre.result_store import PRF_COLUMNS
+from fre.text_display import display_feature_set, get_labels, latex_snippet
+
+if TYPE_CHECKING:
+    from fre.feature_restoration_evaluator import \
+        FeatureRestorationEvaluator
+
+MESSAGE_FILES_SAVED = "Saved {num_files} LaTeX files to {output_dir}."
+ERROR_METRIC = """
+metrics must be a list of metrics from {metrics}."""
+ERROR_FEATURES = """
+All evaluators must have the same features. System '{name}' has features \
+{features}, but system '{first_name}' has features {first_features}."""
+LATEX_SPECIAL_CHARS = {
+    '\\': r'\textbackslash{}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}'
+}
+LATEX_SPECIAL_CHARS_RE = re.compile(
+    '|'.join(re.escape(c) for c in LATEX_SPECIAL_CHARS))
+
+
+# ====================
+def fmt(value: float) -> str:
+    """Format a metric for LaTeX, with 'N/A' for undefined values."""
+
+    return 'N/A' if np.isnan(value) else f"{value:.2f}"
+
+
+# ====================
+def head(text: str) -> str:
+    """Wrap a column heading in the \\head command."""
+
+    return f"\\head{{{text}}}"
+
+
+# ====================
+def latex_escape(text: str) -> str:
+    """Escape characters with special meanings in LaTeX."""
+
+    return LATEX_SPECIAL_CHARS_RE.sub(
+        lambda m: LATEX_SPECIAL_CHARS[m.group()], text)
+
+
+# Templates are compiled once, when the module is imported, and reused for
+# every table rendered.
+environment = jinja2.Environment()
+environment.filters['fmt'] = fmt
+environment.filters['head'] = head
+template_latex_prfs = environment.from_string("""
+{% raw %}\\hline
+& \\head{Precision} & \\head{Recall} & \\head{F-score}
+\\hline{% endraw %}
+{% for feature, scores in prfs -%}
+{{ feature }} & {{ scores|map('fmt')|join(' & ') }}
+{% endfor %}
+""")
+template_latex_comparison = environment.from_string(r"""
+\begin{tabular}{l|{% for _ in features %}r{% endfor %}}
+\hline
+& {{ features|map('head')|join(' & ') }}\\
+\hline
+{% for system, values in rows -%}
+{{ system }} & {{ values|map('fmt')|join(' & ') }}\\
+{% endfor -%}
+\hline
+\end{tabular}
+""")
+template_latex_wer = environment.from_string(
+    r"\textbf{WER:} {{ wer|fmt }}\%\\")
+
+
+# ====================
+def export_latex(systems: Dict[str, 'FeatureRestorationEvaluator'],
+                 output_dir: str,
+                 granularity: str = 'char',
+                 metrics: List[str] = None,
+                 include_wer: bool = True,
+                 snippet_docs: List[int] = None,
+                 start_char: int = 0,
+                 chars_per_row: int = None,
+                 num_rows: int = None,
+                 ignore: list = None) -> List[str]:
+    """Render LaTeX tables and text display snippets for any number of
+    systems in one pass and save them to files.
+
+    The following files are written to output_dir, where <system> is the
+    system name with any characters that are not safe in file names
+    replaced by underscores:
+
+    - prfs_<system>.tex: Precision, recall, and F-score for each feature
+      (as shown by show_prfs with for_latex=True)
+    - wer_<system>.tex: Word error rate (if include_wer is True)
+    - comparison_<metric>.tex: A table with a row for each system and a
+      column for each feature, for each metric in metrics
+    - text_<system>_<doc_idx>.tex: A text display snippet (as shown by
+      show_text_display with for_latex=True) for each document in
+      snippet_docs
+
+    Metrics for all systems are computed in a single vectorized pass over
+    the stored counts, and each table is rendered from a template that is
+    compiled once.
+
+    Args:
+      systems (Dict[str, FeatureRestorationEvaluator]):
+        A dictionary mapping system names (e.g. 'en-system-a') to
+        evaluators. All evaluators must have the same features.
+      output_dir (str):
+        The directory to save files to. Created if it does not exist.
+      granularity (str, optional):
+        Either 'char' or 'word'. Defaults to 'char'.
+      metrics (List[str], optional):
+        The metrics to write comparison tables for. If None, a table is
+        written for F-score only. Defaults to None.
+      include_wer (bool, optional):
+        Whether or not to write WER files and include WER in comparison
+        tables. Defaults to True.
+      snippet_docs (List[int], optional):
+        Indices of documents to write text display snippets for. If
+        None, no snippets are written. Defaults to None.
+      start_char (int, optional):
+        The character to start text display snippets from. Defaults to 0.
+      chars_per_row (int, optional):
+        The number of characters per row in text display snippets. If
+        None, each snippet is a single row. Defaults to None.
+      num_rows (int, optional):
+        The number of rows in text display snippets. Defaults to None.
+      ignore (list, optional):
+        A list of features to ignore in text display snippets.
+        Defaults to None.
+
+    Returns:
+      List[str]:
+        The paths of the files written.
+
+    Raises:
+      ValueError:
+        metrics must be a list of metrics from PRF_COLUMNS.
+      ValueError:
+        All evaluators must have the same features.
+    """
+
+    if metrics is None:
+        metrics = ['F-score']
+    if not set(metrics) <= set(PRF_COLUMNS):
+        raise ValueError(ERROR_METRIC.format(metrics=PRF_COLUMNS))
+    if snippet_docs is None:
+        snippet_docs = []
+    if ignore is None:
+        ignore = []
+    files = {}
+    names = [system_file_name(name) for name in systems]
+    evaluators = list(systems.values())
+    first_name = next(iter(systems))
+    for name, evaluator in systems.items():
+        if evaluator.features != evaluators[0].features:
+            raise ValueError(ERROR_FEATURES.format(
+                name=name, features=evaluator.features,
+                first_name=first_name,
+                first_features=evaluators[0].features))
+    for evaluator in evaluators:
+        evaluator.get_cms_all()
+        if include_wer:
+            evaluator.get_wer_info_all()
+    # Corpus-level counts for every system and feature, plus 'all', in a
+    # single array of shape (num_systems, num_features + 1, 2, 2)
+    counts = np.stack([
+        e.results.get_counts('all', granularity) for e in evaluators])
+    counts = np.concatenate(
+        [counts, counts.sum(axis=1, keepdims=True)], axis=1)
+    prfs = np.stack(prf_arrays(counts), axis=2)
+    features = evaluators[0].features + ['all']
+    feature_names = [feature_display_name(f, latex=True) for f in features]
+    wers = [
+        e.results.get_wer_info('all')['wer'] if include_wer else np.nan
+        for e in evaluators
+    ]
+    for i, name in enumerate(names):
+        files[f'prfs_{name}.tex'] = template_latex_prfs.render(
+            prfs=zip(feature_names, prfs[i].tolist()))
+        if include_wer:
+            files[f'wer_{name}.tex'] = template_latex_wer.render(wer=wers[i])
+    system_names = [latex_escape(str(name)) for name in systems]
+    for metric in metrics:
+        values = prfs[:, :, PRF_COLUMNS.index(metric)]
+        columns = feature_names
+        if include_wer:
+            values = np.concatenate(
+                [values, np.array(wers)[:, np.newaxis]], axis=1)
+            columns = columns + ['WER']
+        metric_name = system_file_name(metric)
+        files[f'comparison_{metric_name}.tex'] = \
+            template_latex_comparison.render(
+                features=columns, rows=zip(system_names, values.tolist()))
+    for name, evaluator in zip(names, evaluators):
+        feature_set = display_feature_set(evaluator.feature_set, ignore)
+        for doc_idx in snippet_docs:
+            labels = get_labels(
+                evaluator.reference[doc_idx].strip(),
+                evaluator.hypothesis[doc_idx].strip(),
+                feature_set, ignore
+            )
+            if labels is None:
+                continue
+            files[f'text_{name}_{doc_idx}.tex'] = latex_snippet(
+                labels, start_char, chars_per_row, num_rows)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for file_name, latex in files.items():
+        path = os.path.join(output_dir, file_name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(latex)
+        paths.append(path)
+    print(MESSAGE_FILES_SAVED.format(
+        num_files=len(paths), output_dir=output_dir))
+    return paths
+
+
+# ====================
+def system_file_name(name: str) -> str:
+    """Get a string that is safe to use in a file name from a system
+    name."""
+
+    return re.sub(r'[^\w\-.]', '_', str(name))
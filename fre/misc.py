@@ -1,5 +1,5 @@
 import pickle
-from typing import Any, Union
+from typing import Any, Callable, List, Union
 
 import pandas as pd
 from tqdm import tqdm as non_notebook_tqdm
@@ -12,18 +12,23 @@ except ModuleNotFoundError:
 
 from uniseg.graphemecluster import grapheme_clusters
 
+from fre.corpus import ArrowCorpus, Corpus, pa
+
 Int_or_Str = Union[int, str]
 Str_or_List = Union[str, list]
-Str_or_List_or_Series = Union[str, list, pd.Series]
+Str_or_List_or_Series = Union[str, list, pd.Series, Corpus]
 
 CAPS = 'CAPS'
+CAPS_INITIAL = 'CAPS_INITIAL'
+CAPS_ALL = 'CAPS_ALL'
+CASE_FEATURES = [CAPS, CAPS_INITIAL, CAPS_ALL]
 WARNING_DIFFERENT_CHARS = """Different characters found between reference and \
 hypothesis strings in document index: {doc_idx}! \
 (Reference: "{ref_str}"; Hypothesis: "{hyp_str}"). \
 Skipping this document (returning None)."""
 ERROR_REF_OR_HYP_TYPE = """
 reference and hypothesis parameters must have type list, str, \
-or pandas.Series"""
+pandas.Series, a pyarrow array, or Corpus"""
 
 
 # ====================
@@ -37,15 +42,20 @@ def len_gclust(str_: str) -> int:
 def list_gclust(str_: str) -> list:
     """Return a list of grapheme clusters in the string."""
 
+    # Every ASCII character except CR in CRLF is its own grapheme
+    # cluster, so segmentation can be skipped for most English text
+    if str_.isascii() and '\r\n' not in str_:
+        return list(str_)
     return list(grapheme_clusters(str_))
 
 
 # ====================
 def check_same_char(next_char: dict, chars: dict,
-                    doc_idx: str = 'UNKNOWN') -> bool:
+                    doc_idx: str = 'UNKNOWN',
+                    fold: Callable[[str], str] = str.lower) -> bool:
 
     try:
-        assert next_char['ref'].lower() == next_char['hyp'].lower()
+        assert fold(next_char['ref']) == fold(next_char['hyp'])
         return True
     except AssertionError:
         error_msg = WARNING_DIFFERENT_CHARS.format(
@@ -67,12 +77,38 @@ def str_or_list_or_series_to_list(
         return [input_]
     elif isinstance(input_, pd.Series):
         return input_.to_list()
-    elif isinstance(input_, list):
+    elif isinstance(input_, (list, Corpus)):
         return input_
+    elif pa is not None and isinstance(input_, (pa.Array, pa.ChunkedArray)):
+        return ArrowCorpus(input_)
     else:
         raise TypeError(ERROR_REF_OR_HYP_TYPE)
 
 
+# ====================
+def get_case_features(capitalization: Union[bool, str]) -> list:
+    """Get the case features to assess for a capitalization setting: CAPS
+    if capitalization is True, CAPS_INITIAL and CAPS_ALL if it is 'word',
+    or none if it is False."""
+
+    if capitalization == 'word':
+        return [CAPS_INITIAL, CAPS_ALL]
+    elif capitalization:
+        return [CAPS]
+    else:
+        return []
+
+
+# ====================
+def get_capitalization(features: List[str]) -> Union[bool, str]:
+    """Get the capitalization setting that gives the case features in a
+    list of features (the reverse of get_case_features)."""
+
+    if CAPS_INITIAL in features or CAPS_ALL in features:
+        return 'word'
+    return CAPS in features
+
+
 # ====================
 def get_tqdm() -> type:
     """Return tqdm.notebook.tqdm if code is being run from a notebook,
@@ -85,6 +121,21 @@ def get_tqdm() -> type:
     return tqdm_
 
 
+# ====================
+def size_progress(total: int):
+    """Get a progress bar that counts characters rather than documents, so
+    that its rate and time remaining are meaningful when documents vary
+    widely in length.
+
+    Args:
+      total (int):
+        The total size of the documents to be processed (see
+        fre.corpus.doc_sizes).
+    """
+
+    return get_tqdm()(total=int(total), unit='char', unit_scale=True)
+
+
 # ====================
 def is_running_from_ipython():
     """Determine whether or not the current script is being run from
@@ -98,6 +149,21 @@ def is_running_from_ipython():
         return False
 
 
+# ====================
+def is_running_in_notebook() -> bool:
+    """Determine whether or not the current script is being run from a
+    notebook kernel (as opposed to a terminal, or a terminal IPython
+    session), where HTML can be displayed"""
+
+    try:
+        from IPython import get_ipython     # type: ignore
+    except ModuleNotFoundError:
+        return False
+    shell = get_ipython()
+    return shell is not None \
+        and type(shell).__name__ == 'ZMQInteractiveShell'
+
+
 # ====================
 def display_or_print(obj: Any):
     """'print' or 'display' an object, depending on whether the current
@@ -0,0 +1,402 @@
+import multiprocessing
+import pickle
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from fre.char_level_metrics import get_doc_counts
+from fre.corpus import Corpus
+from fre.misc import size_progress
+from fre.result_store import NOT_SCORED, SCORED, SKIPPED
+
+# The number of chunks of similar size that each worker's share of the
+# documents is split into, so that workers that finish early can take
+# work from the others
+CHUNKS_PER_WORKER = 4
+MESSAGE_SHARING_CORPUS = "Copying corpus to shared memory..."
+MESSAGE_SCORING_IN_PARALLEL = """Getting confusion matrices for {num_docs} \
+documents with {num_workers} workers..."""
+ERROR_POOL_CLOSED = """
+This WorkerPool has been closed."""
+
+# Shared memory attached in each worker process, by name
+worker_shared_memory: Dict[str, shared_memory.SharedMemory] = {}
+# The most recent job in each worker process, as (job_id, job state)
+worker_job: list = [None, None]
+
+
+# ====================
+class SharedArray:
+    """A NumPy array in a block of shared memory that can be attached to
+    by name in other processes."""
+
+    # ====================
+    def __init__(self, shape: tuple, dtype):
+        """Initializes an instance of SharedArray, creating a new block of
+        shared memory filled with zeros.
+
+        Args:
+          shape (tuple):
+            The shape of the array.
+          dtype (np.dtype):
+            The data type of the array.
+        """
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+        size = max(int(np.prod(self.shape)) * np.dtype(dtype).itemsize, 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.shm.buf)
+        self.array[...] = 0
+
+    # ====================
+    def spec(self) -> Tuple[str, tuple, str]:
+        """Get the (name, shape, dtype) needed to attach to the array."""
+
+        return (self.shm.name, self.shape, self.dtype)
+
+    # ====================
+    def release(self):
+        """Close and unlink the shared memory."""
+
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+# ====================
+class SharedCorpus(Corpus):
+    """A corpus stored in shared memory as a single UTF-8 buffer and an
+    array of byte offsets, so that worker processes can read documents
+    without the corpus being pickled and sent to them."""
+
+    # ====================
+    def __init__(self, docs):
+        """Initializes an instance of SharedCorpus by copying documents to
+        shared memory.
+
+        Documents are encoded twice (once to get their lengths, and once
+        to copy them) so that the corpus is never held in memory as
+        bytes in addition to the shared buffer.
+
+        Args:
+          docs (Union[List[str], Corpus]):
+            The documents.
+        """
+
+        lengths = np.fromiter(
+            (len(doc.encode('utf-8')) for doc in docs),
+            dtype=np.int64, count=len(docs))
+        self.offsets = SharedArray((len(docs) + 1,), np.int64)
+        np.cumsum(lengths, out=self.offsets.array[1:])
+        self.buffer = SharedArray((int(self.offsets.array[-1]),), np.uint8)
+        buf = self.buffer.shm.buf
+        for doc_idx, doc in enumerate(docs):
+            start, end = self.offsets.array[doc_idx:doc_idx + 2]
+            buf[start:end] = doc.encode('utf-8')
+
+    # ====================
+    def spec(self) -> tuple:
+        """Get the specs needed to attach to the corpus in another
+        process."""
+
+        return (self.buffer.spec(), self.offsets.spec())
+
+    # ====================
+    def __len__(self) -> int:
+
+        return len(self.offsets.array) - 1
+
+    # ====================
+    def get_doc(self, doc_idx: int) -> str:
+
+        return shared_doc(
+            self.buffer.shm.buf, self.offsets.array, doc_idx)
+
+    # ====================
+    def release(self):
+        """Close and unlink the shared memory."""
+
+        self.buffer.release()
+        self.offsets.release()
+
+
+# ====================
+class WorkerPool:
+    """A pool of worker processes for getting confusion matrices for the
+    documents of FeatureRestorationEvaluator objects in parallel.
+
+    Reference and hypothesis corpora are copied into shared memory once
+    per evaluator and kept there until the pool is closed, and workers
+    write counts for each document straight into shared result arrays, so
+    neither corpora nor results are pickled. Worker processes are started
+    once and reused for every call to score.
+
+    Documents are scheduled by size (the total length of their reference
+    and hypothesis versions) rather than by count: the largest documents
+    are sent out first, in chunks of similar total size, so that a few
+    very long documents do not leave one worker busy after the others
+    have finished, and progress is reported in characters."""
+
+    # ====================
+    def __init__(self, num_workers: int = None, chunk_size: int = 64):
+        """Initializes an instance of WorkerPool.
+
+        Args:
+          num_workers (int, optional):
+            The number of worker processes. If None, the number of CPUs
+            is used. Defaults to None.
+          chunk_size (int, optional):
+            The maximum number of documents sent to a worker at a time.
+            Chunks are also limited in total size, so a chunk of long
+            documents has fewer. Defaults to 64.
+        """
+
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        # Start the resource tracker before the workers are forked, so
+        # that they share it instead of each starting their own, which
+        # would unlink the shared memory they attach to when they exit
+        resource_tracker.ensure_running()
+        self.pool = multiprocessing.Pool(self.num_workers)
+        # Shared corpora for each evaluator, keyed by the ids of its
+        # reference and hypothesis. The corpora themselves are kept so
+        # that their ids are not reused.
+        self.shared_corpora = {}
+        self.num_jobs = 0
+
+    # ====================
+    def __enter__(self) -> 'WorkerPool':
+
+        return self
+
+    # ====================
+    def __exit__(self, *args):
+
+        self.close()
+
+    # ====================
+    def share(self, reference, hypothesis) \
+            -> Tuple[SharedCorpus, SharedCorpus]:
+        """Get shared memory copies of reference and hypothesis corpora,
+        copying them to shared memory if they have not been shared
+        already."""
+
+        key = (id(reference), id(hypothesis))
+        if key not in self.shared_corpora:
+            print(MESSAGE_SHARING_CORPUS)
+            self.shared_corpora[key] = (
+                reference, hypothesis,
+                SharedCorpus(reference), SharedCorpus(hypothesis)
+            )
+        return self.shared_corpora[key][2:]
+
+    # ====================
+    def score(self, evaluator, doc_idxs: List[int] = None):
+        """Get confusion matrices for documents of an evaluator in
+        parallel and store them in its result store.
+
+        Args:
+          evaluator (FeatureRestorationEvaluator):
+            The evaluator.
+          doc_idxs (List[int], optional):
+            The indices of the documents to score. If None, all documents
+            that have not yet been scored are scored. Defaults to None.
+        """
+
+        if self.pool is None:
+            raise ValueError(ERROR_POOL_CLOSED)
+        results = evaluator.results
+        if doc_idxs is None:
+            doc_idxs = np.flatnonzero(results.status == NOT_SCORED)
+        doc_idxs = np.asarray(doc_idxs, dtype=np.int64)
+        if len(doc_idxs) == 0:
+            return
+        ref, hyp = self.share(evaluator.reference, evaluator.hypothesis)
+        counts = {
+            granularity: SharedArray(array.shape, array.dtype)
+            for granularity, array in results.counts.items()
+        }
+        counts['edits'] = SharedArray(
+            results.edit_counts.shape, results.edit_counts.dtype)
+        if results.class_counts is not None:
+            counts['class'] = SharedArray(
+                results.class_counts.shape, results.class_counts.dtype)
+        status = SharedArray(results.status.shape, results.status.dtype)
+        self.num_jobs += 1
+        job = pickle.dumps({
+            'ref': ref.spec(),
+            'hyp': hyp.spec(),
+            'counts': {k: v.spec() for k, v in counts.items()},
+            'status': status.spec(),
+            'feature_set': evaluator.feature_set,
+            'word_level': evaluator.word_level,
+            'alignment': evaluator.alignment,
+            'class_features': evaluator.class_features
+        })
+        sizes = evaluator.get_doc_sizes()[doc_idxs]
+        max_size = -(-int(sizes.sum()) // (
+            self.num_workers * CHUNKS_PER_WORKER))
+        tasks = [
+            (self.num_jobs, job, doc_idxs[chunk], int(sizes[chunk].sum()))
+            for chunk in size_chunks(sizes, self.chunk_size, max_size)
+        ]
+        print(MESSAGE_SCORING_IN_PARALLEL.format(
+            num_docs=len(doc_idxs), num_workers=self.num_workers))
+        try:
+            with size_progress(sizes.sum()) as progress:
+                for chunk_alignment_info, chunk_size in \
+                        self.pool.imap_unordered(score_chunk, tasks):
+                    evaluator.alignment_info.update(chunk_alignment_info)
+                    progress.update(chunk_size)
+            results.set_docs(
+                doc_idxs,
+                {k: v.array[doc_idxs] for k, v in counts.items()},
+                status.array[doc_idxs]
+            )
+        finally:
+            for array in list(counts.values()) + [status]:
+                array.release()
+
+    # ====================
+    def close(self):
+        """Stop the worker processes and release all shared memory."""
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for _, _, ref, hyp in self.shared_corpora.values():
+            ref.release()
+            hyp.release()
+        self.shared_corpora = {}
+
+
+# ====================
+def size_chunks(sizes: np.ndarray,
+                max_docs: int,
+                max_size: int) -> List[np.ndarray]:
+    """Split documents into chunks, largest documents first.
+
+    Args:
+      sizes (np.ndarray):
+        The size of each document.
+      max_docs (int):
+        The maximum number of documents in a chunk.
+      max_size (int):
+        The maximum total size of a chunk. Documents larger than this
+        are put in chunks of their own.
+
+    Returns:
+      List[np.ndarray]:
+        The positions in sizes of the documents in each chunk, in
+        decreasing order of size.
+    """
+
+    order = np.argsort(-sizes, kind='stable')
+    chunks = []
+    start = 0
+    chunk_size = 0
+    for end, size in enumerate(sizes[order].tolist()):
+        if end > start and (end - start == max_docs
+                            or chunk_size + size > max_size):
+            chunks.append(order[start:end])
+            start = end
+            chunk_size = 0
+        chunk_size += size
+    if start < len(order):
+        chunks.append(order[start:])
+    return chunks
+
+
+# ====================
+def shared_doc(buf, offsets: np.ndarray, doc_idx: int) -> str:
+    """Decode a document from a UTF-8 buffer and array of offsets."""
+
+    start, end = offsets[doc_idx:doc_idx + 2]
+    return bytes(buf[start:end]).decode('utf-8')
+
+
+# ====================
+def attach_array(spec: Tuple[str, tuple, str]) -> np.ndarray:
+    """Attach to a SharedArray in a worker process."""
+
+    name, shape, dtype = spec
+    if name not in worker_shared_memory:
+        # Worker processes share the resource tracker of the process that
+        # created the shared memory, which is responsible for unlinking it
+        worker_shared_memory[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype, buffer=worker_shared_memory[name].buf)
+
+
+# ====================
+def detach_arrays(keep: List[str]):
+    """Close shared memory in a worker process that is not in keep."""
+
+    for name in list(worker_shared_memory):
+        if name not in keep:
+            worker_shared_memory.pop(name).close()
+
+
+# ====================
+def get_worker_job(job_id: int, job: bytes) -> dict:
+    """Get the state for a job in a worker process, attaching to its
+    shared memory the first time the job is seen."""
+
+    if worker_job[0] != job_id:
+        job = pickle.loads(job)
+        specs = [*job['ref'], *job['hyp'], job['status'],
+                 *job['counts'].values()]
+        # Close shared memory from previous jobs that this job does not
+        # use (e.g. result arrays, which are unlinked after each job)
+        worker_job[1] = None
+        detach_arrays([name for name, _, _ in specs])
+        state = {
+            key: job[key]
+            for key in ['feature_set', 'word_level', 'alignment',
+                        'class_features']
+        }
+        for side in ['ref', 'hyp']:
+            state[side] = tuple(attach_array(spec) for spec in job[side])
+        state['counts'] = {
+            key: attach_array(spec) for key, spec in job['counts'].items()}
+        state['status'] = attach_array(job['status'])
+        worker_job[0] = job_id
+        worker_job[1] = state
+    return worker_job[1]
+
+
+# ====================
+def score_chunk(task: tuple) -> Tuple[dict, int]:
+    """Get confusion matrix counts for a chunk of documents in a worker
+    process and write them to the shared result arrays.
+
+    Returns:
+      Tuple[dict, int]:
+        Alignment info for each document in the chunk (if the evaluator
+        uses alignment), and the total size of the documents in the
+        chunk.
+    """
+
+    job_id, job, doc_idxs, chunk_size = task
+    state = get_worker_job(job_id, job)
+    alignment_info = {}
+    for doc_idx in doc_idxs:
+        ref = shared_doc(*state['ref'], doc_idx).strip()
+        hyp = shared_doc(*state['hyp'], doc_idx).strip()
+        counts, alignment_info_ = get_doc_counts(
+            ref, hyp, state['feature_set'], doc_idx,
+            word_level=state['word_level'],
+            alignment=state['alignment'],
+            class_features=state['class_features']
+        )
+        if alignment_info_ is not None:
+            alignment_info[int(doc_idx)] = alignment_info_
+        if counts is None:
+            state['status'][doc_idx] = SKIPPED
+            continue
+        for key, array in state['counts'].items():
+            array[doc_idx] = counts[key]
+        state['status'][doc_idx] = SCORED
+    return alignment_info, chunk_size
@@ -0,0 +1,294 @@
+import argparse
+import json
+from typing import Dict, List
+
+import numpy as np
+
+from fre.char_level_metrics import show_error_rates_table, show_prfs
+from fre.result_store import ResultStore
+from fre.word_error_rate import show_wer_info_table
+
+FORMAT_VERSION = 1
+MESSAGE_SAVED = "Saved partial results for {num_docs:,} documents to {path}."
+ERROR_SETTINGS = """
+Partial results can only be merged if they were produced with the same \
+settings. Got {settings_a} and {settings_b}."""
+ERROR_OVERLAPPING_DOCS = """
+Partial results overlap: document indices {doc_idxs} appear in more than \
+one set of partial results."""
+ERROR_NUM_DOCS = """
+Partial results were produced for corpora of different sizes ({num_docs})."""
+ERROR_DOC_IDXS = """
+doc_idxs must have one index for each document in the evaluator \
+({num_docs:,})."""
+ERROR_DOC_IDX_RANGE = """
+Document indices {doc_idxs} are out of range. Indices must be non-negative \
+and less than the number of documents in the corpus ({num_docs})."""
+ERROR_FORMAT_VERSION = """
+{path} was saved with an unsupported format version ({version})."""
+ERROR_NOTHING_TO_MERGE = """
+At least one set of partial results is required."""
+
+
+# ====================
+class PartialResults:
+    """Counts for a subset of the documents of a corpus (e.g. one shard of
+    a test set that is split across several machines), with the global
+    index of each document, that can be saved compactly and merged with
+    the partial results for other subsets.
+
+    All counts are integers, so merging is exact, and merged results are
+    sorted by document index, so merging is associative and the order in
+    which shards are merged does not matter. Corpus totals are computed
+    from the merged counts in the same way as for a single evaluator."""
+
+    # ====================
+    def __init__(self,
+                 doc_idxs: np.ndarray,
+                 arrays: Dict[str, np.ndarray],
+                 settings: dict,
+                 num_docs: int = None):
+        """Initializes an instance of PartialResults. Use from_evaluator,
+        load, or merge to create PartialResults.
+
+        Args:
+          doc_idxs (np.ndarray):
+            The global index of each document.
+          arrays (Dict[str, np.ndarray]):
+            Result store arrays for the documents, in the order of
+            doc_idxs (see store_arrays).
+          settings (dict):
+            The features and settings the results were produced with.
+          num_docs (int, optional):
+            The number of documents in the whole corpus, if known.
+            Defaults to None.
+
+        Raises:
+          ValueError:
+            Document indices must be non-negative, and less than num_docs
+            if num_docs is given.
+        """
+
+        self.doc_idxs = np.asarray(doc_idxs, dtype=np.int64)
+        out_of_range = self.doc_idxs < 0
+        if num_docs is not None:
+            out_of_range |= self.doc_idxs >= num_docs
+        if out_of_range.any():
+            raise ValueError(ERROR_DOC_IDX_RANGE.format(
+                doc_idxs=self.doc_idxs[out_of_range][:10].tolist(),
+                num_docs='unknown' if num_docs is None else num_docs))
+        self.arrays = arrays
+        self.settings = settings
+        self.num_docs = num_docs
+
+    # ====================
+    @classmethod
+    def from_evaluator(cls,
+                       evaluator,
+                       doc_offset: int = None,
+                       doc_idxs: List[int] = None,
+                       num_docs: int = None) -> 'PartialResults':
+        """Get partial results for all documents of an evaluator.
+
+        Args:
+          evaluator (FeatureRestorationEvaluator):
+            The evaluator. Counts should already have been calculated.
+          doc_offset (int, optional):
+            The global index of the first document of the evaluator. If
+            None, the start attribute of the reference corpus (e.g. of a
+            TextFileCorpus shard) is used, or 0 if it has none. Defaults
+            to None.
+          doc_idxs (List[int], optional):
+            The global index of every document of the evaluator, for
+            shards that are not contiguous ranges of documents. Overrides
+            doc_offset. Defaults to None.
+          num_docs (int, optional):
+            The number of documents in the whole corpus, if known.
+            Defaults to None.
+
+        Returns:
+          PartialResults:
+            The partial results.
+        """
+
+        results = evaluator.results
+        if doc_idxs is None:
+            if doc_offset is None:
+                doc_offset = getattr(evaluator.reference, 'start', 0)
+            doc_idxs = doc_offset + np.arange(len(results), dtype=np.int64)
+        elif len(doc_idxs) != len(results):
+            raise ValueError(ERROR_DOC_IDXS.format(num_docs=len(results)))
+        settings = {
+            'features': results.features,
+            'granularities': results.granularities,
+            'class_features': results.class_features,
+            'alignment': evaluator.alignment,
+            'language': evaluator.language
+        }
+        return cls(doc_idxs, store_arrays(results), settings, num_docs)
+
+    # ====================
+    def save(self, path: str):
+        """Save the partial results to a compressed .npz file."""
+
+        metadata = {
+            'format_version': FORMAT_VERSION,
+            'settings': self.settings,
+            'num_docs': self.num_docs
+        }
+        np.savez_compressed(
+            path, doc_idxs=self.doc_idxs,
+            metadata=np.array(json.dumps(metadata)), **self.arrays)
+        print(MESSAGE_SAVED.format(num_docs=len(self.doc_idxs), path=path))
+
+    # ====================
+    @classmethod
+    def load(cls, path: str) -> 'PartialResults':
+        """Load partial results saved with save."""
+
+        with np.load(path) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata['format_version'] != FORMAT_VERSION:
+                raise ValueError(ERROR_FORMAT_VERSION.format(
+                    path=path, version=metadata['format_version']))
+            arrays = {
+                key: data[key] for key in data.files
+                if key not in ['doc_idxs', 'metadata']
+            }
+            return cls(data['doc_idxs'], arrays, metadata['settings'],
+                       metadata['num_docs'])
+
+    # ====================
+    @classmethod
+    def merge(cls, partials: List['PartialResults']) -> 'PartialResults':
+        """Merge any number of partial results for disjoint sets of
+        documents.
+
+        Raises:
+          ValueError:
+            Partial results were produced with different settings, or
+            include the same document more than once.
+        """
+
+        if not partials:
+            raise ValueError(ERROR_NOTHING_TO_MERGE)
+        first = partials[0]
+        for partial in partials[1:]:
+            if partial.settings != first.settings:
+                raise ValueError(ERROR_SETTINGS.format(
+                    settings_a=first.settings, settings_b=partial.settings))
+        num_docs = {p.num_docs for p in partials} - {None}
+        if len(num_docs) > 1:
+            raise ValueError(ERROR_NUM_DOCS.format(num_docs=num_docs))
+        doc_idxs = np.concatenate([p.doc_idxs for p in partials])
+        order = np.argsort(doc_idxs, kind='stable')
+        doc_idxs = doc_idxs[order]
+        duplicates = doc_idxs[1:][np.diff(doc_idxs) == 0]
+        if len(duplicates):
+            raise ValueError(ERROR_OVERLAPPING_DOCS.format(
+                doc_idxs=np.unique(duplicates)[:10].tolist()))
+        arrays = {
+            key: np.concatenate([p.arrays[key] for p in partials])[order]
+            for key in first.arrays
+        }
+        return cls(doc_idxs, arrays, first.settings,
+                   num_docs.pop() if num_docs else None)
+
+    # ====================
+    def __add__(self, other: 'PartialResults') -> 'PartialResults':
+
+        return self.merge([self, other])
+
+    # ====================
+    def to_result_store(self) -> ResultStore:
+        """Get a ResultStore indexed by global document index.
+
+        Documents between 0 and num_docs (or the highest document index)
+        that are not in these partial results are left unscored, so
+        corpus totals are summed over the documents that are included."""
+
+        num_docs = self.num_docs
+        if num_docs is None:
+            num_docs = int(self.doc_idxs.max()) + 1 \
+                if len(self.doc_idxs) else 0
+        results = ResultStore(
+            num_docs, self.settings['features'],
+            self.settings['granularities'], self.settings['class_features'])
+        for key, array in self.arrays.items():
+            store_array(results, key)[self.doc_idxs] = array
+        return results
+
+    # ====================
+    def show_prfs(self, granularity: str = 'char', for_latex: bool = False):
+        """Show precision, recall and F-score for each feature, summed over
+        all documents."""
+
+        show_prfs(self.to_result_store().get_cms('all', granularity),
+                  for_latex)
+
+    # ====================
+    def show_wer_info(self):
+        """Show reference length, minimum number of edits, and word error
+        rate, summed over all documents with WER info."""
+
+        show_wer_info_table(self.to_result_store().get_wer_info('all'))
+
+    # ====================
+    def show_error_rates(self, for_latex: bool = False):
+        """Show character and feature error rates, summed over all scored
+        documents."""
+
+        show_error_rates_table(
+            self.to_result_store().get_error_rate_info('all'), for_latex)
+
+
+# ====================
+def store_arrays(results: ResultStore) -> Dict[str, np.ndarray]:
+    """Get all per-document arrays of a ResultStore, keyed by name."""
+
+    return {
+        key: np.array(array) for key, array in results.arrays().items()
+    }
+
+
+# ====================
+def store_array(results: ResultStore, key: str) -> np.ndarray:
+    """Get the array of a ResultStore with a name from store_arrays."""
+
+    if key.startswith('counts_'):
+        return results.counts[key[len('counts_'):]]
+    return getattr(results, key)
+
+
+# ====================
+def main(args: List[str] = None):
+    """Merge partial results files from the command line."""
+
+    parser = argparse.ArgumentParser(
+        description='Merge partial results saved by '
+                    'FeatureRestorationEvaluator.to_partial_results.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge_parser = subparsers.add_parser(
+        'merge', help='Merge partial results files into one file.')
+    merge_parser.add_argument('inputs', nargs='+')
+    merge_parser.add_argument('-o', '--output', required=True)
+    show_parser = subparsers.add_parser(
+        'show', help='Show corpus totals for partial results files.')
+    show_parser.add_argument('inputs', nargs='+')
+    show_parser.add_argument('--granularity', default='char')
+    args = parser.parse_args(args)
+    merged = PartialResults.merge(
+        [PartialResults.load(path) for path in args.inputs])
+    if args.command == 'merge':
+        merged.save(args.output)
+    else:
+        merged.show_prfs(args.granularity)
+        print()
+        merged.show_error_rates()
+        if merged.arrays['wer_status'].any():
+            print()
+            merged.show_wer_info()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from fre.misc import get_tqdm
+from fre.prf import prf_arrays
+from fre.result_store import COUNT_COLUMNS, PRF_COLUMNS
+from fre.system_diff import ref_to_hyp
+
+tqdm_ = get_tqdm()
+
+# Ways of binning reference positions
+POSITION_MODES = ['absolute', 'relative', 'chunk', 'boundary']
+DEFAULT_BIN_SIZE = 1000
+DEFAULT_NUM_BINS = 10
+# Default number of bins per chunk in 'chunk' and 'boundary' modes
+DEFAULT_BINS_PER_CHUNK = 16
+
+MESSAGE_PROFILING = "Profiling error positions for all documents..."
+ERROR_MODE = """
+by must be one of {modes}."""
+ERROR_CHUNK_SIZE = """
+chunk_size must be a positive integer when by is 'chunk' or 'boundary'."""
+ERROR_BIN_SIZE = """
+bin_size and num_bins must be positive integers."""
+ERROR_FEATURE = """
+Feature '{feature}' is not available. Available features: {features}"""
+
+
+# ====================
+class PositionProfile:
+    """Counts of true positives, false positives, and false negatives for
+    each feature, binned by the position in the reference document at
+    which they occur.
+
+    Positions are base character indices in the reference, and can be
+    binned by:
+
+    - 'absolute': the position from the start of the document, in bins of
+      bin_size characters
+    - 'relative': the position as a fraction of the document length, in
+      num_bins equal bins
+    - 'chunk': the offset within a chunk of chunk_size characters (i.e.
+      position % chunk_size), in bins of bin_size characters
+    - 'boundary': the distance to the nearest multiple of chunk_size, in
+      bins of bin_size characters
+
+    Each document is parsed into arrays of feature codes once, and counts
+    for all features and positions in the document are added to the bins
+    with np.bincount, without looping over positions in Python."""
+
+    # ====================
+    def __init__(self,
+                 evaluator,
+                 by: str = 'absolute',
+                 bin_size: int = None,
+                 num_bins: int = None,
+                 chunk_size: int = None):
+        """Initializes an instance of PositionProfile and bins the counts
+        for every document in the evaluator's corpus.
+
+        Args:
+          evaluator (FeatureRestorationEvaluator):
+            The evaluator.
+          by (str, optional):
+            One of 'absolute', 'relative', 'chunk', or 'boundary' (see
+            above). Defaults to 'absolute'.
+          bin_size (int, optional):
+            The width of each bin in characters, for all modes except
+            'relative'. If None, defaults to 1000 for 'absolute', and to
+            1/16 of chunk_size for 'chunk' and 'boundary'. Defaults to
+            None.
+          num_bins (int, optional):
+            The number of bins in 'relative' mode. If None, defaults to
+            10. Defaults to None.
+          chunk_size (int, optional):
+            The chunk size in characters, for 'chunk' and 'boundary'
+            modes. Defaults to None.
+        """
+
+        if by not in POSITION_MODES:
+            raise ValueError(ERROR_MODE.format(modes=POSITION_MODES))
+        if by in ['chunk', 'boundary'] and not (chunk_size or 0) > 0:
+            raise ValueError(ERROR_CHUNK_SIZE)
+        if bin_size is None:
+            if by in ['chunk', 'boundary']:
+                bin_size = max(chunk_size // DEFAULT_BINS_PER_CHUNK, 1)
+            else:
+                bin_size = DEFAULT_BIN_SIZE
+        if num_bins is None:
+            num_bins = DEFAULT_NUM_BINS
+        if bin_size < 1 or num_bins < 1:
+            raise ValueError(ERROR_BIN_SIZE)
+        self.evaluator = evaluator
+        self.by = by
+        self.bin_size = bin_size
+        self.chunk_size = chunk_size
+        self.features = evaluator.features
+        if by == 'relative':
+            self.edges = np.linspace(0, 1, num_bins + 1)
+        elif by == 'absolute':
+            # Bins are added as positions beyond the last bin are seen
+            self.edges = np.zeros(1, dtype=np.int64)
+        else:
+            max_offset = chunk_size if by == 'chunk' else chunk_size // 2 + 1
+            self.edges = np.arange(
+                0, max_offset + bin_size, bin_size, dtype=np.int64)
+            self.edges[-1] = max_offset
+        # Counts in the layout of ResultStore.counts, with shape
+        # (num_bins, num_features, 2, 2), and the number of scored
+        # reference positions in each bin
+        self.counts = np.zeros(
+            (len(self.edges) - 1, len(self.features), 2, 2), dtype=np.int64)
+        self.positions = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.profile_all()
+
+    # ====================
+    def profile_all(self):
+        """Bin counts for all documents."""
+
+        print(MESSAGE_PROFILING)
+        for doc_idx in tqdm_(range(len(self.evaluator.reference))):
+            self.profile_doc(doc_idx)
+
+    # ====================
+    def profile_doc(self, doc_idx: int):
+        """Bin counts for a single document. Documents whose base
+        characters differ from the reference are skipped unless the
+        evaluator uses alignment, in which case only aligned positions are
+        counted."""
+
+        parsed_ref, parsed_hyp = \
+            self.evaluator.parse_doc(doc_idx, case_info=True)
+        chars_ref, codes_ref, _ = parsed_ref
+        mapping = ref_to_hyp(
+            chars_ref, parsed_hyp[0], self.evaluator.alignment)
+        if mapping is None or len(chars_ref) == 0:
+            return
+        positions = np.flatnonzero(mapping >= 0)
+        codes_ref = codes_ref[positions]
+        # Case features on the word starts of the reference, as scored
+        codes_hyp = self.evaluator.feature_set.reference_word_codes(
+            parsed_ref, parsed_hyp, positions, mapping[positions])
+        bins = self.bin_positions(positions, len(chars_ref))
+        if len(bins) and bins.max() >= len(self.positions):
+            self.add_bins(int(bins.max()) + 1)
+        num_bins = len(self.positions)
+        num_features = len(self.features)
+        shifts = np.arange(num_features, dtype=np.int64)
+        # Index into a flattened (num_bins, num_features) array for every
+        # position and feature
+        idxs = bins[:, None] * num_features + shifts
+        self.positions += np.bincount(bins, minlength=num_bins)
+        for i, j, codes in [(0, 0, codes_ref & codes_hyp),
+                            (0, 1, codes_ref & ~codes_hyp),
+                            (1, 0, ~codes_ref & codes_hyp)]:
+            present = ((codes[:, None] >> shifts) & 1).astype(bool)
+            self.counts[:, :, i, j] += np.bincount(
+                idxs[present], minlength=num_bins * num_features
+            ).reshape(num_bins, num_features)
+        self.counts[:, :, 1, 1] = self.positions[:, None] \
+            - self.counts[:, :, 0, 0] - self.counts[:, :, 0, 1] \
+            - self.counts[:, :, 1, 0]
+
+    # ====================
+    def bin_positions(self, positions: np.ndarray,
+                      doc_length: int) -> np.ndarray:
+        """Get the bin index of each of an array of reference
+        positions."""
+
+        if self.by == 'absolute':
+            return positions // self.bin_size
+        if self.by == 'relative':
+            num_bins = len(self.edges) - 1
+            return positions * num_bins // doc_length
+        offsets = positions % self.chunk_size
+        if self.by == 'boundary':
+            offsets = np.minimum(offsets, self.chunk_size - offsets)
+        return offsets // self.bin_size
+
+    # ====================
+    def add_bins(self, num_bins: int):
+        """Extend the bins in 'absolute' mode so that there are
+        num_bins."""
+
+        extra = num_bins - len(self.positions)
+        self.edges = np.arange(num_bins + 1, dtype=np.int64) * self.bin_size
+        self.counts = np.concatenate([
+            self.counts,
+            np.zeros((extra, *self.counts.shape[1:]), dtype=np.int64)
+        ])
+        self.positions = np.concatenate(
+            [self.positions, np.zeros(extra, dtype=np.int64)])
+
+    # ====================
+    def feature_counts(self, feature: str) -> np.ndarray:
+        """Get counts with shape (num_bins, 2, 2) for a feature, or summed
+        over all features if feature is 'all'."""
+
+        if feature == 'all':
+            return self.counts.sum(axis=1)
+        if feature not in self.features:
+            raise ValueError(ERROR_FEATURE.format(
+                feature=feature, features=self.features + ['all']))
+        return self.counts[:, self.features.index(feature)]
+
+    # ====================
+    def to_dataframe(self) -> pd.DataFrame:
+        """Get a dataframe with a row for each bin.
+
+        Returns:
+          pd.DataFrame:
+            A dataframe indexed by (bin_start, bin_end), with a
+            ('positions', '') column giving the number of reference
+            positions in each bin, followed by (feature, metric) columns
+            for each feature and 'all', where metric is one of TP, FP, FN,
+            Precision, Recall, F-score, or errors_per_1000 (the number of
+            FPs and FNs per 1,000 reference positions). Undefined values
+            are NaN.
+        """
+
+        columns = [('positions', '')]
+        data = [self.positions]
+        for feature in self.features + ['all']:
+            arrays = self.plot_arrays(feature)
+            for metric in COUNT_COLUMNS + PRF_COLUMNS + ['errors_per_1000']:
+                columns.append((feature, metric))
+                data.append(arrays[metric])
+        index = pd.MultiIndex.from_arrays(
+            [self.edges[:-1], self.edges[1:]], names=['bin_start', 'bin_end'])
+        return pd.DataFrame(
+            dict(zip(columns, data)), index=index,
+            columns=pd.MultiIndex.from_tuples(columns))
+
+    # ====================
+    def plot_arrays(self, feature: str = 'all') -> Dict[str, np.ndarray]:
+        """Get arrays for plotting counts and metrics against position for
+        a feature (or for all features together, if feature is 'all').
+
+        For example, to plot errors per 1,000 characters with matplotlib:
+
+            arrays = profile.plot_arrays('all')
+            plt.bar(arrays['bin_start'], arrays['errors_per_1000'],
+                    width=arrays['bin_width'], align='edge')
+
+        Returns:
+          Dict[str, np.ndarray]:
+            A dictionary with keys bin_start, bin_end, bin_centre,
+            bin_width, positions, TP, FP, FN, Precision, Recall, F-score,
+            and errors_per_1000, each mapping to an array with one value
+            per bin.
+        """
+
+        counts = self.feature_counts(feature)
+        tp = counts[:, 0, 0]
+        fn = counts[:, 0, 1]
+        fp = counts[:, 1, 0]
+        precision, recall, fscore = prf_arrays(counts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            errors_per_1000 = np.where(
+                self.positions > 0, (fp + fn) / self.positions * 1000, np.nan)
+        return {
+            'bin_start': self.edges[:-1],
+            'bin_end': self.edges[1:],
+            'bin_centre': (self.edges[:-1] + self.edges[1:]) / 2,
+            'bin_width': np.diff(self.edges),
+            'positions': self.positions,
+            'TP': tp,
+            'FP': fp,
+            'FN': fn,
+            'Precision': precision,
+            'Recall': recall,
+            'F-score': fscore,
+            'errors_per_1000': errors_per_1000
+        }
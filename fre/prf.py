@@ -0,0 +1,115 @@
+from typing import Tuple
+
+import numpy as np
+
+# Ways of averaging precision, recall, and F-score over features and
+# documents
+AVERAGES = ['micro', 'macro', 'weighted', 'macro_docs']
+ERROR_AVERAGE = """
+average must be one of {averages}."""
+ERROR_BETA = """
+beta must be positive."""
+
+
+# ====================
+def prf_arrays(counts: np.ndarray, beta: float = 1.0) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Calculate precision, recall, and F-score for any number of
+    confusion matrices at once.
+
+    Args:
+      counts (np.ndarray):
+        An array of confusion matrices with shape (..., 2, 2), in the
+        layout returned by get_cms.
+      beta (float, optional):
+        The weight of recall relative to precision in the F-score
+        (F-beta). Defaults to 1.0.
+
+    Returns:
+      Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        Arrays of precision, recall, and F-score with shape (...). Values
+        that are undefined (because of division by zero) are NaN.
+    """
+
+    if not beta > 0:
+        raise ValueError(ERROR_BETA)
+    tp = counts[..., 0, 0].astype(float)
+    fn = counts[..., 0, 1].astype(float)
+    fp = counts[..., 1, 0].astype(float)
+    beta_2 = beta ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = tp / (tp + fp)
+        recall = tp / (tp + fn)
+        fscore = ((1 + beta_2) * precision * recall) \
+            / (beta_2 * precision + recall)
+    return precision, recall, fscore
+
+
+# ====================
+def average_prf_arrays(counts: np.ndarray,
+                       average: str = 'micro',
+                       beta: float = 1.0) -> np.ndarray:
+    """Calculate averaged precision, recall, and F-score from the counts
+    for every document and feature at once.
+
+    Averages are:
+
+    - 'micro': metrics of the counts summed over all documents and
+      features
+    - 'macro': the unweighted mean over features of the metrics of each
+      feature's counts summed over documents
+    - 'weighted': as 'macro', but with each feature weighted by its
+      support (the number of times it appears in the reference)
+    - 'macro_docs': the unweighted mean over documents of the metrics of
+      each document's counts summed over features
+
+    Undefined values (e.g. the precision of a feature that never appears
+    in the hypothesis) are left out of macro and weighted averages, so an
+    average is only NaN if it is undefined for every feature or document.
+
+    Args:
+      counts (np.ndarray):
+        An array of counts with shape (num_docs, num_features, 2, 2).
+      average (str, optional):
+        One of 'micro', 'macro', 'weighted', or 'macro_docs'. Defaults to
+        'micro'.
+      beta (float, optional):
+        The weight of recall relative to precision in the F-score.
+        Defaults to 1.0.
+
+    Returns:
+      np.ndarray:
+        An array of [precision, recall, F-score].
+    """
+
+    if average not in AVERAGES:
+        raise ValueError(ERROR_AVERAGE.format(averages=AVERAGES))
+    if average == 'micro':
+        return np.array(prf_arrays(counts.sum(axis=(0, 1)), beta))
+    if average == 'macro_docs':
+        return nan_average(np.stack(
+            prf_arrays(counts.sum(axis=1), beta), axis=1))
+    feature_counts = counts.sum(axis=0)
+    values = np.stack(prf_arrays(feature_counts, beta), axis=1)
+    if average == 'macro':
+        return nan_average(values)
+    support = feature_counts[:, 0].sum(axis=1)
+    return nan_average(values, support)
+
+
+# ====================
+def nan_average(values: np.ndarray, weights: np.ndarray = None) \
+        -> np.ndarray:
+    """Average each column of a 2D array, leaving out NaN values. Columns
+    with no values (or zero total weight) give NaN."""
+
+    if weights is None:
+        weights = np.ones(len(values))
+    weights = np.where(
+        np.isnan(values), 0.0, np.asarray(weights, dtype=float)[:, None])
+    total_weight = weights.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(
+            total_weight > 0,
+            np.nansum(values * weights, axis=0) / total_weight,
+            np.nan)
@@ -0,0 +1,549 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from fre.prf import AVERAGES, average_prf_arrays, prf_arrays
+from fre.spill_store import disk_array
+from fre.word_error_rate import wer
+
+try:
+    import pyarrow as pa
+except ModuleNotFoundError:
+    pa = None
+
+# Document status codes
+NOT_SCORED = 0
+SCORED = 1
+SKIPPED = -1
+
+GRANULARITIES = ['char', 'word']
+ERROR_GRANULARITY = """
+Granularity '{granularity}' is not available. Available granularities: \
+{available}"""
+ERROR_NO_PYARROW = """
+The pyarrow library is required to export results to Arrow."""
+COUNT_COLUMNS = ['TP', 'FP', 'FN']
+PRF_COLUMNS = ['Precision', 'Recall', 'F-score']
+WER_COLUMNS = ['len_ref', 'num_edits', 'wer']
+# Columns of ResultStore.edit_counts
+EDIT_COUNT_COLUMNS = ['len_ref_chars', 'char_edits', 'len_ref_features',
+                      'feature_edits']
+ERROR_RATES = ['CER', 'FER']
+ERROR_NO_CLASS_FEATURES = """
+No class features were specified, so multi-class confusion matrices are not \
+available."""
+
+
+# ====================
+class ResultStore:
+    """Compact store of confusion matrix counts for every document in a
+    corpus, at one or more granularities.
+
+    Counts are held in a single array per granularity with shape
+    (num_docs, num_features, 2, 2), where the final two axes have the same
+    layout as the confusion matrices returned by get_cms (rows are
+    reference positive/negative, columns are hypothesis
+    positive/negative). Multi-class confusion matrices over class
+    features are held in an array with shape (num_docs, N+1, N+1) for N
+    class features. Reference lengths and numbers of edits for character
+    error rate (CER) and feature error rate (FER) are held in an array
+    with shape (num_docs, 4), and reference lengths and minimum numbers
+    of edits for word error rate are held in an array with shape
+    (num_docs, 2)."""
+
+    # ====================
+    def __init__(self,
+                 num_docs: int,
+                 features: List[str],
+                 granularities: List[str] = None,
+                 class_features: List[str] = None):
+        """Initializes an instance of ResultStore.
+
+        Args:
+          num_docs (int):
+            The number of documents in the corpus.
+          features (List[str]):
+            The features that counts are stored for.
+          granularities (List[str], optional):
+            The granularities to store counts for. If None, only
+            character-level counts are stored. Defaults to None.
+          class_features (List[str], optional):
+            Features to store multi-class confusion matrices for. If None,
+            no multi-class confusion matrices are stored. Defaults to None.
+        """
+
+        if granularities is None:
+            granularities = ['char']
+        for granularity in granularities:
+            if granularity not in GRANULARITIES:
+                raise ValueError(ERROR_GRANULARITY.format(
+                    granularity=granularity, available=GRANULARITIES))
+        self.features = list(features)
+        self.granularities = list(granularities)
+        self.counts = {
+            granularity: np.zeros(
+                (num_docs, len(self.features), 2, 2), dtype=np.int64)
+            for granularity in self.granularities
+        }
+        self.class_features = list(class_features or [])
+        if self.class_features:
+            num_classes = len(self.class_features) + 1
+            self.class_counts = np.zeros(
+                (num_docs, num_classes, num_classes), dtype=np.int64)
+        else:
+            self.class_counts = None
+        self.edit_counts = np.zeros(
+            (num_docs, len(EDIT_COUNT_COLUMNS)), dtype=np.int64)
+        self.status = np.full(num_docs, NOT_SCORED, dtype=np.int8)
+        self.wer_counts = np.zeros((num_docs, 2), dtype=np.int64)
+        self.wer_status = np.zeros(num_docs, dtype=bool)
+
+    # ====================
+    @classmethod
+    def from_dicts(cls,
+                   num_docs: int,
+                   features: List[str],
+                   cms: dict,
+                   wer_info: dict) -> 'ResultStore':
+        """Build a ResultStore from the cms and wer_info dictionaries of
+        evaluators pickled before results were stored in arrays.
+
+        Edit counts for character and feature error rates were not kept in
+        those dictionaries, so error rates of migrated documents are NaN
+        until the documents are scored again.
+
+        Args:
+          num_docs (int):
+            The number of documents in the corpus.
+          features (List[str]):
+            The features of the confusion matrices.
+          cms (dict):
+            A dictionary mapping document indices (and 'all') to
+            dictionaries of confusion matrices for each feature, or None
+            for skipped documents.
+          wer_info (dict):
+            A dictionary mapping document indices (and 'all') to
+            dictionaries with 'len_ref' and 'num_edits' entries.
+        """
+
+        results = cls(num_docs, features)
+        for doc_idx, doc_cms in cms.items():
+            if doc_idx == 'all':
+                continue
+            if doc_cms is None:
+                results.status[doc_idx] = SKIPPED
+                continue
+            results.counts['char'][doc_idx] = np.stack(
+                [doc_cms[feature] for feature in features])
+            results.status[doc_idx] = SCORED
+        for doc_idx, doc_wer_info in wer_info.items():
+            if doc_idx != 'all':
+                results.set_wer(doc_idx, doc_wer_info['len_ref'],
+                                doc_wer_info['num_edits'])
+        return results
+
+    # ====================
+    def __len__(self) -> int:
+
+        return len(self.status)
+
+    # ====================
+    def __contains__(self, doc_idx: int) -> bool:
+
+        return self.status[doc_idx] != NOT_SCORED
+
+    # ====================
+    def __getitem__(self, doc_idx) -> Dict[str, np.ndarray]:
+        """Get character-level confusion matrices for a document (or
+        'all'), in the same format as get_cms."""
+
+        return self.get_cms(doc_idx, 'char')
+
+    # ====================
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Get the per-document arrays of the store, keyed by name."""
+
+        arrays = {
+            'status': self.status,
+            'edit_counts': self.edit_counts,
+            'wer_counts': self.wer_counts,
+            'wer_status': self.wer_status
+        }
+        for granularity in self.granularities:
+            arrays[f'counts_{granularity}'] = self.counts[granularity]
+        if self.class_counts is not None:
+            arrays['class_counts'] = self.class_counts
+        return arrays
+
+    # ====================
+    def nbytes(self) -> int:
+        """Get the number of bytes used by the per-document arrays."""
+
+        return sum(array.nbytes for array in self.arrays().values())
+
+    # ====================
+    def move_to_disk(self, spill_dir: str = None):
+        """Move the per-document arrays to memory-mapped temporary files,
+        so that only recently used parts of them are kept in memory.
+
+        Args:
+          spill_dir (str, optional):
+            The directory to create the files in. If None, the default
+            temporary directory is used. Defaults to None.
+        """
+
+        for name in ['status', 'edit_counts', 'wer_counts', 'wer_status',
+                     'class_counts']:
+            if getattr(self, name) is not None:
+                setattr(self, name, disk_array(getattr(self, name), spill_dir))
+        for granularity in self.granularities:
+            self.counts[granularity] = disk_array(
+                self.counts[granularity], spill_dir)
+
+    # ====================
+    def set_doc(self, doc_idx: int, counts: Dict[str, np.ndarray]):
+        """Store counts for a single document.
+
+        Args:
+          doc_idx (int):
+            The index of the document.
+          counts (Dict[str, np.ndarray]):
+            An array of shape (num_features, 2, 2) for each granularity,
+            edit counts for CER and FER ('edits'), and a multi-class
+            confusion matrix ('class') if class features are stored, or
+            None if the document was skipped.
+        """
+
+        if counts is None:
+            self.status[doc_idx] = SKIPPED
+            for granularity in self.granularities:
+                self.counts[granularity][doc_idx] = 0
+            if self.class_counts is not None:
+                self.class_counts[doc_idx] = 0
+            self.edit_counts[doc_idx] = 0
+            return
+        for granularity in self.granularities:
+            self.counts[granularity][doc_idx] = counts[granularity]
+        self.edit_counts[doc_idx] = counts['edits']
+        if self.class_counts is not None:
+            self.class_counts[doc_idx] = counts['class']
+        self.status[doc_idx] = SCORED
+
+    # ====================
+    def set_docs(self,
+                 doc_idxs: np.ndarray,
+                 counts: Dict[str, np.ndarray],
+                 status: np.ndarray):
+        """Store counts for multiple documents at once.
+
+        Args:
+          doc_idxs (np.ndarray):
+            The indices of the documents.
+          counts (Dict[str, np.ndarray]):
+            An array of shape (len(doc_idxs), num_features, 2, 2) for each
+            granularity, an array of edit counts ('edits'), and an array
+            of multi-class confusion matrices ('class') if class features
+            are stored. Rows for skipped documents are ignored.
+          status (np.ndarray):
+            The status (SCORED or SKIPPED) of each document.
+        """
+
+        skipped = status != SCORED
+        for granularity in self.granularities:
+            self.counts[granularity][doc_idxs] = counts[granularity]
+            self.counts[granularity][doc_idxs[skipped]] = 0
+        if self.class_counts is not None:
+            self.class_counts[doc_idxs] = counts['class']
+            self.class_counts[doc_idxs[skipped]] = 0
+        self.edit_counts[doc_idxs] = counts['edits']
+        self.edit_counts[doc_idxs[skipped]] = 0
+        self.status[doc_idxs] = status
+
+    # ====================
+    def check_granularity(self, granularity: str):
+        """Raise a ValueError if counts are not stored for the
+        granularity."""
+
+        if granularity not in self.granularities:
+            raise ValueError(ERROR_GRANULARITY.format(
+                granularity=granularity, available=self.granularities))
+
+    # ====================
+    def scored_docs(self) -> np.ndarray:
+        """Get the indices of all documents that have been scored."""
+
+        return np.flatnonzero(self.status == SCORED)
+
+    # ====================
+    def get_counts(self, doc_idx, granularity: str = 'char') -> np.ndarray:
+        """Get the counts array of shape (num_features, 2, 2) for a
+        document, or summed over all scored documents if doc_idx is
+        'all'. Returns None for skipped documents."""
+
+        self.check_granularity(granularity)
+        if doc_idx == 'all':
+            return self.counts[granularity][self.status == SCORED].sum(axis=0)
+        if self.status[doc_idx] != SCORED:
+            return None
+        return self.counts[granularity][doc_idx]
+
+    # ====================
+    def get_cms(self, doc_idx, granularity: str = 'char') \
+            -> Dict[str, np.ndarray]:
+        """Get confusion matrices for a document (or 'all'), with an
+        additional 'all' entry summed over all features."""
+
+        counts = self.get_counts(doc_idx, granularity)
+        if counts is None:
+            return None
+        return counts_to_cms(counts, self.features)
+
+    # ====================
+    def get_prf_averages(self,
+                         granularity: str = 'char',
+                         beta: float = 1.0) -> np.ndarray:
+        """Get micro, macro, weighted, and document-level macro averages
+        of precision, recall, and F-score over all scored documents.
+
+        Returns:
+          np.ndarray:
+            An array of shape (len(AVERAGES), 3), with a row of
+            [precision, recall, F-score] for each average in AVERAGES.
+        """
+
+        self.check_granularity(granularity)
+        counts = self.counts[granularity][self.status == SCORED]
+        return np.stack([
+            average_prf_arrays(counts, average, beta) for average in AVERAGES
+        ])
+
+    # ====================
+    def get_class_cm(self, doc_idx) -> np.ndarray:
+        """Get the multi-class confusion matrix for a document, or summed
+        over all scored documents if doc_idx is 'all'. Returns None for
+        skipped documents."""
+
+        if self.class_counts is None:
+            raise ValueError(ERROR_NO_CLASS_FEATURES)
+        if doc_idx == 'all':
+            return self.class_counts[self.status == SCORED].sum(axis=0)
+        if self.status[doc_idx] != SCORED:
+            return None
+        return self.class_counts[doc_idx]
+
+    # ====================
+    def get_error_rate_info(self, doc_idx) -> Dict[str, dict]:
+        """Get reference lengths, numbers of edits, and error rates for
+        character error rate (CER) and feature error rate (FER) for a
+        document, or summed over all scored documents if doc_idx is 'all'.
+        Returns None for skipped documents.
+
+        CER is the number of grapheme edits per 100 reference graphemes.
+        FER is the number of feature insertions, deletions, and
+        substitutions per 100 reference feature occurrences."""
+
+        if doc_idx == 'all':
+            edit_counts = self.edit_counts[self.status == SCORED].sum(axis=0)
+        elif self.status[doc_idx] != SCORED:
+            return None
+        else:
+            edit_counts = self.edit_counts[doc_idx]
+        len_chars, char_edits, len_features, feature_edits = \
+            edit_counts.tolist()
+        return {
+            'CER': {
+                'len_ref': len_chars,
+                'num_edits': char_edits,
+                'cer': error_rate(char_edits, len_chars)
+            },
+            'FER': {
+                'len_ref': len_features,
+                'num_edits': feature_edits,
+                'fer': error_rate(feature_edits, len_features)
+            }
+        }
+
+    # ====================
+    def set_wer(self, doc_idx: int, len_ref: int, num_edits: int):
+        """Store the reference length and minimum number of word edits for
+        a single document."""
+
+        self.wer_counts[doc_idx] = (len_ref, num_edits)
+        self.wer_status[doc_idx] = True
+
+    # ====================
+    def has_wer(self, doc_idx: int) -> bool:
+
+        return bool(self.wer_status[doc_idx])
+
+    # ====================
+    def get_wer_info(self, doc_idx) -> dict:
+        """Get reference length, minimum number of edits, and word error
+        rate for a document, or summed over all documents if doc_idx is
+        'all'."""
+
+        if doc_idx == 'all':
+            len_ref, num_edits = \
+                self.wer_counts[self.wer_status].sum(axis=0).tolist()
+        else:
+            len_ref, num_edits = self.wer_counts[doc_idx].tolist()
+        return {
+            'len_ref': len_ref,
+            'num_edits': num_edits,
+            'wer': wer(num_edits, len_ref)
+        }
+
+    # ====================
+    def to_dataframe(self,
+                     granularity: str = 'char',
+                     include_wer: bool = True,
+                     include_error_rates: bool = True) -> pd.DataFrame:
+        """Get a dataframe of per-document metrics.
+
+        All values are computed in a single vectorized pass over the
+        stored counts. Undefined values (e.g. precision where there are no
+        positive predictions, or any metric for a skipped document) are
+        NaN.
+
+        Args:
+          granularity (str, optional):
+            The granularity of the feature metrics. Defaults to 'char'.
+          include_wer (bool, optional):
+            Whether or not to include word error rate columns. Defaults to
+            True.
+          include_error_rates (bool, optional):
+            Whether or not to include character and feature error rate
+            columns. Defaults to True.
+
+        Returns:
+          pd.DataFrame:
+            A dataframe indexed by document index, with (feature, metric)
+            columns for each feature and 'all', where metric is one of TP,
+            FP, FN, Precision, Recall, F-score, followed by ('WER',
+            len_ref), ('WER', num_edits) and ('WER', wer), and similar
+            columns for 'CER' and 'FER'.
+        """
+
+        columns, data = self.metric_arrays(
+            granularity, include_wer, include_error_rates)
+        return pd.DataFrame(
+            np.stack(data, axis=1),
+            index=pd.RangeIndex(len(self), name='doc_idx'),
+            columns=pd.MultiIndex.from_tuples(columns)
+        )
+
+    # ====================
+    def to_arrow(self,
+                 granularity: str = 'char',
+                 include_wer: bool = True,
+                 include_error_rates: bool = True) -> 'pa.Table':
+        """Get an Arrow table of per-document metrics.
+
+        The table has a doc_idx column, then a struct column for each
+        feature and 'all' (and 'WER', 'CER', and 'FER' if included) with
+        the same fields as the second level of the columns of
+        to_dataframe.
+
+        Args:
+          granularity (str, optional):
+            The granularity of the feature metrics. Defaults to 'char'.
+          include_wer (bool, optional):
+            Whether or not to include word error rate columns. Defaults to
+            True.
+          include_error_rates (bool, optional):
+            Whether or not to include character and feature error rate
+            columns. Defaults to True.
+
+        Returns:
+          pa.Table:
+            The Arrow table.
+        """
+
+        if pa is None:
+            raise ImportError(ERROR_NO_PYARROW)
+        columns, data = self.metric_arrays(
+            granularity, include_wer, include_error_rates)
+        fields = {}
+        for (group, field), values in zip(columns, data):
+            fields.setdefault(group, ([], []))
+            fields[group][0].append(pa.array(values, from_pandas=True))
+            fields[group][1].append(field)
+        arrays = [pa.array(np.arange(len(self)))]
+        arrays.extend(
+            pa.StructArray.from_arrays(field_arrays, names=field_names)
+            for field_arrays, field_names in fields.values()
+        )
+        return pa.Table.from_arrays(
+            arrays, names=['doc_idx'] + list(fields.keys()))
+
+    # ====================
+    def metric_arrays(self,
+                      granularity: str,
+                      include_wer: bool,
+                      include_error_rates: bool = False) -> tuple:
+        """Get (group, metric) column labels and a float array of values
+        for each column, for all documents."""
+
+        self.check_granularity(granularity)
+        counts = self.counts[granularity]
+        counts = np.concatenate(
+            [counts, counts.sum(axis=1, keepdims=True)], axis=1)
+        tp = counts[..., 0, 0].astype(float)
+        fn = counts[..., 0, 1].astype(float)
+        fp = counts[..., 1, 0].astype(float)
+        precision, recall, fscore = prf_arrays(counts)
+        values = np.stack([tp, fp, fn, precision, recall, fscore], axis=2)
+        values[self.status != SCORED] = np.nan
+        columns = []
+        data = []
+        for i, feature in enumerate(self.features + ['all']):
+            for j, metric in enumerate(COUNT_COLUMNS + PRF_COLUMNS):
+                columns.append((feature, metric))
+                data.append(values[:, i, j])
+        if include_wer:
+            len_ref = self.wer_counts[:, 0].astype(float)
+            num_edits = self.wer_counts[:, 1].astype(float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                wer_ = np.where(len_ref > 0, num_edits / len_ref * 100, np.nan)
+            for metric, values_ in zip(
+                    WER_COLUMNS, [len_ref, num_edits, wer_]):
+                values_[~self.wer_status] = np.nan
+                columns.append(('WER', metric))
+                data.append(values_)
+        if include_error_rates:
+            edit_counts = self.edit_counts.astype(float)
+            edit_counts[self.status != SCORED] = np.nan
+            for i, name in enumerate(ERROR_RATES):
+                len_ref = edit_counts[:, 2 * i]
+                num_edits = edit_counts[:, 2 * i + 1]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rate = np.where(
+                        len_ref > 0, num_edits / len_ref * 100, np.nan)
+                for metric, values_ in zip(
+                        ['len_ref', 'num_edits', name.lower()],
+                        [len_ref, num_edits, rate]):
+                    columns.append((name, metric))
+                    data.append(values_)
+        return columns, data
+
+
+# ====================
+def error_rate(num_edits: int, len_ref: int) -> float:
+    """Get an error rate as a percentage, or NaN if the reference is
+    empty."""
+
+    if len_ref == 0:
+        return np.nan
+    return num_edits / len_ref * 100
+
+
+# ====================
+def counts_to_cms(counts: np.ndarray,
+                  features: List[str]) -> Dict[str, np.ndarray]:
+    """Convert a counts array of shape (num_features, 2, 2) to a dictionary
+    of confusion matrices, with an additional 'all' entry."""
+
+    cms = {f: counts[i] for i, f in enumerate(features)}
+    cms['all'] = counts.sum(axis=0)
+    return cms
@@ -0,0 +1,312 @@
+import time
+import warnings
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from fre.corpus import doc_lengths
+from fre.misc import display_or_print
+from fre.prf import prf_arrays
+
+DEFAULT_NUM_STRATA = 5
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_NUM_BOOTSTRAP = 1000
+# Documents sampled from each stratum before the time budget is checked,
+# so that every stratum is represented in the estimates
+MIN_DOCS_PER_STRATUM = 2
+ESTIMATE_COLUMNS = ['estimate', 'lower', 'upper', 'width']
+STOP_REASONS = {
+    'target_width': 'all confidence intervals reached the target width',
+    'time_budget': 'the time budget ran out',
+    'exhausted': 'all documents were scored'
+}
+
+MESSAGE_SAMPLING = """Estimating metrics from a sample of documents \
+(target width: {target_width}, time budget: {time_budget})..."""
+MESSAGE_SUMMARY = """Estimated from {num_sampled:,} of {num_docs:,} \
+documents in {elapsed:.1f}s with {confidence:.0%} bootstrap confidence \
+intervals. Stopped because {reason}."""
+ERROR_CONFIDENCE = """
+confidence must be between 0 and 1."""
+
+
+# ====================
+class SampleEstimate:
+    """Estimates of F-score for each feature (and WER), with bootstrap
+    confidence intervals, from a stratified random sample of
+    documents."""
+
+    # ====================
+    def __init__(self,
+                 estimates: pd.DataFrame,
+                 num_sampled: int,
+                 num_docs: int,
+                 elapsed: float,
+                 confidence: float,
+                 stop_reason: str):
+
+        self.estimates = estimates
+        self.num_sampled = num_sampled
+        self.num_docs = num_docs
+        self.elapsed = elapsed
+        self.confidence = confidence
+        self.stop_reason = stop_reason
+
+    # ====================
+    def to_dataframe(self) -> pd.DataFrame:
+        """Get a dataframe indexed by feature ('all' and 'WER' included)
+        with columns estimate, lower, upper, and width. F-scores are
+        between 0 and 1, and WER is a percentage."""
+
+        return self.estimates.copy()
+
+    # ====================
+    def show(self):
+        """Show the estimates and a summary of how they were obtained."""
+
+        print(MESSAGE_SUMMARY.format(
+            num_sampled=self.num_sampled, num_docs=self.num_docs,
+            elapsed=self.elapsed, confidence=self.confidence,
+            reason=STOP_REASONS[self.stop_reason]))
+        display_or_print(self.estimates)
+
+
+# ====================
+def estimate_metrics(evaluator,
+                     target_width: float = 0.02,
+                     time_budget: float = None,
+                     confidence: float = 0.95,
+                     include_wer: bool = True,
+                     num_strata: int = DEFAULT_NUM_STRATA,
+                     batch_size: int = DEFAULT_BATCH_SIZE,
+                     num_bootstrap: int = DEFAULT_NUM_BOOTSTRAP,
+                     seed: int = 0) -> SampleEstimate:
+    """Estimate F-scores (and WER) for an evaluator's whole corpus by
+    scoring a stratified random sample of documents.
+
+    Documents are split into num_strata strata of similar size by
+    reference length, and shuffled within each stratum with a fixed seed.
+    Documents are then scored in rounds of batch_size, allocated to
+    strata in proportion to their size, until the confidence interval of
+    every defined metric is no wider than target_width, the time budget
+    runs out, or every document has been scored. Scores are stored in the
+    evaluator's result store, so no work is repeated by a later exact
+    evaluation.
+
+    Corpus totals of TP, FP, and FN (and of WER edits and reference
+    lengths) are estimated by scaling up the sample totals of each
+    stratum, and metrics are computed from the estimated totals.
+    Confidence intervals are percentile intervals from a stratified
+    bootstrap (resampling documents within each stratum). Strata that
+    have been scored completely contribute their exact totals, and no
+    finite population correction is applied to the others, so intervals
+    are slightly conservative.
+
+    Args:
+      evaluator (FeatureRestorationEvaluator):
+        The evaluator.
+      target_width (float, optional):
+        The confidence interval width to stop at, for F-scores (between 0
+        and 1) and for WER as a fraction (i.e. 0.02 is 2 percentage
+        points of WER). Defaults to 0.02.
+      time_budget (float, optional):
+        The maximum time to spend scoring, in seconds. If None, there is
+        no time limit. Defaults to None.
+      confidence (float, optional):
+        The confidence level of the intervals. Defaults to 0.95.
+      include_wer (bool, optional):
+        Whether or not to estimate WER. Defaults to True.
+      num_strata (int, optional):
+        The number of length strata. Defaults to 5.
+      batch_size (int, optional):
+        The number of documents to score between checks of the interval
+        widths. Defaults to 50.
+      num_bootstrap (int, optional):
+        The number of bootstrap resamples. Defaults to 1000.
+      seed (int, optional):
+        The random seed for the sample and the bootstrap. Defaults to 0.
+
+    Returns:
+      SampleEstimate:
+        The estimates.
+    """
+
+    if not 0 < confidence < 1:
+        raise ValueError(ERROR_CONFIDENCE)
+    start_time = time.perf_counter()
+    print(MESSAGE_SAMPLING.format(
+        target_width=target_width, time_budget=time_budget))
+    rng = np.random.default_rng(seed)
+    strata = length_strata(doc_lengths(evaluator.reference), num_strata, rng)
+    stratum_sizes = np.array([len(stratum) for stratum in strata])
+    num_sampled = np.zeros(len(strata), dtype=np.int64)
+    num_docs = int(stratum_sizes.sum())
+    # Every stratum must be represented before the time budget is checked
+    min_sampled = np.minimum(MIN_DOCS_PER_STRATUM, stratum_sizes)
+    estimates = None
+    stop_reason = 'exhausted'
+    while num_sampled.sum() < num_docs:
+        targets = round_targets(
+            num_sampled, stratum_sizes, batch_size, num_docs)
+        out_of_time = False
+        for stratum_idx, stratum in enumerate(strata):
+            while num_sampled[stratum_idx] < targets[stratum_idx]:
+                if time_budget is not None \
+                        and np.all(num_sampled >= min_sampled) \
+                        and time.perf_counter() - start_time > time_budget:
+                    out_of_time = True
+                    break
+                score_doc(evaluator, stratum[num_sampled[stratum_idx]],
+                          include_wer)
+                num_sampled[stratum_idx] += 1
+        estimates = bootstrap_estimates(
+            evaluator, strata, num_sampled, include_wer, confidence,
+            num_bootstrap, np.random.default_rng(seed + 1))
+        if out_of_time:
+            stop_reason = 'time_budget'
+            break
+        if num_sampled.sum() == num_docs:
+            break
+        widths = estimates['width'].to_numpy(dtype=float).copy()
+        if include_wer:
+            widths[-1] /= 100
+        if np.all(np.isnan(widths) | (widths <= target_width)):
+            stop_reason = 'target_width'
+            break
+    if estimates is None:
+        estimates = bootstrap_estimates(
+            evaluator, strata, num_sampled, include_wer, confidence,
+            num_bootstrap, np.random.default_rng(seed + 1))
+    return SampleEstimate(
+        estimates, int(num_sampled.sum()), num_docs,
+        time.perf_counter() - start_time, confidence, stop_reason)
+
+
+# ====================
+def length_strata(lengths: np.ndarray,
+                  num_strata: int,
+                  rng: np.random.Generator) -> List[np.ndarray]:
+    """Split document indices into strata of similar size by length, and
+    shuffle the indices within each stratum. Empty strata are dropped."""
+
+    order = np.argsort(lengths, kind='stable')
+    return [
+        rng.permutation(stratum)
+        for stratum in np.array_split(order, num_strata) if len(stratum)
+    ]
+
+
+# ====================
+def round_targets(num_sampled: np.ndarray,
+                  stratum_sizes: np.ndarray,
+                  batch_size: int,
+                  num_docs: int) -> np.ndarray:
+    """Get the number of documents that should have been sampled from
+    each stratum by the end of the next round."""
+
+    total = num_sampled.sum() + batch_size
+    targets = np.ceil(total * stratum_sizes / num_docs).astype(np.int64)
+    targets = np.maximum(targets, MIN_DOCS_PER_STRATUM)
+    return np.minimum(np.maximum(targets, num_sampled), stratum_sizes)
+
+
+# ====================
+def score_doc(evaluator, doc_idx: int, include_wer: bool):
+    """Score a document if it has not already been scored."""
+
+    if doc_idx not in evaluator.results:
+        evaluator.get_cms_doc(doc_idx)
+    if include_wer and not evaluator.results.has_wer(doc_idx):
+        evaluator.get_wer_info_doc(doc_idx)
+
+
+# ====================
+def doc_values(evaluator, doc_idxs: np.ndarray,
+               include_wer: bool) -> np.ndarray:
+    """Get an array with a row for each document and columns TP, FP, and
+    FN for each feature, followed by WER reference length and number of
+    edits if include_wer is True."""
+
+    results = evaluator.results
+    counts = results.counts['char'][doc_idxs]
+    values = np.stack(
+        [counts[..., 0, 0], counts[..., 1, 0], counts[..., 0, 1]], axis=2)
+    values = values.reshape(len(doc_idxs), -1)
+    if include_wer:
+        values = np.concatenate(
+            [values, results.wer_counts[doc_idxs]], axis=1)
+    return values.astype(float)
+
+
+# ====================
+def metrics_from_totals(totals: np.ndarray,
+                        num_features: int,
+                        include_wer: bool) -> np.ndarray:
+    """Get F-scores for each feature and 'all' (and WER) from arrays of
+    totals with shape (..., num_values) in the column layout of
+    doc_values."""
+
+    tp_fp_fn = totals[..., :num_features * 3].reshape(
+        *totals.shape[:-1], num_features, 3)
+    tp_fp_fn = np.concatenate(
+        [tp_fp_fn, tp_fp_fn.sum(axis=-2, keepdims=True)], axis=-2)
+    # Confusion matrices in the layout expected by prf_arrays (true
+    # negatives are not needed)
+    counts = np.zeros((*tp_fp_fn.shape[:-1], 2, 2))
+    counts[..., 0, 0] = tp_fp_fn[..., 0]
+    counts[..., 1, 0] = tp_fp_fn[..., 1]
+    counts[..., 0, 1] = tp_fp_fn[..., 2]
+    _, _, fscore = prf_arrays(counts)
+    if not include_wer:
+        return fscore
+    with np.errstate(divide='ignore', invalid='ignore'):
+        len_ref = totals[..., -2:-1]
+        wer_ = np.where(
+            len_ref > 0, totals[..., -1:] / len_ref * 100, np.nan)
+    return np.concatenate([fscore, wer_], axis=-1)
+
+
+# ====================
+def bootstrap_estimates(evaluator,
+                        strata: List[np.ndarray],
+                        num_sampled: np.ndarray,
+                        include_wer: bool,
+                        confidence: float,
+                        num_bootstrap: int,
+                        rng: np.random.Generator) -> pd.DataFrame:
+    """Estimate metrics and bootstrap confidence intervals from the
+    documents sampled so far."""
+
+    num_features = len(evaluator.features)
+    totals = 0
+    boot_totals = 0
+    for stratum, n in zip(strata, num_sampled):
+        if n == 0:
+            continue
+        values = doc_values(evaluator, stratum[:n], include_wer)
+        scale = len(stratum) / n
+        totals = totals + values.sum(axis=0) * scale
+        if n == len(stratum):
+            boot_totals = boot_totals + values.sum(axis=0)
+        else:
+            # Resampling documents with replacement is equivalent to
+            # weighting each document by a multinomial count
+            weights = rng.multinomial(n, np.full(n, 1 / n), num_bootstrap)
+            boot_totals = boot_totals + weights @ values * scale
+    estimate = metrics_from_totals(
+        np.asarray(totals), num_features, include_wer)
+    boot = metrics_from_totals(
+        np.broadcast_to(boot_totals, (num_bootstrap, len(totals))),
+        num_features, include_wer)
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # Metrics that are undefined in every resample give NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lower, upper = np.nanquantile(boot, [alpha, 1 - alpha], axis=0)
+    index = evaluator.features + ['all'] + (['WER'] if include_wer else [])
+    estimates = pd.DataFrame(
+        np.stack([estimate, lower, upper, upper - lower], axis=1),
+        index=index, columns=ESTIMATE_COLUMNS)
+    estimates.loc[np.isnan(estimate)] = np.nan
+    return estimates
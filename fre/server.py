@@ -0,0 +1,513 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import threading
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from fre.char_level_metrics import get_doc_counts
+from fre.feature_set import FeatureSet
+from fre.misc import get_case_features
+from fre.prf import prf_arrays
+from fre.result_store import COUNT_COLUMNS, PRF_COLUMNS
+from fre.word_error_rate import get_num_edits
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+# Maximum size of a request body, in bytes
+MAX_BODY_SIZE = 64 * 1024 * 1024
+# Maximum time to wait for requests in progress to be answered when the
+# server stops, in seconds
+STOP_TIMEOUT = 5.0
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+MESSAGE_STARTING_WORKERS = "Starting {num_workers} scoring workers..."
+MESSAGE_SERVING = "Serving on http://{host}:{port}/ (press Ctrl+C to stop)"
+ERROR_PAYLOAD = """
+Request body must be a JSON object with 'reference' and 'hypothesis' keys, \
+each either a string or a list of strings."""
+ERROR_UNEQUAL_LENGTHS = """
+Hypothesis and reference lists must have equal length."""
+ERROR_NOT_FOUND = "No route for {method} {path}."
+ERROR_METHOD_NOT_ALLOWED = """Method {method} is not allowed for {path}. \
+Allowed methods: {allowed}."""
+ERROR_SERVER_STOPPED = "The server stopped before the pair was scored."
+ERROR_BODY_TOO_LARGE = "Request body is larger than {max_size:,} bytes."
+
+# The feature set and settings of each worker process, set once when the
+# worker starts
+worker_state: dict = {}
+
+
+# ====================
+class ScoringServer:
+    """An asyncio HTTP server that scores reference/hypothesis pairs with a
+    pool of warm worker processes.
+
+    The feature set is compiled once when the server is created, and each
+    worker process receives it (and imports jiwer, NumPy, etc.) once when
+    the pool is started, so requests do not pay for any startup costs.
+    Pairs from all concurrent requests are put on a single queue and sent
+    to workers in micro-batches of up to max_batch_size pairs, waiting at
+    most max_wait_ms for a batch to fill, so that small requests do not
+    each pay for a round trip to a worker process."""
+
+    # ====================
+    def __init__(self,
+                 capitalization: Union[bool, str],
+                 feature_chars: Union[str, list],
+                 alignment: bool = False,
+                 language: str = None,
+                 include_wer: bool = True,
+                 num_workers: int = None,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        """Initializes an instance of ScoringServer.
+
+        Args:
+          capitalization (Union[bool, str]):
+            Whether or not to assess capitalization, as for
+            FeatureRestorationEvaluator.
+          feature_chars (Union[str, list]):
+            Feature characters to assess, as for
+            FeatureRestorationEvaluator.
+          alignment (bool, optional):
+            Whether or not to align base characters before scoring.
+            Defaults to False.
+          language (str, optional):
+            An ISO 639-1 language code for case folding. Defaults to None.
+          include_wer (bool, optional):
+            Whether or not to calculate WER for requests that do not
+            specify include_wer. Defaults to True.
+          num_workers (int, optional):
+            The number of worker processes. If None, the number of CPUs is
+            used. Defaults to None.
+          max_batch_size (int, optional):
+            The maximum number of pairs sent to a worker at a time.
+            Defaults to 32.
+          max_wait_ms (float, optional):
+            The maximum time to wait for more pairs before sending a batch
+            that is not full, in milliseconds. Defaults to 5.0.
+        """
+
+        self.feature_set = FeatureSet(
+            get_case_features(capitalization) + list(feature_chars),
+            language)
+        self.features = self.feature_set.features
+        self.alignment = alignment
+        self.include_wer = include_wer
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pool = None
+        self.loop = None
+        self.queue = None
+        self.stopped = None
+        self.pending = set()
+        self.responding = set()
+        self.port = None
+        self.ready = threading.Event()
+
+    # ====================
+    def run(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """Start the worker pool and serve requests until stop is
+        called.
+
+        Args:
+          host (str, optional):
+            The host to listen on. Defaults to '127.0.0.1'.
+          port (int, optional):
+            The port to listen on, or 0 for any free port (available as
+            self.port once self.ready is set). Defaults to 8000.
+        """
+
+        print(MESSAGE_STARTING_WORKERS.format(num_workers=self.num_workers))
+        self.pool = multiprocessing.Pool(
+            self.num_workers, initializer=init_worker,
+            initargs=(self.feature_set, self.alignment))
+        try:
+            asyncio.run(self.serve(host, port))
+        finally:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.ready.clear()
+
+    # ====================
+    def stop(self):
+        """Stop the server. Can be called from any thread."""
+
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(
+                lambda: self.stopped.done() or self.stopped.set_result(None))
+
+    # ====================
+    async def serve(self, host: str, port: int):
+
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.stopped = self.loop.create_future()
+        # Limit the number of batches in flight so that pairs wait on the
+        # queue (where they can be batched) rather than in the pool
+        self.slots = asyncio.Semaphore(self.num_workers * 2)
+        batcher = asyncio.create_task(self.batch_pairs())
+        server = await asyncio.start_server(
+            self.handle_connection, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        print(MESSAGE_SERVING.format(host=host, port=self.port))
+        self.ready.set()
+        async with server:
+            try:
+                await self.stopped
+            finally:
+                batcher.cancel()
+                self.fail_pending()
+                if self.responding:
+                    await asyncio.wait(self.responding, timeout=STOP_TIMEOUT)
+
+    # ====================
+    def fail_pending(self):
+        """Fail the futures of all pairs that have not been scored, so that
+        requests waiting for them get an error response instead of waiting
+        forever. Pairs may be on the queue, in a batch being collected by
+        batch_pairs, or in a batch sent to the worker pool."""
+
+        for future in list(self.pending):
+            if not future.done():
+                future.set_exception(RuntimeError(ERROR_SERVER_STOPPED))
+
+    # ====================
+    async def handle_connection(self,
+                                reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter):
+        """Handle HTTP/1.1 requests on a connection until the client closes
+        it or asks for it to be closed."""
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = \
+                    request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in [b'\r\n', b'\n', b'']:
+                        break
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                content_length = int(headers.get('content-length', 0))
+                if content_length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {
+                        'error': ERROR_BODY_TOO_LARGE.format(
+                            max_size=MAX_BODY_SIZE)}, False)
+                    break
+                body = await reader.readexactly(content_length)
+                keep_alive = version == 'HTTP/1.1' and \
+                    headers.get('connection', '').lower() != 'close'
+                # Requests in progress are answered before the server stops
+                responded = self.loop.create_future()
+                self.responding.add(responded)
+                try:
+                    status, response, response_headers = \
+                        await self.route(method, path, body)
+                    await self.respond(writer, status, response,
+                                       keep_alive and not self.stopped.done(),
+                                       response_headers)
+                finally:
+                    self.responding.discard(responded)
+                    responded.set_result(None)
+                if not keep_alive or self.stopped.done():
+                    break
+        except ValueError:
+            await self.respond(
+                writer, 400, {'error': 'Malformed request.'}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # ====================
+    async def respond(self,
+                      writer: asyncio.StreamWriter,
+                      status: int,
+                      response: dict,
+                      keep_alive: bool,
+                      headers: dict = None):
+
+        body = json.dumps(response).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            + ''.join(f"{name}: {value}\r\n"
+                      for name, value in (headers or {}).items())
+            + f"Connection: {'keep-alive' if keep_alive else 'close'}"
+            "\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    # ====================
+    async def route(self, method: str, path: str, body: bytes) \
+            -> Tuple[int, dict, dict]:
+        """Get the status code, JSON response, and any extra headers for a
+        request."""
+
+        path = path.split('?', 1)[0].rstrip('/') or '/'
+        if path == '/health':
+            return 200, {
+                'status': 'ok',
+                'features': self.features,
+                'num_workers': self.num_workers
+            }, {}
+        if path != '/score':
+            return 404, {
+                'error': ERROR_NOT_FOUND.format(method=method, path=path)}, {}
+        if method != 'POST':
+            return 405, {
+                'error': ERROR_METHOD_NOT_ALLOWED.format(
+                    method=method, path=path, allowed='POST')
+            }, {'Allow': 'POST'}
+        try:
+            payload = json.loads(body)
+            refs, hyps = request_pairs(payload)
+        except ValueError as e:
+            return 400, {'error': str(e).strip()}, {}
+        include_wer = bool(payload.get('include_wer', self.include_wer))
+        try:
+            results = await asyncio.gather(*[
+                self.submit(ref, hyp, include_wer)
+                for ref, hyp in zip(refs, hyps)
+            ])
+        except Exception as e:
+            return 500, {'error': repr(e)}, {}
+        return 200, self.summarize(results, include_wer), {}
+
+    # ====================
+    def submit(self, ref: str, hyp: str, include_wer: bool) \
+            -> asyncio.Future:
+        """Put a pair on the queue to be scored in the next batch."""
+
+        future = self.loop.create_future()
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        self.queue.put_nowait((ref, hyp, include_wer, future))
+        return future
+
+    # ====================
+    async def batch_pairs(self):
+        """Take pairs from the queue in batches and send them to the
+        worker pool."""
+
+        while True:
+            batch = [await self.queue.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            self.pool.apply_async(
+                score_batch,
+                ([(ref, hyp, include_wer)
+                  for ref, hyp, include_wer, _ in batch],),
+                callback=lambda results, batch=batch:
+                    self.schedule_finish_batch(batch, results, None),
+                error_callback=lambda error, batch=batch:
+                    self.schedule_finish_batch(batch, None, error)
+            )
+
+    # ====================
+    def schedule_finish_batch(self, batch: list, results: list,
+                              error: Exception):
+        """Call finish_batch on the event loop from a worker pool thread,
+        unless the loop has closed since the batch was sent."""
+
+        try:
+            self.loop.call_soon_threadsafe(
+                self.finish_batch, batch, results, error)
+        except RuntimeError:
+            # The server has stopped and failed the batch's futures
+            pass
+
+    # ====================
+    def finish_batch(self, batch: list, results: list, error: Exception):
+        """Set the results of the futures for a batch of pairs."""
+
+        self.slots.release()
+        for i, (_, _, _, future) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+
+    # ====================
+    def summarize(self, results: list, include_wer: bool) -> dict:
+        """Get the JSON response for the scored pairs of a request.
+
+        The response has 'prfs' (TP, FP, FN, precision, recall, and
+        F-score for each feature and 'all', summed over the pairs),
+        'num_docs', 'skipped' (the indices of pairs that were skipped
+        because their base characters differ), and 'wer' (reference length,
+        minimum number of edits, and WER over the pairs) if include_wer is
+        True."""
+
+        scored = [counts for counts, _ in results if counts is not None]
+        counts = sum(scored) if scored \
+            else np.zeros((len(self.features), 2, 2), dtype=np.int64)
+        counts = np.concatenate([counts, counts.sum(axis=0)[None]])
+        tp_fp_fn = np.stack(
+            [counts[:, 0, 0], counts[:, 1, 0], counts[:, 0, 1]], axis=1)
+        prfs = np.stack(prf_arrays(counts), axis=1)
+        response = {
+            'num_docs': len(results),
+            'skipped': [
+                i for i, (counts, _) in enumerate(results) if counts is None],
+            'prfs': {
+                feature: {
+                    **dict(zip(COUNT_COLUMNS, tp_fp_fn[i].tolist())),
+                    **{metric: json_number(value) for metric, value
+                       in zip(PRF_COLUMNS, prfs[i].tolist())}
+                }
+                for i, feature in enumerate(self.features + ['all'])
+            }
+        }
+        if include_wer:
+            len_ref = sum(wer_counts[0] for _, wer_counts in results)
+            num_edits = sum(wer_counts[1] for _, wer_counts in results)
+            response['wer'] = {
+                'len_ref': len_ref,
+                'num_edits': num_edits,
+                'wer': num_edits / len_ref * 100 if len_ref else None
+            }
+        return response
+
+
+# ====================
+def request_pairs(payload: dict) -> Tuple[List[str], List[str]]:
+    """Get lists of reference and hypothesis documents from a request
+    payload."""
+
+    if not isinstance(payload, dict):
+        raise ValueError(ERROR_PAYLOAD)
+    docs = []
+    for key in ['reference', 'hypothesis']:
+        value = payload.get(key)
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list) or \
+                not all(isinstance(doc, str) for doc in value):
+            raise ValueError(ERROR_PAYLOAD)
+        docs.append(value)
+    if len(docs[0]) != len(docs[1]):
+        raise ValueError(ERROR_UNEQUAL_LENGTHS)
+    return docs[0], docs[1]
+
+
+# ====================
+def json_number(value: float):
+    """Convert a number to a JSON-safe value (NaN is not valid JSON)."""
+
+    return None if np.isnan(value) else value
+
+
+# ====================
+def init_worker(feature_set: FeatureSet, alignment: bool):
+    """Store the feature set and settings in a worker process and score a
+    sample pair so that everything needed for scoring is loaded before
+    the first request arrives."""
+
+    worker_state['feature_set'] = feature_set
+    worker_state['alignment'] = alignment
+    score_batch([('A b.', 'a b', True)])
+
+
+# ====================
+def score_batch(batch: List[Tuple[str, str, bool]]) -> list:
+    """Score a batch of (reference, hypothesis, include_wer) tuples in a
+    worker process.
+
+    Returns:
+      list:
+        A (counts, wer_counts) tuple for each pair, where counts is an array
+        of character-level counts of shape (num_features, 2, 2) (or None if
+        the pair was skipped) and wer_counts is (reference length, minimum
+        number of edits) (or None if include_wer is False).
+    """
+
+    results = []
+    for ref, hyp, include_wer in batch:
+        ref = ref.strip()
+        hyp = hyp.strip()
+        counts, _ = get_doc_counts(
+            ref, hyp, worker_state['feature_set'],
+            alignment=worker_state['alignment'])
+        wer_counts = None
+        if include_wer:
+            wer_counts = (len(ref.split()), get_num_edits(ref, hyp))
+        results.append(
+            (counts['char'] if counts is not None else None, wer_counts))
+    return results
+
+
+# ====================
+def main(args: List[str] = None):
+    """Run a ScoringServer from the command line."""
+
+    parser = argparse.ArgumentParser(
+        description='Serve feature restoration metrics over HTTP.')
+    parser.add_argument(
+        '--feature-chars', required=True,
+        help="Feature characters to assess, e.g. '.,? '")
+    parser.add_argument(
+        '--capitalization', nargs='?', const=True, default=False,
+        help="Assess capitalization (pass 'word' to assess CAPS_INITIAL "
+             "and CAPS_ALL)")
+    parser.add_argument('--alignment', action='store_true')
+    parser.add_argument('--language', default=None)
+    parser.add_argument('--no-wer', action='store_true',
+                        help='Do not calculate WER by default')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-batch-size', type=int,
+                        default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float,
+                        default=DEFAULT_MAX_WAIT_MS)
+    args = parser.parse_args(args)
+    server = ScoringServer(
+        args.capitalization, args.feature_chars,
+        alignment=args.alignment, language=args.language,
+        include_wer=not args.no_wer, num_workers=args.workers,
+        max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    try:
+        server.run(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import pickle
+import sys
+import tempfile
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from itertools import chain
+from typing import Any, Hashable, Iterator, Tuple
+
+import numpy as np
+
+# zlib compression level for spilled values (fast, and enough to shrink
+# grapheme ids and alignment info several times)
+COMPRESS_LEVEL = 1
+ERROR_MAX_BYTES = """
+max_bytes must not be negative."""
+
+
+# ====================
+class SpillStore(MutableMapping):
+    """A dictionary of per-document values that keeps the most recently
+    used values in memory, up to a budget in bytes, and spills the least
+    recently used values to a temporary file, from which they are read
+    back in transparently when they are next used.
+
+    Spilled values are pickled and compressed, and appended to the file.
+    Values that are read back in keep their place in the file, so they
+    are not written again when they are next spilled. Values should not
+    be modified in place once they are stored: store a new value
+    instead."""
+
+    # ====================
+    def __init__(self, max_bytes: int, spill_dir: str = None):
+        """Initializes an empty SpillStore.
+
+        Args:
+          max_bytes (int):
+            The approximate maximum number of bytes of values to keep in
+            memory. The most recently used value is always kept, even if
+            it is larger than the budget.
+          spill_dir (str, optional):
+            The directory to create the temporary file in. If None, the
+            default temporary directory is used. Defaults to None.
+
+        Raises:
+          ValueError:
+            max_bytes must not be negative.
+        """
+
+        if max_bytes < 0:
+            raise ValueError(ERROR_MAX_BYTES)
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.in_memory = OrderedDict()
+        self.memory_bytes = 0
+        self.on_disk = {}
+        self.disk_bytes = 0
+        self.file = None
+        self.num_spilled = 0
+        self.num_loaded = 0
+
+    # ====================
+    def __getitem__(self, key: Hashable) -> Any:
+
+        if key in self.in_memory:
+            self.in_memory.move_to_end(key)
+            return self.in_memory[key][0]
+        if key not in self.on_disk:
+            raise KeyError(key)
+        value = self.read(key)
+        self.num_loaded += 1
+        self.keep(key, value)
+        return value
+
+    # ====================
+    def __setitem__(self, key: Hashable, value: Any):
+
+        if key in self:
+            del self[key]
+        self.keep(key, value)
+
+    # ====================
+    def __delitem__(self, key: Hashable):
+
+        if key not in self:
+            raise KeyError(key)
+        if key in self.in_memory:
+            self.memory_bytes -= self.in_memory.pop(key)[1]
+        # The record stays in the file until the store is discarded
+        self.on_disk.pop(key, None)
+
+    # ====================
+    def __contains__(self, key: Hashable) -> bool:
+
+        return key in self.in_memory or key in self.on_disk
+
+    # ====================
+    def __iter__(self) -> Iterator[Hashable]:
+
+        return iter(dict.fromkeys(chain(self.on_disk, self.in_memory)))
+
+    # ====================
+    def __len__(self) -> int:
+
+        return len(self.on_disk.keys() | self.in_memory.keys())
+
+    # ====================
+    def __getstate__(self) -> dict:
+
+        # The temporary file cannot be pickled, so all values are pickled
+        # with the store
+        return {
+            'max_bytes': self.max_bytes,
+            'spill_dir': self.spill_dir,
+            'items': list(self.items())
+        }
+
+    # ====================
+    def __setstate__(self, state: dict):
+
+        self.__init__(state['max_bytes'], state['spill_dir'])
+        for key, value in state['items']:
+            self[key] = value
+
+    # ====================
+    def keep(self, key: Hashable, value: Any):
+        """Keep a value in memory as the most recently used, and spill the
+        least recently used values until the store is within budget."""
+
+        size = value_nbytes(value)
+        self.in_memory[key] = (value, size)
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_bytes and len(self.in_memory) > 1:
+            old_key, (old_value, old_size) = \
+                self.in_memory.popitem(last=False)
+            self.memory_bytes -= old_size
+            if old_key not in self.on_disk:
+                self.write(old_key, old_value)
+                self.num_spilled += 1
+
+    # ====================
+    def write(self, key: Hashable, value: Any):
+        """Append a value to the temporary file."""
+
+        if self.file is None:
+            # The file is deleted as soon as it is closed
+            self.file = tempfile.TemporaryFile(dir=self.spill_dir)
+        data = zlib.compress(
+            pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+            COMPRESS_LEVEL)
+        offset = self.file.seek(0, 2)
+        self.file.write(data)
+        self.on_disk[key] = (offset, len(data))
+        self.disk_bytes += len(data)
+
+    # ====================
+    def read(self, key: Hashable) -> Any:
+        """Read a spilled value from the temporary file."""
+
+        offset, length = self.on_disk[key]
+        self.file.seek(offset)
+        return pickle.loads(zlib.decompress(self.file.read(length)))
+
+    # ====================
+    def usage(self) -> Tuple[int, int]:
+        """Get the approximate number of bytes of values held in memory and
+        the number of bytes written to disk."""
+
+        return self.memory_bytes, self.disk_bytes
+
+
+# ====================
+def value_nbytes(value: Any) -> int:
+    """Estimate the number of bytes of memory used by a value made up of
+    numpy arrays, strings, numbers, and lists, tuples, and dicts of
+    them."""
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(value_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            value_nbytes(k) + value_nbytes(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+# ====================
+def disk_array(array: np.ndarray, spill_dir: str = None) -> np.ndarray:
+    """Copy an array to a memory-mapped temporary file, so that the
+    operating system only keeps recently used parts of it in memory."""
+
+    if array.size == 0:
+        return array
+    # The file is deleted when the array is garbage collected
+    file = tempfile.TemporaryFile(dir=spill_dir)
+    disk = np.memmap(file, dtype=array.dtype, mode='w+', shape=array.shape)
+    disk[:] = array
+    return disk
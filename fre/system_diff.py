@@ -0,0 +1,322 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from fre.alignment import matching_blocks
+from fre.feature_set import FeatureSet
+from fre.misc import CASE_FEATURES, display_or_print_html, get_tqdm
+from fre.result_store import NOT_SCORED, SCORED, SKIPPED
+
+tqdm_ = get_tqdm()
+
+# Change types, in the order of the last axis of SystemDiff.counts
+FIXED = 0
+REGRESSED = 1
+UNCHANGED = 2
+CHANGE_TYPES = ['fixed', 'regressed', 'unchanged']
+
+ERROR_DIFFERENT_FEATURES = """
+Both evaluators must assess the same features."""
+ERROR_DIFFERENT_REFERENCE = """
+Both evaluators must have the same number of reference documents."""
+MESSAGE_COMPARING = "Comparing systems for all documents..."
+WARNING_SKIPPED = """Base characters of reference and hypothesis documents \
+differ in document index: {doc_idx}. Skipping this document."""
+
+HTML_STYLE_DIFF = """<style>
+.fixed{
+    background-color: green
+}
+.regressed{
+    background-color: red
+}
+.unchanged{
+    background-color: gray
+}
+pre {
+  white-space: pre-wrap;
+}
+</style>"""
+
+
+# ====================
+class SystemDiff:
+    """Position-by-position comparison of the feature restorations of two
+    systems (A and B) against the same reference documents.
+
+    At each position in the reference, each feature is labelled as fixed
+    (wrong in A, correct in B), regressed (correct in A, wrong in B), or
+    unchanged (wrong in both). The reference and both hypotheses are
+    parsed into feature code arrays once per document, and labels for
+    all features are computed together with bitwise operations on the
+    codes."""
+
+    # ====================
+    def __init__(self, evaluator_a, evaluator_b, alignment: bool = None):
+        """Initializes an instance of SystemDiff.
+
+        Args:
+          evaluator_a (FeatureRestorationEvaluator):
+            The evaluator for system A.
+          evaluator_b (FeatureRestorationEvaluator):
+            The evaluator for system B. Must have the same features and
+            number of documents as evaluator_a. The reference documents
+            of evaluator_a are used.
+          alignment (bool, optional):
+            Whether or not to align each hypothesis to the reference where
+            base characters differ, and compare features only at positions
+            that are aligned in both. If None, evaluator_a.alignment is
+            used. Defaults to None.
+        """
+
+        if evaluator_a.features != evaluator_b.features:
+            raise ValueError(ERROR_DIFFERENT_FEATURES)
+        if len(evaluator_a.reference) != len(evaluator_b.reference):
+            raise ValueError(ERROR_DIFFERENT_REFERENCE)
+        self.evaluator_a = evaluator_a
+        self.evaluator_b = evaluator_b
+        self.feature_set: FeatureSet = evaluator_a.feature_set
+        self.features = self.feature_set.features
+        self.alignment = \
+            evaluator_a.alignment if alignment is None else alignment
+        num_docs = len(evaluator_a.reference)
+        self.counts = np.zeros(
+            (num_docs, len(self.features), len(CHANGE_TYPES)),
+            dtype=np.int64)
+        self.status = np.full(num_docs, NOT_SCORED, dtype=np.int8)
+
+    # ====================
+    def docs(self, doc_idx: int) -> Tuple[str, str, str]:
+        """Get the reference and hypothesis documents at an index."""
+
+        return (
+            self.evaluator_a.reference[doc_idx].strip(),
+            self.evaluator_a.hypothesis[doc_idx].strip(),
+            self.evaluator_b.hypothesis[doc_idx].strip()
+        )
+
+    # ====================
+    def doc_labels(self, doc_idx: int) -> tuple:
+        """Align a document in the reference and both hypotheses and label
+        the changes between the systems.
+
+        Returns:
+          tuple:
+            The reference positions that are aligned in both hypotheses,
+            the positions in hypothesis A and hypothesis B aligned with
+            every reference position (or -1), and arrays of feature
+            bitmasks for the aligned positions in which bit i is set if
+            features[i] was fixed, regressed, or unchanged, respectively.
+            Returns None if the base characters of either hypothesis
+            differ from the reference and alignment is False.
+        """
+
+        ref, hyp_a, hyp_b = self.docs(doc_idx)
+        parsed_ref = self.feature_set.parse(ref, case_info=True)
+        chars_ref, codes_ref, _ = parsed_ref
+        maps = []
+        codes_hyps = []
+        for hyp in [hyp_a, hyp_b]:
+            parsed_hyp = self.feature_set.parse(hyp, case_info=True)
+            mapping = ref_to_hyp(chars_ref, parsed_hyp[0], self.alignment)
+            if mapping is None:
+                return None
+            # Hypothesis codes at each aligned reference position, with
+            # case features on the word starts of the reference, as scored
+            aligned = np.flatnonzero(mapping >= 0)
+            codes_hyp = np.zeros(len(chars_ref), dtype=np.int64)
+            codes_hyp[aligned] = self.feature_set.reference_word_codes(
+                parsed_ref, parsed_hyp, aligned, mapping[aligned])
+            maps.append(mapping)
+            codes_hyps.append(codes_hyp)
+        map_a, map_b = maps
+        positions = np.flatnonzero((map_a >= 0) & (map_b >= 0))
+        codes_ref = codes_ref[positions]
+        errors_a = codes_ref ^ codes_hyps[0][positions]
+        errors_b = codes_ref ^ codes_hyps[1][positions]
+        return (
+            positions, map_a, map_b,
+            errors_a & ~errors_b, ~errors_a & errors_b, errors_a & errors_b
+        )
+
+    # ====================
+    def compare_doc(self, doc_idx: int):
+        """Compare the systems on a single document and store the
+        counts."""
+
+        labels = self.doc_labels(doc_idx)
+        if labels is None:
+            print(WARNING_SKIPPED.format(doc_idx=doc_idx))
+            self.status[doc_idx] = SKIPPED
+            self.counts[doc_idx] = 0
+            return
+        shifts = np.arange(len(self.features), dtype=np.int64)
+        self.counts[doc_idx] = np.stack([
+            ((mask[:, None] >> shifts) & 1).sum(axis=0)
+            for mask in labels[3:]
+        ], axis=1)
+        self.status[doc_idx] = SCORED
+
+    # ====================
+    def compare_all(self):
+        """Compare the systems on all documents that have not yet been
+        compared."""
+
+        print(MESSAGE_COMPARING)
+        for doc_idx in tqdm_(range(len(self.status))):
+            if self.status[doc_idx] == NOT_SCORED:
+                self.compare_doc(doc_idx)
+
+    # ====================
+    def get_counts(self, doc_idx='all') -> pd.DataFrame:
+        """Get the number of fixed, regressed, and unchanged errors for
+        each feature, for a single document or all documents.
+
+        Args:
+          doc_idx (Int_or_Str, optional):
+            Either an integer indicating the index of a document, or 'all'
+            to sum counts over all documents. Defaults to 'all'.
+
+        Returns:
+          pd.DataFrame:
+            A dataframe with a row for each feature and 'all', and
+            columns fixed, regressed, unchanged, and net (fixed minus
+            regressed).
+        """
+
+        if doc_idx == 'all':
+            self.compare_all()
+            counts = self.counts[self.status == SCORED].sum(axis=0)
+        else:
+            if self.status[doc_idx] == NOT_SCORED:
+                self.compare_doc(doc_idx)
+            counts = self.counts[doc_idx]
+        counts_df = pd.DataFrame(
+            counts, index=self.features, columns=CHANGE_TYPES)
+        counts_df.loc['all'] = counts_df.sum()
+        counts_df['net'] = counts_df['fixed'] - counts_df['regressed']
+        return counts_df
+
+    # ====================
+    def get_doc_counts_df(self) -> pd.DataFrame:
+        """Get the number of fixed and regressed errors (over all
+        features) for each document, indexed by document index."""
+
+        self.compare_all()
+        totals = self.counts.sum(axis=1)
+        doc_counts_df = pd.DataFrame(
+            totals, columns=CHANGE_TYPES,
+            index=pd.RangeIndex(len(totals), name='doc_idx'))
+        doc_counts_df['net'] = \
+            doc_counts_df['fixed'] - doc_counts_df['regressed']
+        return doc_counts_df[self.status == SCORED]
+
+    # ====================
+    def show_diff(self,
+                  doc_idx: int,
+                  start_char: int = 0,
+                  num_chars: int = None):
+        """Display a reference document with feature restorations that
+        were fixed, regressed, or unchanged between system A and system B
+        highlighted.
+
+        Characters are highlighted for case features, and feature
+        characters are shown as they appear in system B (or in system A
+        or the reference if they are absent from system B).
+
+        Args:
+          doc_idx (int):
+            The index of the document to display.
+          start_char (int, optional):
+            The base character to display from. Defaults to 0.
+          num_chars (int, optional):
+            The number of base characters to display. If None, displays
+            to the end of the document. Defaults to None.
+        """
+
+        labels = self.doc_labels(doc_idx)
+        if labels is None:
+            print(WARNING_SKIPPED.format(doc_idx=doc_idx))
+            return
+        positions, map_a, map_b = labels[:3]
+        ref, hyp_a, hyp_b = self.docs(doc_idx)
+        chars_ref, features_ref = self.feature_set.split(ref)
+        _, features_a = self.feature_set.split(hyp_a)
+        _, features_b = self.feature_set.split(hyp_b)
+        position_labels = {
+            p: masks for p, *masks in zip(positions, *labels[3:])}
+        end = len(chars_ref) if num_chars is None else start_char + num_chars
+        entries = []
+        for pos in range(start_char, min(end, len(chars_ref))):
+            if pos not in position_labels:
+                entries.append(chars_ref[pos])
+                continue
+            present = {
+                'ref': features_ref[pos],
+                'a': features_a[map_a[pos]],
+                'b': features_b[map_b[pos]]
+            }
+            entries.extend(diff_entries(
+                chars_ref[pos], present, self.features, position_labels[pos]))
+        display_or_print_html(
+            HTML_STYLE_DIFF + f"<pre>{''.join(entries)}</pre>")
+
+
+# ====================
+def ref_to_hyp(chars_ref: List[str],
+               chars_hyp: List[str],
+               alignment: bool) -> np.ndarray:
+    """Get the position in the hypothesis aligned with each position in
+    the reference, or -1 for reference positions that are not aligned.
+
+    Returns None if the base characters differ and alignment is False."""
+
+    if chars_ref == chars_hyp:
+        return np.arange(len(chars_ref), dtype=np.int64)
+    if alignment is not True:
+        return None
+    mapping = np.full(len(chars_ref), -1, dtype=np.int64)
+    for i, j, n in matching_blocks(chars_ref, chars_hyp):
+        mapping[i:i+n] = np.arange(j, j+n)
+    return mapping
+
+
+# ====================
+def diff_entries(char: str,
+                 present: Dict[str, Dict[str, str]],
+                 features: List[str],
+                 labels: Tuple[int, int, int]) -> List[str]:
+    """Get HTML entries for a base character and the features that follow
+    it in any of the reference and two hypotheses."""
+
+    def change_type(bit: int) -> str:
+        for type_, mask in zip(CHANGE_TYPES, labels):
+            if (mask >> bit) & 1:
+                return type_
+        return None
+
+    entries = []
+    case_changes = [
+        change_type(i) for i, f in enumerate(features)
+        if f in CASE_FEATURES and change_type(i) is not None
+    ]
+    entries.append(span_or_text(case_changes[0] if case_changes else None,
+                                char))
+    for i, feature in enumerate(features):
+        if feature in CASE_FEATURES:
+            continue
+        for side in ['b', 'a', 'ref']:
+            if feature in present[side]:
+                entries.append(span_or_text(
+                    change_type(i), present[side][feature]))
+                break
+    return entries
+
+
+# ====================
+def span_or_text(class_: str, text: str) -> str:
+
+    if class_ is None:
+        return text
+    return f'<span class="{class_}">{text}</span>'
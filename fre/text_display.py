@@ -1,9 +1,16 @@
-from typing import Tuple
+import os
+import shlex
+import subprocess
+import sys
+from contextlib import contextmanager
+from itertools import chain, islice
+from typing import Dict, Iterator, List, TextIO, Tuple, Union
 
 import pandas as pd
 
-from fre.misc import (CAPS, check_same_char, display_or_print,
-                       display_or_print_html)
+from fre.feature_set import Feature, FeatureSet, compile_features
+from fre.misc import (CASE_FEATURES, check_same_char, display_or_print,
+                      display_or_print_html, is_running_in_notebook)
 
 ERROR_CHARS_PER_ROW_AND_NUM_ROWS = """
 Either none or both of chars_per_row and num_rows must be specified."""
@@ -19,59 +26,243 @@ pre {
   white-space: pre-wrap;
 }
 </style>"""
+# Format strings for labelled entries, keyed by (label, is_feature)
+LATEX_WRAPPERS = {
+    ('', False): '{}',
+    ('', True): '{}',
+    ('fp', False): '\\fp{{{}}}',
+    ('fp', True): '\\fp{{\\mbox{{{}}}}}',
+    ('fn', False): '\\fn{{{}}}',
+    ('fn', True): '\\fn{{\\mbox{{{}}}}}'
+}
+ROW_END_SPACE = r"\Verb+{\ }+"
+OTHER_SPACE = r"{\ }"
+# ANSI escape sequences for labelled entries in terminals (the same
+# background colours as HTML_STYLE)
+ANSI_CODES = {
+    'fp': '\x1b[42m',
+    'fn': '\x1b[45m'
+}
+ANSI_RESET = '\x1b[0m'
+# The number of entries written at a time when there is no row length
+STREAM_CHUNK_SIZE = 4096
+DEFAULT_PAGER = 'less'
 
 
 # ====================
 def show_text_display_(ref: str,
                        hyp: str,
-                       features: list,
-                       feature_chars: list,
+                       features: Union[List[Feature], FeatureSet],
                        start_char: int = 0,
                        chars_per_row: int = None,
                        num_rows: int = None,
                        for_latex: bool = False,
-                       ignore: list = None):
+                       ignore: list = None,
+                       pager: bool = False):
 
     if ignore is None:
         ignore = []
-    chars = {'ref': list(ref), 'hyp': list(hyp)}
-    labelled = label_fps_and_fns(
-        chars, features, feature_chars, ignore, for_latex)
-    labelled = labelled[start_char:]
+    feature_set = display_feature_set(features, ignore)
     cpr_nr_given = sum([chars_per_row is not None, num_rows is not None])
     if cpr_nr_given == 1:
         raise ValueError(ERROR_CHARS_PER_ROW_AND_NUM_ROWS)
-    elif cpr_nr_given == 2:
-        rows = to_rows(labelled, chars_per_row, num_rows)
-        if for_latex is True:
-            rows = [escape_spaces_row(row) for row in rows]
-            final_latex = '\n'.join(
-                [f"\\texttt{{{''.join(r)}}}\\\\" for r in rows]
-            )
-            print(final_latex)
+    if for_latex is True:
+        labels = get_labels(ref, hyp, feature_set, ignore)
+        print(latex_snippet(labels, start_char, chars_per_row, num_rows))
+        return
+    if not is_running_in_notebook():
+        if pager is True:
+            with open_pager() as out:
+                stream_text_display(ref, hyp, feature_set, ignore, start_char,
+                                    chars_per_row, num_rows, out)
         else:
-            html = '<br>'.join(''.join(r) for r in rows)
-            final_html = HTML_STYLE + pre(html)
-            display_or_print_html(final_html)
+            stream_text_display(ref, hyp, feature_set, ignore, start_char,
+                                chars_per_row, num_rows)
+        return
+    labelled = label_fps_and_fns(ref, hyp, feature_set, ignore, for_latex)
+    labelled = labelled[start_char:]
+    if cpr_nr_given == 2:
+        rows = to_rows(labelled, chars_per_row, num_rows)
+        html = '<br>'.join(''.join(r) for r in rows)
+        final_html = HTML_STYLE + pre(html)
+        display_or_print_html(final_html)
     else:
-        if for_latex is True:
-            final_latex = f"\\texttt{{{''.join(labelled)}}}\\\\"
-            print(final_latex)
-        else:
-            html = HTML_STYLE + pre(''.join(labelled))
-            display_or_print_html(html)
+        html = HTML_STYLE + pre(''.join(labelled))
+        display_or_print_html(html)
+
+
+# ====================
+def stream_text_display(ref: str,
+                        hyp: str,
+                        features: Union[List[Feature], FeatureSet],
+                        ignore: list = None,
+                        start_char: int = None,
+                        chars_per_row: int = None,
+                        num_rows: int = None,
+                        out: TextIO = None):
+    """Write a hypothesis document to a terminal with false positives and
+    false negatives highlighted in ANSI colours.
+
+    Entries are labelled lazily by iter_labels and written a row at a
+    time, so memory use does not grow with the length of the document and
+    labelling stops once num_rows rows have been written.
+
+    Args:
+      ref (str):
+        The reference document.
+      hyp (str):
+        The hypothesis document.
+      features (Union[List[Feature], FeatureSet]):
+        The features.
+      ignore (list, optional):
+        A list of features to ignore. Defaults to None.
+      start_char (int, optional):
+        The entry to start from. If None, starts from the beginning of
+        the document. Defaults to None.
+      chars_per_row (int, optional):
+        The number of entries per row. If None, no line breaks are
+        inserted. Defaults to None.
+      num_rows (int, optional):
+        The number of rows. Must be specified if chars_per_row is
+        specified. Defaults to None.
+      out (TextIO, optional):
+        The stream to write to. If None, writes to stdout. Defaults to
+        None.
+    """
+
+    if ignore is None:
+        ignore = []
+    if out is None:
+        out = sys.stdout
+    feature_set = display_feature_set(features, ignore)
+    entries = chain.from_iterable(iter_labels(ref, hyp, feature_set, ignore))
+    start_char = start_char or 0
+    if chars_per_row is None:
+        entries = islice(entries, start_char, None)
+        row_length, row_end = STREAM_CHUNK_SIZE, ''
+    else:
+        entries = islice(
+            entries, start_char, start_char + chars_per_row * num_rows)
+        row_length, row_end = chars_per_row, '\n'
+    try:
+        while True:
+            row = list(islice(entries, row_length))
+            if not row:
+                break
+            out.write(''.join(format_ansi(entry) for entry in row) + row_end)
+            out.flush()
+        if chars_per_row is None:
+            out.write('\n')
+            out.flush()
+    except BrokenPipeError:
+        # The pager was closed before the end of the display
+        pass
+
+
+# ====================
+@contextmanager
+def open_pager() -> Iterator[TextIO]:
+    """Open a pager ($PAGER, or less) to write ANSI-coloured text to.
+
+    Yields stdout instead if stdout is not a terminal or the pager cannot
+    be started."""
+
+    command = shlex.split(os.environ.get('PAGER', DEFAULT_PAGER))
+    if not command or not sys.stdout.isatty():
+        yield sys.stdout
+        return
+    env = dict(os.environ)
+    # less only shows colours with the -R option
+    env.setdefault('LESS', 'R')
+    try:
+        process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, env=env, text=True,
+            encoding='utf-8', errors='replace')
+    except OSError:
+        yield sys.stdout
+        return
+    try:
+        yield process.stdin
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+
+
+# ====================
+def latex_snippet(labels: List[Tuple[str, str, bool]],
+                  start_char: int = 0,
+                  chars_per_row: int = None,
+                  num_rows: int = None) -> str:
+    """Build a LaTeX text display snippet from the output of get_labels.
+
+    Entries are formatted by looking up the LaTeX commands to wrap them
+    in from LATEX_WRAPPERS and joined once per row, rather than through
+    separate function calls for each entry.
+
+    Args:
+      labels (List[Tuple[str, str, bool]]):
+        The labelled entries returned by get_labels.
+      start_char (int, optional):
+        The entry to start from. Defaults to 0.
+      chars_per_row (int, optional):
+        The number of entries per row. If None, the snippet is a single
+        row. Defaults to None.
+      num_rows (int, optional):
+        The number of rows. Must be specified if chars_per_row is
+        specified. Defaults to None.
+
+    Returns:
+      str:
+        The snippet, with each row wrapped in \\texttt.
+    """
+
+    entries = [
+        LATEX_WRAPPERS[label, is_feature].format(text)
+        for text, label, is_feature in labels[start_char:]
+    ]
+    if chars_per_row is None:
+        return f"\\texttt{{{''.join(entries)}}}\\\\"
+    rows = []
+    for start in range(0, chars_per_row * num_rows, chars_per_row):
+        row = entries[start:start + chars_per_row]
+        if not row:
+            break
+        first = ROW_END_SPACE if row[0] == ' ' else row[0]
+        last = ROW_END_SPACE if row[-1] == ' ' else row[-1]
+        middle = ''.join(
+            [OTHER_SPACE if e == ' ' else e for e in row[1:-1]])
+        row_latex = first if len(row) == 1 else first + middle + last
+        rows.append(f"\\texttt{{{row_latex}}}\\\\")
+    return '\n'.join(rows)
+
+
+# ====================
+def display_feature_set(features: Union[List[Feature], FeatureSet],
+                        ignore: list) -> FeatureSet:
+    """Get a FeatureSet for display, in which any characters to ignore
+    that are not already features are also treated as features."""
+
+    feature_set = compile_features(features)
+    extra = [i for i in ignore if i not in feature_set.features]
+    if not extra:
+        return feature_set
+    return FeatureSet(feature_set.specs + extra, feature_set.language)
 
 
 # ====================
 def show_feature_errors_(ref: str,
                          hyp: str,
-                         features: list,
+                         features: Union[List[Feature], FeatureSet],
                          feature_to_check: str,
                          chars_either_side: int):
 
     errors = []
-    chars_ref, features_ref = split_chars_and_features(ref, features)
-    chars_hyp, features_hyp = split_chars_and_features(hyp, features)
+    feature_set = compile_features(features)
+    chars_ref, features_ref = split_chars_and_features(ref, feature_set)
+    chars_hyp, features_hyp = split_chars_and_features(hyp, feature_set)
     for i in range(len(chars_ref)):
         if (feature_to_check in features_ref[i]
                 and feature_to_check not in features_hyp[i]):
@@ -118,104 +309,149 @@ def join_all(chars, features) -> str:
 
 
 # ====================
-def join_(char, features) -> str:
+def join_(char, features: Dict[str, str]) -> str:
 
-    return char + ''.join([f for f in features if f != CAPS])
+    return char + ''.join(features.values())
 
 
 # ====================
-def split_chars_and_features(doc: str, features: list):
-
-    chars = list(doc)
-    chars_only = []
-    features_only = []
-    while chars:
-        next_char = chars.pop(0)
-        features_present = []
-        if CAPS in features and next_char.isupper():
-            features_present.append(CAPS)
-        while len(chars) > 0 and chars[0] in features:
-            features_present.append(chars.pop(0))
-        chars_only.append(next_char)
-        features_only.append(features_present)
-    return chars_only, features_only
+def split_chars_and_features(doc: str,
+                             features: Union[List[Feature], FeatureSet]) \
+        -> Tuple[List[str], List[Dict[str, str]]]:
+
+    return compile_features(features).split(doc)
 
 
 # ====================
-def label_fps_and_fns(chars: dict,
-                      features: list,
-                      feature_chars: list,
+def label_fps_and_fns(ref: str,
+                      hyp: str,
+                      features: Union[List[Feature], FeatureSet],
                       ignore: list,
-                      for_latex: bool = False) -> str:
+                      for_latex: bool = False) -> list:
+
+    labels = get_labels(ref, hyp, features, ignore)
+    if labels is None:
+        return None
+    return [format_entry(entry, for_latex) for entry in labels]
+
 
-    output_chars = []
-    while chars['ref'] and chars['hyp']:
-        next_char = {'ref': chars['ref'].pop(0), 'hyp': chars['hyp'].pop(0)}
-        ignored_chars, chars = ignore_chars(chars, ignore)
-        if check_same_char(next_char, chars) is not True:
+# ====================
+def get_labels(ref: str,
+               hyp: str,
+               features: Union[List[Feature], FeatureSet],
+               ignore: list) -> List[Tuple[str, str, bool]]:
+    """Get the entries of a hypothesis document for display, each
+    labelled as a false positive, false negative, or neither.
+
+    Returns:
+      List[Tuple[str, str, bool]]:
+        A (text, label, is_feature) tuple for each base character and
+        feature in the document, where label is 'fp', 'fn', or '' and
+        is_feature is True for feature text. Returns None if the base
+        characters of the reference and hypothesis documents differ.
+    """
+
+    feature_set = compile_features(features)
+    (chars_ref, features_ref), (chars_hyp, features_hyp) = \
+        feature_set.split_pair(ref, hyp)
+    labels = []
+    for i, (char_ref, char_hyp) in enumerate(zip(chars_ref, chars_hyp)):
+        next_char = {'ref': char_ref, 'hyp': char_hyp}
+        following = {'ref': chars_ref[i+1:i+11], 'hyp': chars_hyp[i+1:i+11]}
+        if check_same_char(next_char, following,
+                           fold=feature_set.fold) is not True:
             return None
-        features_present, chars = get_features_present(
-            next_char, chars, features)
-        output_chars.extend(get_next_entries(
-            next_char, features_present, features, feature_chars,
-            ignored_chars=ignored_chars,
-            ignore_caps=CAPS in ignore,
-            for_latex=for_latex
+        features_present = {'ref': features_ref[i], 'hyp': features_hyp[i]}
+        labels.extend(get_next_labels(
+            next_char, features_present, feature_set.features, ignore=ignore
         ))
-    return output_chars
+    return labels
 
 
 # ====================
-def ignore_chars(chars: dict, ignore: list) -> Tuple[str, dict]:
+def iter_labels(ref: str,
+                hyp: str,
+                features: Union[List[Feature], FeatureSet],
+                ignore: list) -> Iterator[List[Tuple[str, str, bool]]]:
+    """Lazily label the entries of a hypothesis document for display, as
+    get_labels does, yielding the entries for each base character in turn.
+
+    If the base characters of the reference and hypothesis documents
+    differ, a warning is printed and iteration stops at the first
+    difference."""
+
+    feature_set = compile_features(features)
+    split_pairs = feature_set.iter_split_pair(ref, hyp)
+    for (char_ref, features_ref), (char_hyp, features_hyp) in split_pairs:
+        next_char = {'ref': char_ref, 'hyp': char_hyp}
+        if feature_set.fold(char_ref) != feature_set.fold(char_hyp):
+            following_pairs = list(islice(split_pairs, 10))
+            following = {
+                'ref': [char for (char, _), _ in following_pairs],
+                'hyp': [char for _, (char, _) in following_pairs]
+            }
+            check_same_char(next_char, following, fold=feature_set.fold)
+            return
+        features_present = {'ref': features_ref, 'hyp': features_hyp}
+        yield get_next_labels(
+            next_char, features_present, feature_set.features, ignore=ignore)
+
 
-    ignored_chars = []
-    while len(chars['hyp']) > 0 and chars['hyp'][0] in ignore:
-        ignored_chars.append(chars['hyp'].pop(0))
-    while len(chars['ref']) > 0 and chars['ref'][0] in ignore:
-        chars['ref'].pop(0)
-    return ignored_chars, chars
+# ====================
+def get_next_labels(next_char: dict,
+                    features_present: dict,
+                    features: list,
+                    ignore: list) -> List[Tuple[str, str, bool]]:
+
+    next_labels = []
+    case_errors = [
+        tfpn(f, features_present) for f in features
+        if f in CASE_FEATURES and f not in ignore
+        and tfpn(f, features_present) in ['fn', 'fp']
+    ]
+    if case_errors:
+        next_labels.append((next_char['hyp'], case_errors[0], False))
+    else:
+        next_labels.append((next_char['hyp'], '', False))
+    for feature in features:
+        if feature in CASE_FEATURES:
+            continue
+        tfpn_ = tfpn(feature, features_present)
+        if feature in ignore:
+            if feature in features_present['hyp']:
+                next_labels.append(
+                    (features_present['hyp'][feature], '', True))
+        elif tfpn_ == 'fn':
+            next_labels.append(
+                (features_present['ref'][feature], tfpn_, True))
+        elif tfpn_ == 'fp':
+            next_labels.append(
+                (features_present['hyp'][feature], tfpn_, True))
+        elif tfpn_ == 'tp':
+            next_labels.append((features_present['hyp'][feature], '', True))
+    return next_labels
 
 
 # ====================
-def get_features_present(next_char: dict, chars: dict, features: list) -> dict:
+def format_entry(entry: Tuple[str, str, bool],
+                 for_latex: bool = False) -> str:
 
-    features_present = {'ref': [], 'hyp': []}
-    for ref_or_hyp in chars.keys():
-        if CAPS in features and next_char[ref_or_hyp].isupper():
-            features_present[ref_or_hyp].append(CAPS)
-        while len(chars[ref_or_hyp]) > 0 and chars[ref_or_hyp][0] in features:
-            features_present[ref_or_hyp].append(chars[ref_or_hyp].pop(0))
-    return features_present, chars
+    text, label, is_feature = entry
+    if not label:
+        return text
+    class_label = cmd if for_latex else span_class
+    if is_feature and for_latex:
+        text = mbox(text)
+    return class_label(label, text)
 
 
 # ====================
-def get_next_entries(next_char: dict,
-                     features_present: dict,
-                     features: list,
-                     feature_chars: list,
-                     ignored_chars: list,
-                     ignore_caps: bool,
-                     for_latex: bool = False) -> list:
-
-    # print(ignored_chars)
-    class_label = cmd if for_latex else span_class
-    char_box = mbox if for_latex else lambda x: x
-    next_entries = []
-    if CAPS in features:
-        tfpn_ = tfpn(CAPS, features_present)
-        if tfpn_ not in ['fn', 'fp'] or ignore_caps is True:
-            next_entries.append(next_char['hyp'])
-        else:
-            next_entries.append(class_label(tfpn_, next_char['hyp']))
-    else:
-        next_entries.append(next_char['hyp'])
-    for feature in feature_chars:
-        tfpn_ = tfpn(feature, features_present)
-        if tfpn_ in ['fn', 'fp']:
-            next_entries.append(class_label(tfpn_, char_box(feature)))
-        elif tfpn_ == 'tp' or feature in ignored_chars:
-            next_entries.append(feature)
-    return next_entries
+def format_ansi(entry: Tuple[str, str, bool]) -> str:
+
+    text, label, _ = entry
+    if not label:
+        return text
+    return f"{ANSI_CODES[label]}{text}{ANSI_RESET}"
 
 
 # ====================
@@ -282,44 +518,3 @@ def fn(char: str) -> str:
 def fp(char: str) -> str:
 
     return cmd('fp', char)
-
-
-# ====================
-def escape_spaces_row(row: str) -> str:
-
-    row = escape_row_end_spaces(row)
-    row = escape_other_spaces(row)
-    return row
-
-
-# ====================
-def escape_row_end_spaces(row: str) -> str:
-
-    row[0] = escape_row_end_space(row[0])
-    row[-1] = escape_row_end_space(row[-1])
-    return row
-
-
-# ====================
-def escape_row_end_space(entry: str) -> str:
-
-    if entry == ' ':
-        return r"\Verb+{\ }+"
-    else:
-        return entry
-
-
-# ====================
-def escape_other_spaces(row: str) -> str:
-
-    row = [escape_other_space(e) for e in row]
-    return row
-
-
-# ====================
-def escape_other_space(entry: str) -> str:
-
-    if entry == ' ':
-        return r"{\ }"
-    else:
-        return entry
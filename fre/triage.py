@@ -0,0 +1,181 @@
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+METRICS = ['Precision', 'Recall', 'F-score', 'wer']
+ERROR_METRIC = """
+metric must be one of {metrics}."""
+ERROR_FEATURE = """
+Feature '{feature}' is not available. Available features: {features}"""
+ERROR_RANK = """
+Rank {rank} is out of range for the {k} documents returned by the last call \
+to worst."""
+
+
+# ====================
+class Triage:
+    """Ranking of documents by how badly a feature was restored (or by
+    word error rate), with links to the display functions of a
+    FeatureRestorationEvaluator for the worst documents.
+
+    Metric arrays for all documents are taken from the evaluator's result
+    store when the Triage object is created. The sorted order of documents
+    for each (feature, metric, weighting) combination is computed once with
+    np.argsort and reused for subsequent queries."""
+
+    # ====================
+    def __init__(self, evaluator, granularity: str = 'char'):
+        """Initializes an instance of Triage.
+
+        Args:
+          evaluator (FeatureRestorationEvaluator):
+            The evaluator. Confusion matrices and word error rates should
+            already have been calculated for all documents.
+          granularity (str, optional):
+            The granularity of the feature metrics to rank by. Defaults to
+            'char'.
+        """
+
+        self.evaluator = evaluator
+        results = evaluator.results
+        results.check_granularity(granularity)
+        self.features = results.features + ['all']
+        columns, data = results.metric_arrays(granularity, include_wer=True)
+        metric_values = dict(zip(columns, data))
+        self.precision, self.recall, self.fscore = [
+            np.stack([metric_values[(feature, metric)]
+                      for feature in self.features], axis=1)
+            for metric in ['Precision', 'Recall', 'F-score']
+        ]
+        # Number of scored positions in each document
+        self.doc_lengths = \
+            results.counts[granularity][:, 0].sum(axis=(1, 2)).astype(float)
+        self.wer = metric_values[('WER', 'wer')]
+        self.wer_lengths = metric_values[('WER', 'len_ref')]
+        self.orders: Dict[Tuple[str, str, bool], np.ndarray] = {}
+        self.last_worst = np.zeros(0, dtype=np.int64)
+
+    # ====================
+    def badness(self, feature: str, metric: str,
+                weight_by_length: bool) -> np.ndarray:
+        """Get a score for each document that is higher for worse
+        documents, or NaN where the metric is undefined.
+
+        For precision, recall, and F-score, the score is 1 minus the
+        metric. For WER, it is the WER. If weight_by_length is True, the
+        score is multiplied by the length of the document (scored
+        characters or reference words), so that long documents with many
+        errors rank above short documents with few errors."""
+
+        if metric not in METRICS:
+            raise ValueError(ERROR_METRIC.format(metrics=METRICS))
+        if metric == 'wer':
+            badness = self.wer
+            lengths = self.wer_lengths
+        else:
+            if feature not in self.features:
+                raise ValueError(ERROR_FEATURE.format(
+                    feature=feature, features=self.features))
+            values = {
+                'Precision': self.precision,
+                'Recall': self.recall,
+                'F-score': self.fscore
+            }[metric]
+            badness = 1 - values[:, self.features.index(feature)]
+            lengths = self.doc_lengths
+        if weight_by_length is True:
+            badness = badness * lengths
+        return badness
+
+    # ====================
+    def order(self, feature: str, metric: str,
+              weight_by_length: bool) -> np.ndarray:
+        """Get document indices sorted from worst to best, with documents
+        for which the metric is undefined last."""
+
+        key = (feature if metric != 'wer' else None, metric, weight_by_length)
+        if key not in self.orders:
+            badness = self.badness(feature, metric, weight_by_length)
+            # Sort by descending badness; NaNs sort to the end
+            self.orders[key] = np.argsort(-badness, kind='stable')
+        return self.orders[key]
+
+    # ====================
+    def worst(self,
+              feature: str = 'all',
+              metric: str = 'F-score',
+              k: int = 10,
+              weight_by_length: bool = False) -> pd.DataFrame:
+        """Get the k worst documents for a feature and metric.
+
+        Args:
+          feature (str, optional):
+            The feature to rank documents by (ignored if metric is 'wer').
+            Defaults to 'all'.
+          metric (str, optional):
+            One of 'Precision', 'Recall', 'F-score' (lowest first) or
+            'wer' (highest first). Defaults to 'F-score'.
+          k (int, optional):
+            The number of documents to return. Defaults to 10.
+          weight_by_length (bool, optional):
+            Whether or not to weight the ranking by document length.
+            Defaults to False.
+
+        Returns:
+          pd.DataFrame:
+            A dataframe with a row for each of the k worst documents, in
+            order, with the document index, metric value, and document
+            length. Pass a row number (rank) to show_text_display or
+            show_feature_errors to display the document.
+        """
+
+        order = self.order(feature, metric, weight_by_length)
+        badness = self.badness(feature, metric, weight_by_length)
+        order = order[:k]
+        order = order[~np.isnan(badness[order])]
+        self.last_worst = order
+        if metric == 'wer':
+            values = self.wer[order]
+            lengths = self.wer_lengths[order]
+        else:
+            all_values = {
+                'Precision': self.precision,
+                'Recall': self.recall,
+                'F-score': self.fscore
+            }[metric]
+            values = all_values[order, self.features.index(feature)]
+            lengths = self.doc_lengths[order]
+        return pd.DataFrame({
+            'doc_idx': order,
+            metric: values,
+            'length': lengths.astype(np.int64)
+        }, index=pd.RangeIndex(len(order), name='rank'))
+
+    # ====================
+    def doc_idx(self, rank: int) -> int:
+        """Get the index of the document at a rank in the results of the
+        last call to worst."""
+
+        if not 0 <= rank < len(self.last_worst):
+            raise IndexError(
+                ERROR_RANK.format(rank=rank, k=len(self.last_worst)))
+        return int(self.last_worst[rank])
+
+    # ====================
+    def show_text_display(self, rank: int, **kwargs):
+        """Call show_text_display on the evaluator for the document at a
+        rank in the results of the last call to worst. Keyword arguments
+        are passed to show_text_display."""
+
+        self.evaluator.show_text_display(self.doc_idx(rank), **kwargs)
+
+    # ====================
+    def show_feature_errors(self, rank: int, feature_to_check: str,
+                            **kwargs):
+        """Call show_feature_errors on the evaluator for the document at a
+        rank in the results of the last call to worst. Keyword arguments
+        are passed to show_feature_errors."""
+
+        self.evaluator.show_feature_errors(
+            self.doc_idx(rank), feature_to_check, **kwargs)
@@ -0,0 +1,148 @@
+"""Measure the throughput and latency of a running fre.server instance.
+
+Start a server, e.g.:
+
+    python -m fre.server --feature-chars ".,? " --capitalization
+
+then run:
+
+    python scripts/server_load_test.py --requests 2000 --concurrency 32
+
+Reference/hypothesis pairs are taken from sample_data.csv, split into
+sentences-sized chunks so that each request is small."""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DATA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'sample_data.csv')
+
+
+# ====================
+def load_pairs(data_path: str, chunk_words: int) -> List[Tuple[str, str]]:
+    """Get short reference/hypothesis pairs from sample_data.csv by
+    splitting each document into chunks of chunk_words reference words.
+
+    The hypothesis is the reference with its features removed (as in the
+    model_input column), so base characters always match."""
+
+    data = pd.read_csv(data_path)
+    pairs = []
+    for ref in data['reference']:
+        words = ref.split()
+        for i in range(0, len(words), chunk_words):
+            chunk = ' '.join(words[i:i + chunk_words])
+            pairs.append((chunk, chunk.lower().replace(',', '')))
+    return pairs
+
+
+# ====================
+async def post_json(reader: asyncio.StreamReader,
+                    writer: asyncio.StreamWriter,
+                    host: str,
+                    payload: dict) -> dict:
+    """Send a POST /score request on an open keep-alive connection and
+    return the decoded response."""
+
+    body = json.dumps(payload).encode('utf-8')
+    writer.write((
+        "POST /score HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode('latin-1') + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in [b'\r\n', b'']:
+            break
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    response = await reader.readexactly(int(headers['content-length']))
+    if b' 200 ' not in status_line:
+        raise RuntimeError(status_line.decode() + response.decode())
+    return json.loads(response)
+
+
+# ====================
+async def client(host: str,
+                 port: int,
+                 requests: asyncio.Queue,
+                 latencies: List[float]):
+    """Send requests from the queue one at a time over a single
+    connection, recording the latency of each."""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while not requests.empty():
+            payload = requests.get_nowait()
+            start = time.perf_counter()
+            await post_json(reader, writer, host, payload)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+# ====================
+async def run_load_test(args: argparse.Namespace):
+
+    pairs = load_pairs(args.data, args.chunk_words)
+    random.seed(args.seed)
+    requests = asyncio.Queue()
+    for _ in range(args.requests):
+        sample = random.choices(pairs, k=args.docs_per_request)
+        requests.put_nowait({
+            'reference': [ref for ref, _ in sample],
+            'hypothesis': [hyp for _, hyp in sample],
+            'include_wer': not args.no_wer
+        })
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(args.host, args.port, requests, latencies)
+        for _ in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    print(f"Requests:          {len(latencies):,}")
+    print(f"Pairs per request: {args.docs_per_request}")
+    print(f"Concurrency:       {args.concurrency}")
+    print(f"Elapsed:           {elapsed:.2f}s")
+    print(f"Throughput:        {len(latencies) / elapsed:,.1f} requests/s "
+          f"({len(latencies) * args.docs_per_request / elapsed:,.1f} "
+          "pairs/s)")
+    for p in [50, 90, 99]:
+        print(f"Latency p{p}:       {np.percentile(latencies_ms, p):.1f}ms")
+    print(f"Latency max:       {latencies_ms.max():.1f}ms")
+
+
+# ====================
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Load test a running fre.server instance.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--docs-per-request', type=int, default=1)
+    parser.add_argument('--chunk-words', type=int, default=30,
+                        help='Number of reference words in each pair')
+    parser.add_argument('--no-wer', action='store_true')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(run_load_test(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,685 @@
+"""Randomized differential testing of the optimized and parallel metric
+paths against pure-Python reference implementations.
+
+Random corpora of adversarial Unicode reference/hypothesis pairs are
+generated, with grapheme clusters built from combining marks, emoji
+modifier and ZWJ sequences, regional indicators, Hangul jamo, and CRLF;
+runs of repeated feature characters; feature characters fused with
+combining marks; case changes; and occasional base character
+substitutions that make a document mismatch. Every path that produces
+confusion matrix counts, word error rate edits, or text display labels
+is checked against a reference implementation:
+
+- Counts: get_chars_and_feature_lists (the original pure-Python parser)
+  for single-character features and CAPS, or FeatureSet.split for
+  multi-character features, feature classes, and word case features.
+  Checked paths are get_doc_counts, evaluators with and without the
+  grapheme cache, with a memory budget, rescored with change_features,
+  scored by a WorkerPool, merged from PartialResults shards, and the
+  scoring server's score_batch.
+- WER edits: a pure-Python word-level Levenshtein distance, using the
+  same tokenization as jiwer's default transform (runs of two or more
+  whitespace characters become a space, and words are split on spaces
+  only, so single tabs and newlines do not separate words).
+- Labels: get_labels, against iter_labels and stream_text_display.
+
+The reference implementations are slow by design, so the harness also
+compares throughput when run as a script:
+
+    python -m tests.differential --corpora 20 --docs 50 --workers 2
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import re
+import time
+from itertools import chain
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from fre import FeatureRestorationEvaluator
+from fre.char_level_metrics import (get_chars_and_feature_lists,
+                                    get_doc_counts)
+from fre.feature_set import DASHES, FeatureSet
+from fre.grapheme_cache import GraphemeCache
+from fre.casing import UNCASED, UPPER
+from fre.misc import (CAPS_ALL, CAPS_INITIAL, CASE_FEATURES,
+                      get_case_features, list_gclust)
+from fre.parallel import WorkerPool
+from fre.partial_results import PartialResults, store_arrays
+from fre.result_store import SCORED, SKIPPED
+from fre.server import init_worker, score_batch
+from fre.text_display import get_labels, iter_labels, stream_text_display
+from fre.word_error_rate import get_num_edits
+
+# Base grapheme clusters, chosen so that comparing lower-cased characters
+# (as the original parser does) and case-folded characters gives the same
+# result, and so that title case letters (treated as upper case since
+# language-aware casing was added) do not appear
+BASE_GRAPHEMES = [
+    *'abcdexyzABCDEXYZ019_@', 'é', 'É', 'é', 'É', 'ß', 'ẞ',
+    'Σ', 'σ', 'İ', 'ı', 'ñ', 'Ñ', '漢', '한', '가', '👍🏽',
+    '👨‍👩‍👧', '🇬🇧', 'क्ष', '\t', '\r\n'
+]
+# Single-character features, including a letter and whitespace other
+# than spaces
+FEATURE_CHARS = ['.', ',', '?', '!', ' ', '-', "'", ';', ' ', '\n', 'x']
+MULTI_CHAR_FEATURES = ['...', '?!', '--']
+DASH_CHARS = ['–', '—']
+COMBINING_MARK = '́'
+# Probabilities used when generating documents
+P_FEATURE_RUN = 0.25
+P_FUSED_FEATURE = 0.03
+P_DROP_FEATURE = 0.2
+P_SWAP_FEATURE = 0.1
+P_SWAP_CASE = 0.15
+P_INSERT_FEATURE = 0.08
+P_MISMATCH = 0.1
+BENCHMARK_PATHS = [
+    'reference', 'get_doc_counts', 'evaluator', 'change_features',
+    'worker_pool'
+]
+
+
+# ====================
+class Corpus:
+    """A random corpus with the features it is scored with."""
+
+    # ====================
+    def __init__(self,
+                 capitalization,
+                 feature_chars: list,
+                 feature_texts: List[str],
+                 extended: bool,
+                 reference: List[str],
+                 hypothesis: List[str]):
+
+        self.capitalization = capitalization
+        self.feature_chars = feature_chars
+        self.feature_texts = feature_texts
+        self.extended = extended
+        self.reference = reference
+        self.hypothesis = hypothesis
+        self.feature_set = FeatureSet(
+            get_case_features(capitalization) + feature_chars)
+
+    # ====================
+    def num_chars(self) -> int:
+
+        return sum(len(doc) for doc in self.reference + self.hypothesis)
+
+    # ====================
+    def evaluator(self, **kwargs) -> FeatureRestorationEvaluator:
+
+        settings = {
+            'capitalization': self.capitalization,
+            'feature_chars': self.feature_chars,
+            'get_wer_info_on_init': False,
+            'word_level': True,
+            **kwargs
+        }
+        with quiet():
+            return FeatureRestorationEvaluator(
+                self.reference, self.hypothesis, **settings)
+
+
+# ====================
+@contextlib.contextmanager
+def quiet():
+    """Silence warnings and progress bars."""
+
+    with contextlib.redirect_stdout(io.StringIO()), \
+            contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+# ====================
+def random_corpus(rng: random.Random,
+                  num_docs: int,
+                  doc_length: int,
+                  extended: bool) -> Corpus:
+    """Generate a random corpus. If extended is False, only features that
+    the original parser supports (single characters and CAPS) are
+    used."""
+
+    feature_chars = rng.sample(FEATURE_CHARS, rng.randint(1, 5))
+    feature_texts = list(feature_chars)
+    if extended:
+        capitalization = rng.choice([False, True, 'word'])
+        multi_char = rng.sample(MULTI_CHAR_FEATURES, rng.randint(0, 2))
+        feature_chars += multi_char
+        feature_texts += multi_char
+        if rng.random() < 0.5:
+            feature_chars.append(DASHES)
+            feature_texts += DASH_CHARS
+    else:
+        capitalization = rng.random() < 0.5
+    reference = [
+        random_doc(rng, feature_texts, rng.randint(1, doc_length))
+        for _ in range(num_docs)
+    ]
+    hypothesis = [
+        random_hypothesis(rng, ref, feature_texts) for ref in reference
+    ]
+    return Corpus(capitalization, feature_chars, feature_texts, extended,
+                  reference, hypothesis)
+
+
+# ====================
+def base_graphemes(feature_texts: List[str]) -> List[str]:
+
+    return [g for g in BASE_GRAPHEMES if g not in feature_texts]
+
+
+# ====================
+def random_doc(rng: random.Random,
+               feature_texts: List[str],
+               num_graphemes: int) -> str:
+    """Generate a random document that starts with a base character."""
+
+    base = base_graphemes(feature_texts)
+    parts = [rng.choice([g for g in base if not g.isspace()])]
+    while len(parts) < num_graphemes:
+        r = rng.random()
+        if r < P_FEATURE_RUN:
+            # Repeated features, e.g. '..' or '?!?'
+            parts += rng.choices(feature_texts, k=rng.randint(1, 3))
+        elif r < P_FEATURE_RUN + P_FUSED_FEATURE:
+            # A feature character fused with a combining mark is a base
+            # character
+            parts.append(rng.choice(feature_texts)[0] + COMBINING_MARK)
+        else:
+            parts.append(rng.choice(base))
+    padding = rng.choice(['', ' ', '\n', ' \t'])
+    return padding + ''.join(parts) + rng.choice(['', ' ', '\n'])
+
+
+# ====================
+def random_hypothesis(rng: random.Random,
+                      ref: str,
+                      feature_texts: List[str]) -> str:
+    """Generate a hypothesis by dropping, replacing, and inserting
+    features and changing case, and occasionally replacing a base
+    character so that base characters differ."""
+
+    graphemes = list_gclust(ref.strip())
+    hyp = [swap_case(graphemes[0], feature_texts)]
+    for grapheme in graphemes[1:]:
+        r = rng.random()
+        if grapheme in feature_texts:
+            if r < P_DROP_FEATURE:
+                continue
+            elif r < P_DROP_FEATURE + P_SWAP_FEATURE:
+                grapheme = rng.choice(feature_texts)
+        elif r < P_SWAP_CASE:
+            grapheme = swap_case(grapheme, feature_texts)
+        hyp.append(grapheme)
+        if rng.random() < P_INSERT_FEATURE:
+            hyp.append(rng.choice(feature_texts))
+    if rng.random() < P_MISMATCH:
+        positions = [
+            i for i, g in enumerate(hyp[1:], 1) if g not in feature_texts]
+        if positions:
+            hyp[rng.choice(positions)] = rng.choice(
+                base_graphemes(feature_texts))
+    return ''.join(hyp)
+
+
+# ====================
+def swap_case(grapheme: str, feature_texts: List[str]) -> str:
+    """Swap the case of a grapheme cluster if the result is a single base
+    grapheme cluster that is equal to it when lower-cased and when
+    case-folded."""
+
+    swapped = grapheme.swapcase()
+    if len(list_gclust(swapped)) == 1 \
+            and swapped.lower() == grapheme.lower() \
+            and swapped.casefold() == grapheme.casefold() \
+            and swapped not in feature_texts:
+        return swapped
+    return grapheme
+
+
+# === REFERENCE IMPLEMENTATIONS ===
+
+# ====================
+def counts_from_presence(features: List[str],
+                         present_ref: list,
+                         present_hyp: list) -> np.ndarray:
+    """Count true and false positives and negatives for each feature, one
+    position at a time, in the layout of ResultStore.counts."""
+
+    counts = np.zeros((len(features), 2, 2), dtype=np.int64)
+    for i, feature in enumerate(features):
+        for in_ref, in_hyp in zip(present_ref, present_hyp):
+            counts[i, int(feature not in in_ref), int(feature not in in_hyp)] \
+                += 1
+    return counts
+
+
+# ====================
+def reference_counts(corpus: Corpus, ref: str, hyp: str) -> np.ndarray:
+    """Get character-level counts for a document with a pure-Python
+    parser, or None if its base characters differ."""
+
+    feature_set = corpus.feature_set
+    if corpus.extended:
+        graphemes_ref, present_ref = feature_set.split(ref.strip())
+        graphemes_hyp, present_hyp = feature_set.split(hyp.strip())
+        chars_ref = [feature_set.fold(c) for c in graphemes_ref]
+        chars_hyp = [feature_set.fold(c) for c in graphemes_hyp]
+        if chars_ref == chars_hyp and feature_set.has_word_case():
+            words = reference_words(feature_set, graphemes_ref, present_ref)
+            present_ref = word_case_presence(
+                feature_set, graphemes_ref, present_ref, words)
+            present_hyp = word_case_presence(
+                feature_set, graphemes_hyp, present_hyp, words)
+    else:
+        chars_ref, present_ref = get_chars_and_feature_lists(
+            ref, feature_set.features)
+        chars_hyp, present_hyp = get_chars_and_feature_lists(
+            hyp, feature_set.features)
+    if chars_ref != chars_hyp:
+        return None
+    return counts_from_presence(
+        feature_set.features, present_ref, present_hyp)
+
+
+# ====================
+def reference_words(feature_set: FeatureSet,
+                    graphemes: List[str],
+                    present: List[dict]) -> List[List[int]]:
+    """Split the base characters of a reference document into words for
+    CAPS_INITIAL and CAPS_ALL: a word ends at a feature other than a case
+    feature, and every non-alphanumeric character is a word of its
+    own."""
+
+    words = []
+    for i, grapheme in enumerate(graphemes):
+        alnum = feature_set.casing.analyse_grapheme(grapheme)[2]
+        if i == 0 or not alnum or not words[-1][1] \
+                or any(f not in CASE_FEATURES for f in present[i - 1]):
+            words.append(([], alnum))
+        words[-1][0].append(i)
+    return [positions for positions, _ in words]
+
+
+# ====================
+def word_case_presence(feature_set: FeatureSet,
+                       graphemes: List[str],
+                       present: List[dict],
+                       words: List[List[int]]) -> List[dict]:
+    """Replace CAPS_INITIAL and CAPS_ALL in the features present at each
+    base character with those for the given words."""
+
+    present = [
+        {f: t for f, t in p.items() if f not in (CAPS_INITIAL, CAPS_ALL)}
+        for p in present
+    ]
+    for positions in words:
+        classes = [
+            feature_set.casing.analyse_grapheme(graphemes[i])[1]
+            for i in positions
+        ]
+        num_cased = sum(c != UNCASED for c in classes)
+        all_caps = num_cased >= 2 and classes.count(UPPER) == num_cased
+        if all_caps and CAPS_ALL in feature_set.features:
+            present[positions[0]][CAPS_ALL] = ''
+        elif classes[0] == UPPER and not all_caps \
+                and CAPS_INITIAL in feature_set.features:
+            present[positions[0]][CAPS_INITIAL] = ''
+    return present
+
+
+# ====================
+def jiwer_words(doc: str) -> List[str]:
+    """Split a document into words as jiwer's default transform does."""
+
+    return [w for w in re.sub(r'\s\s+', ' ', doc).strip().split(' ') if w]
+
+
+# ====================
+def reference_num_edits(ref: str, hyp: str) -> int:
+    """Get the minimum number of word edits between two documents with a
+    pure-Python Levenshtein distance."""
+
+    words_ref = jiwer_words(ref)
+    words_hyp = jiwer_words(hyp)
+    previous = list(range(len(words_hyp) + 1))
+    for i, word_ref in enumerate(words_ref, 1):
+        current = [i]
+        for j, word_hyp in enumerate(words_hyp, 1):
+            current.append(min(
+                previous[j] + 1, current[j - 1] + 1,
+                previous[j - 1] + (word_ref != word_hyp)))
+        previous = current
+    return previous[-1]
+
+
+# === CHECKS ===
+
+# ====================
+def expected_arrays(corpus: Corpus) -> Tuple[np.ndarray, np.ndarray]:
+    """Get character-level counts and status for every document from the
+    reference implementation."""
+
+    features = corpus.feature_set.features
+    counts = np.zeros((len(corpus.reference), len(features), 2, 2),
+                      dtype=np.int64)
+    status = np.full(len(corpus.reference), SKIPPED, dtype=np.int8)
+    for doc_idx, (ref, hyp) in enumerate(
+            zip(corpus.reference, corpus.hypothesis)):
+        doc_counts = reference_counts(corpus, ref, hyp)
+        if doc_counts is not None:
+            counts[doc_idx] = doc_counts
+            status[doc_idx] = SCORED
+    return counts, status
+
+
+# ====================
+def check_corpus(corpus: Corpus,
+                 pool: WorkerPool = None,
+                 timings: Dict[str, float] = None) -> List[str]:
+    """Check every path against the reference implementations for a
+    corpus.
+
+    Returns:
+      List[str]:
+        A description of each mismatch.
+    """
+
+    if timings is None:
+        timings = {}
+    failures = []
+
+    def check(condition: bool, path: str):
+        if not condition:
+            failures.append(f"{path}: {describe(corpus)}")
+
+    expected_counts, expected_status = timed(
+        timings, 'reference', lambda: expected_arrays(corpus))
+    # get_doc_counts, one document at a time
+    for doc_idx, (ref, hyp) in enumerate(
+            zip(corpus.reference, corpus.hypothesis)):
+        with quiet():
+            counts = timed(timings, 'get_doc_counts', lambda: get_doc_counts(
+                ref.strip(), hyp.strip(), corpus.feature_set)[0])
+        if counts is None:
+            check(expected_status[doc_idx] == SKIPPED, 'get_doc_counts')
+        else:
+            check(np.array_equal(counts['char'], expected_counts[doc_idx]),
+                  'get_doc_counts')
+    # Evaluators
+    evaluator = timed(timings, 'evaluator', corpus.evaluator)
+    check(np.array_equal(evaluator.results.status, expected_status),
+          'evaluator status')
+    check(np.array_equal(evaluator.results.counts['char'], expected_counts),
+          'evaluator counts')
+    variants = {
+        'grapheme cache': corpus.evaluator(cache_graphemes=True),
+        'memory budget': corpus.evaluator(memory_budget=0)
+    }
+    rescored = corpus.evaluator(
+        cache_graphemes=True,
+        capitalization=not corpus.capitalization,
+        feature_chars=['.'] if corpus.feature_chars != ['.'] else [','])
+    with quiet():
+        timed(timings, 'change_features', lambda: rescored.change_features(
+            corpus.feature_chars, corpus.capitalization))
+    variants['change_features'] = rescored
+    if pool is not None:
+        parallel = corpus.evaluator(get_cms_on_init=False)
+        with quiet():
+            timed(timings, 'worker_pool', lambda: parallel.get_cms_all(pool))
+        variants['worker_pool'] = parallel
+    half = len(corpus.reference) // 2
+    partials = [
+        PartialResults.from_evaluator(
+            evaluator_for(corpus, start, stop), doc_offset=start)
+        for start, stop in [(0, half), (half, len(corpus.reference))]
+    ]
+    merged = PartialResults.merge(partials[::-1]).to_result_store()
+    expected_store = store_arrays(evaluator.results)
+    for name, variant in variants.items():
+        check(stores_equal(store_arrays(variant.results), expected_store),
+              name)
+    check(stores_equal(store_arrays(merged), expected_store),
+          'merged partial results')
+    # Alignment mode has no reference implementation, but the fast paths
+    # must agree with each other
+    aligned = corpus.evaluator(alignment=True)
+    aligned_variants = {
+        'aligned, grapheme cache':
+            corpus.evaluator(alignment=True, cache_graphemes=True)
+    }
+    if pool is not None:
+        aligned_parallel = corpus.evaluator(
+            alignment=True, get_cms_on_init=False)
+        with quiet():
+            aligned_parallel.get_cms_all(pool)
+        aligned_variants['aligned, worker_pool'] = aligned_parallel
+    for name, variant in aligned_variants.items():
+        check(stores_equal(store_arrays(variant.results),
+                           store_arrays(aligned.results)), name)
+        check(dict(variant.alignment_info) == dict(aligned.alignment_info),
+              f'{name} alignment info')
+    failures += check_server(corpus, expected_counts, expected_status)
+    failures += check_wer(corpus)
+    failures += check_labels(corpus)
+    failures += check_first_char_feature(corpus)
+    return failures
+
+
+# ====================
+def evaluator_for(corpus: Corpus, start: int, stop: int) \
+        -> FeatureRestorationEvaluator:
+    """Get an evaluator for a range of the documents of a corpus."""
+
+    shard = Corpus(
+        corpus.capitalization, corpus.feature_chars, corpus.feature_texts,
+        corpus.extended, corpus.reference[start:stop],
+        corpus.hypothesis[start:stop])
+    return shard.evaluator()
+
+
+# ====================
+def stores_equal(a: Dict[str, np.ndarray], b: Dict[str, np.ndarray]) \
+        -> bool:
+
+    return a.keys() == b.keys() and all(
+        np.array_equal(a[key], b[key]) for key in a)
+
+
+# ====================
+def check_server(corpus: Corpus,
+                 expected_counts: np.ndarray,
+                 expected_status: np.ndarray) -> List[str]:
+    """Check the scoring server's batch scoring function, in-process."""
+
+    init_worker(corpus.feature_set, False)
+    with quiet():
+        results = score_batch([
+            (ref, hyp, True)
+            for ref, hyp in zip(corpus.reference, corpus.hypothesis)
+        ])
+    failures = []
+    for doc_idx, (counts, wer_counts) in enumerate(results):
+        if counts is None:
+            ok = expected_status[doc_idx] == SKIPPED
+        else:
+            ok = np.array_equal(counts, expected_counts[doc_idx])
+        ref = corpus.reference[doc_idx]
+        hyp = corpus.hypothesis[doc_idx]
+        ok = ok and wer_counts == (
+            len(ref.strip().split()), reference_num_edits(ref, hyp))
+        if not ok:
+            failures.append(f"score_batch: {describe(corpus, doc_idx)}")
+    return failures
+
+
+# ====================
+def check_wer(corpus: Corpus) -> List[str]:
+
+    return [
+        f"get_num_edits: {describe(corpus, doc_idx)}"
+        for doc_idx, (ref, hyp) in enumerate(
+            zip(corpus.reference, corpus.hypothesis))
+        if get_num_edits(ref.strip(), hyp.strip())
+        != reference_num_edits(ref, hyp)
+    ]
+
+
+# ====================
+def check_labels(corpus: Corpus) -> List[str]:
+    """Check that streamed labels and the terminal display match
+    get_labels."""
+
+    failures = []
+    for doc_idx, (ref, hyp) in enumerate(
+            zip(corpus.reference, corpus.hypothesis)):
+        ref = ref.strip()
+        hyp = hyp.strip()
+        with quiet():
+            labels = get_labels(ref, hyp, corpus.feature_set, [])
+            streamed = list(chain.from_iterable(
+                iter_labels(ref, hyp, corpus.feature_set, [])))
+        if labels is None:
+            continue
+        out = io.StringIO()
+        stream_text_display(ref, hyp, corpus.feature_set, out=out)
+        plain = re.sub(r'\x1b\[\d+m', '', out.getvalue())
+        if streamed != labels \
+                or plain != ''.join(text for text, _, _ in labels) + '\n':
+            failures.append(f"iter_labels: {describe(corpus, doc_idx)}")
+    return failures
+
+
+# ====================
+def check_first_char_feature(corpus: Corpus) -> List[str]:
+    """Check that documents that start with a feature raise ValueError in
+    every parser. Documents are stripped before they are parsed, so
+    whitespace features are not checked."""
+
+    first_chars = [f for f in corpus.feature_texts if not f[0].isspace()]
+    if not first_chars:
+        return []
+    doc = first_chars[0] + corpus.reference[0].strip()
+    parsers = {
+        'FeatureSet.parse': lambda: corpus.feature_set.parse(doc),
+        'GraphemeCache.parse': lambda: cache_parse(corpus.feature_set, doc)
+    }
+    if not corpus.extended:
+        parsers['get_chars_and_feature_lists'] = \
+            lambda: get_chars_and_feature_lists(
+                doc, corpus.feature_set.features)
+    failures = []
+    for name, parse in parsers.items():
+        try:
+            parse()
+            failures.append(f"{name} first char feature: {describe(corpus)}")
+        except ValueError:
+            pass
+    return failures
+
+
+# ====================
+def cache_parse(feature_set: FeatureSet, doc: str):
+
+    cache = GraphemeCache()
+    cache.add(0, doc, doc)
+    return cache.parse(0, feature_set)
+
+
+# ====================
+def describe(corpus: Corpus, doc_idx: int = None) -> str:
+
+    description = (f"capitalization={corpus.capitalization!r}, "
+                   f"feature_chars={corpus.feature_chars!r}")
+    if doc_idx is not None:
+        description += (f", ref={corpus.reference[doc_idx]!r}, "
+                        f"hyp={corpus.hypothesis[doc_idx]!r}")
+    return description
+
+
+# ====================
+def timed(timings: Dict[str, float], path: str, func: Callable):
+    """Call a function, adding the time it takes to timings[path]."""
+
+    start = time.perf_counter()
+    result = func()
+    timings[path] = timings.get(path, 0.0) + time.perf_counter() - start
+    return result
+
+
+# ====================
+def run(num_corpora: int,
+        num_docs: int,
+        doc_length: int,
+        seed: int = 0,
+        pool: WorkerPool = None) -> Tuple[List[str], Dict[str, float], int]:
+    """Generate corpora and check every path for each of them.
+
+    Half of the corpora use only features that the original parser
+    supports, and the other half also use multi-character features,
+    feature classes, and word case features.
+
+    Returns:
+      Tuple[List[str], Dict[str, float], int]:
+        Descriptions of mismatches, the time spent in each benchmarked
+        path, and the total number of characters scored.
+    """
+
+    rng = random.Random(seed)
+    failures = []
+    timings = {}
+    num_chars = 0
+    for corpus_idx in range(num_corpora):
+        corpus = random_corpus(
+            rng, num_docs, doc_length, extended=corpus_idx % 2 == 1)
+        failures += check_corpus(corpus, pool, timings)
+        num_chars += corpus.num_chars()
+    return failures, timings, num_chars
+
+
+# ====================
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Check optimized metric paths against pure-Python '
+                    'reference implementations on random corpora, and '
+                    'compare their throughput.')
+    parser.add_argument('--corpora', type=int, default=20)
+    parser.add_argument('--docs', type=int, default=50,
+                        help='Number of documents per corpus')
+    parser.add_argument('--doc-length', type=int, default=2000,
+                        help='Maximum number of grapheme clusters per '
+                             'reference document')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Worker processes for WorkerPool (0 to skip)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    with contextlib.ExitStack() as stack:
+        pool = None
+        if args.workers:
+            pool = stack.enter_context(WorkerPool(args.workers))
+        failures, timings, num_chars = run(
+            args.corpora, args.docs, args.doc_length, args.seed, pool)
+    for failure in failures:
+        print(f"MISMATCH {failure}")
+    print(f"{len(failures)} mismatches in {args.corpora} corpora of "
+          f"{args.docs} documents ({num_chars:,} characters)\n")
+    print(f"{'Path':<18}{'Seconds':>10}{'Chars/s':>14}{'Speedup':>10}")
+    for path in BENCHMARK_PATHS:
+        if path in timings:
+            seconds = timings[path]
+            print(f"{path:<18}{seconds:>10.3f}{num_chars / seconds:>14,.0f}"
+                  f"{timings['reference'] / seconds:>9.1f}x")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.alignment import matching_blocks     # noqa: E402
+
+reference = [
+    'This is a sentence. This is another sentence.',
+    'This is Sentence 3'
+]
+hypothesis = [
+    'This is a sentense this is another sentence.',
+    'Thisis Senten ce 3'
+]
+fre_aligned = FeatureRestorationEvaluator(
+    reference, hypothesis, capitalization=True, feature_chars='., ',
+    get_wer_info_on_init=False, alignment=True
+)
+
+
+# ====================
+def test_matching_blocks():
+    """Test that matching blocks cover the longest common subsequence"""
+
+    blocks = matching_blocks(list('thisisasentence'), list('thisisasentense'))
+    assert blocks == [(0, 0, 13), (14, 14, 1)]
+
+
+# ====================
+def test_mismatched_doc_is_scored():
+    """Test that a document with a stray character is still scored in
+    alignment mode"""
+
+    assert fre_aligned.results[0] is not None
+    # One period missing in the aligned region
+    sent_0_periods = fre_aligned.get_prfs(0)['.']
+    assert sent_0_periods['Precision'] == 1
+    assert sent_0_periods['Recall'] == 0.5
+
+
+# ====================
+def test_coverage():
+    """Test that skipped spans and coverage are reported"""
+
+    info = fre_aligned.alignment_info[0]
+    assert info['aligned_chars'] == info['ref_chars'] - 1
+    assert len(info['skipped_spans']) == 1
+    assert info['skipped_spans'][0]['ref_text'] == 'c'
+    assert info['skipped_spans'][0]['hyp_text'] == 's'
+    assert fre_aligned.alignment_info[1]['ref_coverage'] == 1
+    coverage_df = fre_aligned.get_coverage_df()
+    assert coverage_df.loc['all', 'aligned_chars'] == \
+        info['aligned_chars'] + fre_aligned.alignment_info[1]['aligned_chars']
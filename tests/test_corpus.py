@@ -0,0 +1,124 @@
+import os
+import pickle
+
+import pytest
+
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.corpus import (ArrowCorpus, Corpus,     # noqa: E402
+                        ParquetCorpus, TextFileCorpus)
+
+reference = [
+    'This is a sentence. This is another sentence.',
+    'This is Sentence 3',
+    'Sentence 4.'
+]
+hypothesis = [
+    'This is a sentence, this is another sentence.',
+    'This is sentence 3.',
+    'Sentence 4.'
+]
+
+
+# ====================
+def test_corpus_is_abstract():
+    """Test that Corpus cannot be created, or subclassed without
+    implementing __len__ and get_doc"""
+
+    class LengthOnlyCorpus(Corpus):
+
+        def __len__(self) -> int:
+
+            return 0
+
+    with pytest.raises(TypeError):
+        Corpus()
+    with pytest.raises(TypeError):
+        LengthOnlyCorpus()
+
+
+# ====================
+def test_arrow_corpus_row_range():
+    """Test that row ranges of chunked Arrow arrays are selected"""
+
+    pa = pytest.importorskip('pyarrow')
+    data = pa.chunked_array([reference[:1], reference[1:]])
+    corpus = ArrowCorpus(data, start=1)
+    assert len(corpus) == 2
+    assert corpus[0] == reference[1]
+    assert corpus[-1] == reference[2]
+    assert list(corpus) == reference[1:]
+    assert corpus.doc_lengths().tolist() == [len(d) for d in reference[1:]]
+
+
+# ====================
+def test_parquet_corpus(tmp_path):
+    """Test that an evaluator can be created from Parquet corpora read one
+    row group at a time"""
+
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'corpus.parquet')
+    table = pa.table({'ref': reference, 'hyp': hypothesis})
+    pq.write_table(table, path, row_group_size=2)
+    ref = ParquetCorpus(path, 'ref', start=1)
+    hyp = ParquetCorpus(path, 'hyp', start=1, batch_size=1)
+    assert list(hyp) == hypothesis[1:]
+    assert hyp.doc_lengths().tolist() == [len(d) for d in hypothesis[1:]]
+    assert ref[1] == reference[2]
+    fre_parquet = FeatureRestorationEvaluator(
+        ref, hyp, capitalization=True, feature_chars='., ')
+    fre_list = FeatureRestorationEvaluator(
+        reference[1:], hypothesis[1:], capitalization=True,
+        feature_chars='., ')
+    assert fre_parquet.get_prfs() == fre_list.get_prfs()
+    assert pickle.loads(pickle.dumps(ref))[0] == reference[1]
+
+
+# ====================
+def test_text_file_corpus(tmp_path):
+    """Test that lines are read through a saved line offset index"""
+
+    path = tmp_path / 'hyp.txt'
+    path.write_bytes('\r\n'.join(hypothesis + ['Ünïcödé']).encode('utf-8'))
+    corpus = TextFileCorpus(str(path))
+    assert list(corpus) == hypothesis + ['Ünïcödé']
+    assert (tmp_path / 'hyp.txt.lineidx.npz').exists()
+    # The saved index is reused
+    assert TextFileCorpus(str(path), start=1)[0] == hypothesis[1]
+    shards = [corpus.shard(2, i) for i in range(2)]
+    assert [len(s) for s in shards] == [2, 2]
+    assert shards[1][1] == 'Ünïcödé'
+    assert pickle.loads(pickle.dumps(shards[1]))[0] == hypothesis[2]
+
+
+# ====================
+def test_text_file_corpus_index_path(tmp_path, capsys):
+    """Test that an index saved to a custom path is reused and reloaded
+    when the corpus is unpickled"""
+
+    path = tmp_path / 'ref.txt'
+    path.write_text('\n'.join(reference), encoding='utf-8')
+    index_path = str(tmp_path / 'ref.idx')
+    with TextFileCorpus(str(path), index_path=index_path) as corpus:
+        assert len(corpus) == len(reference)
+    assert sorted(os.listdir(tmp_path)) == ['ref.idx', 'ref.txt']
+    capsys.readouterr()
+    with TextFileCorpus(str(path), index_path=index_path) as corpus:
+        assert capsys.readouterr().out == ''
+        restored = pickle.loads(pickle.dumps(corpus))
+    assert list(restored) == reference
+    restored.close()
+
+
+# ====================
+def test_text_file_corpus_unsaved_index(tmp_path):
+    """Test that the index is kept in memory when it cannot be saved"""
+
+    path = tmp_path / 'ref.txt'
+    path.write_text('\n'.join(reference), encoding='utf-8')
+    index_path = str(tmp_path / 'missing_dir' / 'ref.idx')
+    with TextFileCorpus(str(path), index_path=index_path) as corpus:
+        restored = pickle.loads(pickle.dumps(corpus.shard(2, 1)))
+    assert not os.path.exists(index_path)
+    assert list(restored) == reference[1:]
+    restored.close()
@@ -0,0 +1,44 @@
+import random
+
+import numpy as np
+
+from fre.misc import list_gclust     # noqa: E402
+from fre.parallel import WorkerPool     # noqa: E402
+from fre.result_store import SCORED, SKIPPED     # noqa: E402
+from tests.differential import (expected_arrays,     # noqa: E402
+                                random_corpus, reference_num_edits, run)
+
+
+# ====================
+def test_random_corpus():
+    """Test that generated corpora contain both scored and skipped
+    documents, and that documents start with a base character"""
+
+    rng = random.Random(1)
+    corpus = random_corpus(rng, 20, 50, extended=True)
+    _, status = expected_arrays(corpus)
+    assert np.any(status == SCORED) and np.any(status == SKIPPED)
+    for doc in corpus.reference + corpus.hypothesis:
+        assert list_gclust(doc.strip())[0] not in corpus.feature_texts
+
+
+# ====================
+def test_reference_num_edits():
+    """Test the pure-Python WER reference, including jiwer's treatment of
+    single tabs and newlines, which do not separate words"""
+
+    assert reference_num_edits('a b c', 'a x c d') == 2
+    assert reference_num_edits(' a  b ', 'a b') == 0
+    assert reference_num_edits('a\tb c', 'a b c') == 2
+    assert reference_num_edits('a\t\tb c', 'a b c') == 0
+
+
+# ====================
+def test_no_mismatches():
+    """Test that every optimized and parallel path matches the reference
+    implementations on random corpora"""
+
+    with WorkerPool(2, chunk_size=3) as pool:
+        failures, timings, num_chars = run(4, 8, 60, seed=3, pool=pool)
+    assert failures == []
+    assert num_chars > 0 and 'worker_pool' in timings
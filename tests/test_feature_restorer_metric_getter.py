@@ -1,5 +1,6 @@
+import fre.feature_restoration_evaluator     # noqa: E402
 from fre import FeatureRestorationEvaluator     # noqa: E402
-from fre.misc import CAPS    # noqa: E402
+from fre.misc import CAPS, save_pickle    # noqa: E402
 
 reference = [
     'This is a sentence.',
@@ -70,3 +71,133 @@ def test_correct_prfs_two():
     assert round(sent_2_spaces['Precision'], 2) == 0.67
     assert round(sent_2_spaces['Recall'], 2) == 0.67
     assert round(sent_2_spaces['F-score'], 2) == 0.67
+
+
+# ====================
+def test_word_level_prfs():
+    """Test that word-level precision, recall, and F-scores are
+    returned"""
+
+    prc_word = FeatureRestorationEvaluator(
+        reference, hypothesis, capitalization=True, feature_chars='., ',
+        get_wer_info_on_init=False, word_level=True
+    )
+    sent_2_spaces = prc_word.get_prfs(2, granularity='word')[' ']
+    # Words delimited by reference spaces: 'This', 'is', 'Sentence', '3'
+    # 2 true positives ('is', 'Sentence'), 0 false positives, 1 false
+    # negative ('This')
+    assert sent_2_spaces['Precision'] == 1
+    assert round(sent_2_spaces['Recall'], 2) == 0.67
+    # Character-level metrics are unchanged
+    assert prc_word.get_prfs(2)[' '] == prc.get_prfs(2)[' ']
+
+
+# ====================
+def test_class_confusion_matrix():
+    """Test that the multi-class confusion matrix shows which feature
+    was predicted in place of which"""
+
+    prc_classes = FeatureRestorationEvaluator(
+        ['Hello, world. Hello world.'], ['Hello. world, Hello world'],
+        capitalization=True, feature_chars='., ',
+        get_wer_info_on_init=False
+    )
+    assert prc_classes.class_features == ['.', ',']
+    # Rows are reference classes, columns are hypothesis classes, in the
+    # order none, '.', ','
+    class_cm = prc_classes.results.get_class_cm('all')
+    assert class_cm[1][2] == 1
+    assert class_cm[2][1] == 1
+    assert class_cm[1][0] == 1
+    assert class_cm.sum() == len('HelloworldHelloworld')
+
+
+# ====================
+def test_to_dataframe():
+    """Test that the per-document dataframe matches get_prfs, with NaN in
+    place of 'N/A'"""
+
+    metrics_df = prc.to_dataframe(include_wer=False)
+    assert list(metrics_df.index) == [0, 1, 2]
+    assert metrics_df[(',', 'Precision')].isna().all()
+    assert metrics_df.loc[1, (CAPS, 'Precision')] == \
+        prc.get_prfs(1)[CAPS]['Precision']
+    assert metrics_df.loc[2, (' ', 'F-score')] == \
+        prc.get_prfs(2)[' ']['F-score']
+    assert metrics_df.loc[2, (' ', 'FN')] == 1
+
+
+# ====================
+def test_triage():
+    """Test that documents are ranked from worst to best, with documents
+    with undefined metrics excluded"""
+
+    triage = prc.triage(include_wer=False)
+    worst_caps = triage.worst(CAPS, 'Precision', k=3)
+    assert worst_caps['doc_idx'].tolist()[0] == 1
+    assert triage.doc_idx(0) == 1
+    # Commas are undefined for every document
+    assert len(triage.worst(',', 'Precision')) == 0
+
+
+# ====================
+def test_error_rates():
+    """Test that CER counts a case error as one substitution and a moved
+    punctuation mark as two edits, and that FER counts edits per
+    reference feature"""
+
+    prc_error_rates = FeatureRestorationEvaluator(
+        ['Hello, world. Foo bar.'], ['hello world, foo bar.'],
+        capitalization=True, feature_chars='.,',
+        get_wer_info_on_init=False
+    )
+    error_rates = prc_error_rates.get_error_rates('all')
+    assert error_rates['CER']['len_ref'] == len('hello world foo bar,..')
+    assert error_rates['CER']['num_edits'] == 4
+    assert error_rates['FER']['len_ref'] == 5
+    assert error_rates['FER']['fer'] == 80
+
+
+# ====================
+def test_from_old_pickle(tmp_path):
+    """Test that evaluators pickled with cms and wer_info dictionaries are
+    migrated to a result store"""
+
+    old_cms = {doc_idx: {feature: cms[feature] for feature in prc.features}
+               for doc_idx, cms in prc.cms.items()}
+    old_cms[2] = None
+    old_wer_info = {0: {'len_ref': 4, 'num_edits': 1, 'wer': 25.0},
+                    'all': {'len_ref': 4, 'num_edits': 1, 'wer': 25.0}}
+    save_pickle({
+        'reference': reference, 'hypothesis': hypothesis,
+        'feature_chars': prc.feature_chars, 'features': prc.features,
+        'cms': old_cms, 'wer_info': old_wer_info
+    }, tmp_path / 'old.pickle')
+    restored = FeatureRestorationEvaluator.from_pickle(
+        tmp_path / 'old.pickle')
+    assert restored.get_prfs(1) == prc.get_prfs(1)
+    assert restored.cms[2] is None
+    assert (restored.cms['all'][CAPS] == old_cms[0][CAPS]
+            + old_cms[1][CAPS]).all()
+    assert restored.wer_info == old_wer_info
+    assert not restored.results.has_wer(1)
+
+
+# ====================
+def test_doc_sizes_cached(monkeypatch, capsys):
+    """Test that document sizes are computed once per evaluator, and that
+    no progress bar is shown when there is nothing to score"""
+
+    calls = []
+    doc_sizes = fre.feature_restoration_evaluator.doc_sizes
+    monkeypatch.setattr(
+        fre.feature_restoration_evaluator, 'doc_sizes',
+        lambda *args: calls.append(args) or doc_sizes(*args))
+    evaluator = FeatureRestorationEvaluator(
+        reference, hypothesis, capitalization=True, feature_chars='., ')
+    assert len(calls) == 1
+    capsys.readouterr()
+    evaluator.get_cms_all()
+    evaluator.get_wer_info_all()
+    assert len(calls) == 1
+    assert 'char' not in capsys.readouterr().err
@@ -0,0 +1,165 @@
+from fre.char_level_metrics import get_doc_counts     # noqa: E402
+from fre.feature_set import DASHES, FeatureClass, FeatureSet     # noqa: E402
+from fre.misc import CAPS, CAPS_ALL, CAPS_INITIAL    # noqa: E402
+from fre.text_display import get_labels, iter_labels     # noqa: E402
+
+
+# ====================
+def test_multi_char_features():
+    """Test that the longest multi-character mark is matched"""
+
+    feature_set = FeatureSet([CAPS, '...', '?!', '.', '?', ' '])
+    chars, codes = feature_set.parse('Wait... What?! No.')
+    assert ''.join(chars) == 'waitwhatno'
+    # 'Wait' is followed by '...' and ' ', 'What' by '?!' and ' '
+    assert codes[3] == (1 << 1) | (1 << 5)
+    assert codes[7] == (1 << 2) | (1 << 5)
+    assert codes[9] == 1 << 3
+    assert codes[0] == codes[4] == 1 << 0
+
+
+# ====================
+def test_feature_classes():
+    """Test that feature classes match any character in the class"""
+
+    feature_set = FeatureSet(
+        [' ', DASHES, FeatureClass('QUOTE', chars='"“”')])
+    chars, codes = feature_set.parse('a – b — c “d”')
+    assert ''.join(chars) == 'abcd'
+    assert codes[0] == codes[1] == (1 << 0) | (1 << 1)
+    assert codes[2] == (1 << 0) | (1 << 2)
+    assert codes[3] == 1 << 2
+
+
+# ====================
+def test_split_keeps_feature_text():
+    """Test that split keeps the original text of each feature"""
+
+    feature_set = FeatureSet([CAPS, '.', ' ', DASHES])
+    chars, feature_dicts = feature_set.split('Hi.. a–b')
+    assert chars == ['H', 'i', 'a', 'b']
+    assert feature_dicts[0] == {CAPS: ''}
+    assert feature_dicts[1] == {'.': '..', ' ': ' '}
+    assert feature_dicts[2] == {'DASH': '–'}
+
+
+# ====================
+def test_language_specific_case_folding():
+    """Test that base characters are compared using language-specific
+    case folding"""
+
+    turkish = FeatureSet([CAPS, ' '], language='tr')
+    assert turkish.parse('Istanbul ılık')[0] == \
+        turkish.parse('ıstanbul Ilık')[0]
+    assert FeatureSet([CAPS]).parse('Straße')[0] == \
+        FeatureSet([CAPS]).parse('STRAẞE')[0]
+
+
+# ====================
+def test_word_case_features():
+    """Test that word-initial capitalization and all-caps tokens are
+    distinguished"""
+
+    feature_set = FeatureSet([CAPS_INITIAL, CAPS_ALL, ' '])
+    chars, codes = feature_set.parse('The NASA team')
+    assert codes[0] == 1 << 0
+    assert codes[3] == 1 << 1
+    assert all(code & 0b11 == 0 for code in codes[4:])
+
+
+# ====================
+def test_word_case_uses_reference_words():
+    """Test that a missing space between words counts against the space
+    only, and not against the case features of the words"""
+
+    feature_set = FeatureSet([CAPS_INITIAL, CAPS_ALL, ' '])
+    for alignment in [False, True]:
+        counts, _ = get_doc_counts(
+            'The NASA team', 'The NASAteam', feature_set,
+            alignment=alignment)
+        # No false positives or negatives for CAPS_INITIAL or CAPS_ALL
+        assert counts['char'][:2, 0, 1].tolist() == [0, 0]
+        assert counts['char'][:2, 1, 0].tolist() == [0, 0]
+        assert counts['char'][2, 0, 1] == 1
+
+
+# ====================
+def test_word_case_labels_match_counts():
+    """Test that display labels mark exactly the case errors that are
+    counted, when splitting whole documents and in blocks"""
+
+    feature_set = FeatureSet([CAPS_INITIAL, CAPS_ALL, '.', ' '])
+    ref = 'The NASA team won. ' * 10
+    for hyp, num_case_errors in [('The NASAteam won. ' * 10, 0),
+                                 ('The Nasa team won. ' * 10, 20)]:
+        counts, _ = get_doc_counts(ref.strip(), hyp.strip(), feature_set)
+        assert counts['char'][:2, 0, 1].sum() \
+            + counts['char'][:2, 1, 0].sum() == num_case_errors
+        labels = get_labels(ref, hyp, feature_set, [])
+        lazy_labels = [
+            label for char_labels in iter_labels(ref, hyp, feature_set, [])
+            for label in char_labels
+        ]
+        assert lazy_labels == labels
+        # Each case error in 'Nasa' is an FP and an FN on the same letter
+        case_labels = [
+            text for text, label, is_feature in labels
+            if label and not is_feature
+        ]
+        assert case_labels == ['N'] * (num_case_errors // 2)
+
+
+# ====================
+def test_iter_split_pair():
+    """Test that splitting a pair lazily in blocks gives the same result
+    as splitting the whole documents"""
+
+    feature_set = FeatureSet([CAPS_INITIAL, CAPS_ALL, '.', ' ', DASHES])
+    ref = 'The NASA team met. Then–they left.. ' * 20
+    hyp = 'The NASAteam met then they Left. ' * 20
+    pairs = feature_set.split_pair(ref, hyp)
+    lazy = list(feature_set.iter_split_pair(ref, hyp, block_size=7))
+    for side in [0, 1]:
+        assert [entry[side] for entry in lazy] == list(zip(*pairs[side]))
+    # 'NASAteam' takes its case features from the reference words
+    assert CAPS_ALL in pairs[1][1][3]
+    assert CAPS_INITIAL not in pairs[1][1][3]
+
+
+# ====================
+def test_iter_split():
+    """Test that splitting lazily in blocks gives the same result as
+    splitting the whole document"""
+
+    feature_set = FeatureSet([CAPS_INITIAL, CAPS_ALL, '.', ' ', DASHES])
+    doc = 'The NASA team met. Then–they left.. ' * 20
+    chars, feature_dicts = feature_set.split(doc)
+    lazy = list(feature_set.iter_split(doc, block_size=7))
+    assert [char for char, _ in lazy] == chars
+    assert [features for _, features in lazy] == feature_dicts
+
+
+# ====================
+def test_iter_split_no_whitespace():
+    """Test that documents without whitespace are split lazily in blocks
+    of bounded length that give the same result as splitting the whole
+    document"""
+
+    for features, doc in [
+        ([CAPS_INITIAL, CAPS_ALL, '.'], 'Abc.NASA.' * 200),
+        (['。'], '日本語の文。' * 300),
+        ([CAPS_INITIAL], 'x' * 2000),
+    ]:
+        feature_set = FeatureSet(features)
+        blocks = list(feature_set.iter_split_blocks(doc, 64))
+        assert len(blocks) > 1
+        assert max(len(chars) for chars, _, _, _ in blocks) <= 4 * 64 + 256
+        chars, feature_dicts = feature_set.split(doc)
+        lazy = list(feature_set.iter_split(doc, block_size=64))
+        assert [char for char, _ in lazy] == chars
+        assert [features for _, features in lazy] == feature_dicts
+        pairs = feature_set.split_pair(doc, doc.lower())
+        lazy = list(feature_set.iter_split_pair(
+            doc, doc.lower(), block_size=64))
+        for side in [0, 1]:
+            assert [entry[side] for entry in lazy] == list(zip(*pairs[side]))
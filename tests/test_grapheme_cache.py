@@ -0,0 +1,68 @@
+import numpy as np
+
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.feature_set import DASHES, FeatureSet     # noqa: E402
+from fre.grapheme_cache import GraphemeCache     # noqa: E402
+from fre.misc import CAPS, CAPS_ALL, CAPS_INITIAL     # noqa: E402
+
+reference = [
+    'The NASA team met. Then–they left... Did they?! Yes.',
+    'İstanbul’da “Ünlü” straße, 👍🏽 ok.'
+]
+hypothesis = [
+    'the NASA Team met, then – they left. did they? yes',
+    'istanbul’da Ünlü STRASSE 👍🏽 ok'
+]
+
+
+# ====================
+def test_parse_matches_feature_set():
+    """Test that parsing cached documents gives the same result as parsing
+    the text, with and without multi-character features"""
+
+    cache = GraphemeCache()
+    for doc_idx, (ref, hyp) in enumerate(zip(reference, hypothesis)):
+        cache.add(doc_idx, ref, hyp)
+    feature_sets = [
+        FeatureSet([CAPS, '.', ',', ' ']),
+        FeatureSet([CAPS_INITIAL, CAPS_ALL, '?', ' ', DASHES]),
+        FeatureSet(['.', '...', '?!', ' ']),
+        FeatureSet([CAPS, ' '], language='tr')
+    ]
+    for feature_set in feature_sets:
+        for doc_idx, docs in enumerate(zip(reference, hypothesis)):
+            for doc, (chars, codes) in zip(
+                    docs, cache.parse(doc_idx, feature_set)):
+                expected_chars, expected_codes = feature_set.parse(doc)
+                assert chars == expected_chars
+                assert np.array_equal(codes, expected_codes)
+
+
+# ====================
+def test_change_features():
+    """Test that rescoring under new features gives the same results as a
+    new evaluator, and that word error rates are kept"""
+
+    evaluator = FeatureRestorationEvaluator(
+        reference, hypothesis, capitalization=True, feature_chars='., ',
+        word_level=True, cache_graphemes=True)
+    assert evaluator.grapheme_cache is not None
+    wer_info = evaluator.results.get_wer_info('all')
+    evaluator.change_features(feature_chars='.,? ', capitalization='word')
+    expected = FeatureRestorationEvaluator(
+        reference, hypothesis, capitalization='word', feature_chars='.,? ',
+        word_level=True)
+    # Graphemes are only cached by default when a memory budget bounds
+    # the cache
+    assert expected.grapheme_cache is None
+    assert FeatureRestorationEvaluator(
+        reference, hypothesis, capitalization=True, feature_chars='., ',
+        memory_budget=10 ** 6).grapheme_cache is not None
+    assert evaluator.features == expected.features
+    assert evaluator.class_features == expected.class_features
+    for granularity in ['char', 'word']:
+        assert np.array_equal(evaluator.results.counts[granularity],
+                              expected.results.counts[granularity])
+    assert np.array_equal(evaluator.results.edit_counts,
+                          expected.results.edit_counts)
+    assert evaluator.results.get_wer_info('all') == wer_info
@@ -0,0 +1,48 @@
+import re
+
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.html_report import decompress_page, doc_pages     # noqa: E402
+
+reference = [
+    'This is a sentence. This is another sentence.',
+    'This is Sentence 3'
+]
+hypothesis = [
+    'This is a sentence, this is another sentence.',
+    'This is sentence 3.'
+]
+fre_report = FeatureRestorationEvaluator(
+    reference, hypothesis, capitalization=True, feature_chars='., ',
+    get_wer_info_on_init=False
+)
+
+
+# ====================
+def test_doc_pages():
+    """Test that labelled text is split into compressed pages that decode
+    back to the full document"""
+
+    pages, errors, num_chars = doc_pages(
+        reference[0], hypothesis[0], fre_report.feature_set, [], 10)
+    assert len(pages) > 1
+    segments = [s for page in pages for s in decompress_page(page)]
+    # Missing features are shown alongside features in the hypothesis
+    expected = 'This is a sentence., this is another sentence.'
+    assert ''.join(text for text, _ in segments) == expected
+    assert num_chars == len(expected)
+    # Comma in place of a period, and a missing capital
+    assert sum(errors) == 3
+    labelled = [(text, code) for text, code in segments if code != 0]
+    assert labelled == [('.', 2), (',', 1), ('t', 2)]
+
+
+# ====================
+def test_write_html_report(tmp_path):
+    """Test that a report is written with a script element per document"""
+
+    save_path = tmp_path / 'report.html'
+    fre_report.write_html_report(str(save_path), include_wer=False)
+    html = save_path.read_text(encoding='utf-8')
+    assert len(re.findall(r'<script type="application/json" id="doc-', html)) \
+        == 2
+    assert 'Periods' in html
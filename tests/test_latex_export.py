@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.latex_export import export_latex     # noqa: E402
+from fre.text_display import get_labels, latex_snippet     # noqa: E402
+
+reference = [
+    'This is a sentence. This is another sentence.',
+    'This is Sentence 3'
+]
+hypotheses = {
+    'system_a': [
+        'This is a sentence, this is another sentence.',
+        'This is sentence 3.'
+    ],
+    'system_b': reference
+}
+systems = {
+    name: FeatureRestorationEvaluator(
+        reference, hypothesis, capitalization=True, feature_chars='., ')
+    for name, hypothesis in hypotheses.items()
+}
+
+
+# ====================
+def test_latex_snippet():
+    """Test that snippets are split into rows with spaces escaped"""
+
+    labels = get_labels(
+        reference[1], hypotheses['system_a'][1],
+        systems['system_a'].feature_set, [])
+    snippet = latex_snippet(labels, chars_per_row=10, num_rows=2)
+    assert snippet == (
+        r"\texttt{This{\ }is{\ }\fn{s}e}\\" + '\n' +
+        r"\texttt{ntence{\ }3\fp{\mbox{.}}}\\"
+    )
+
+
+# ====================
+def test_export_latex(tmp_path):
+    """Test that tables and snippets are written for every system"""
+
+    paths = export_latex(systems, str(tmp_path), snippet_docs=[1])
+    file_names = sorted(os.path.basename(p) for p in paths)
+    assert file_names == [
+        'comparison_F-score.tex',
+        'prfs_system_a.tex', 'prfs_system_b.tex',
+        'text_system_a_1.tex', 'text_system_b_1.tex',
+        'wer_system_a.tex', 'wer_system_b.tex'
+    ]
+    comparison = (tmp_path / 'comparison_F-score.tex').read_text()
+    assert r'system\_b & 1.00 & 1.00 & N/A & 1.00 & 1.00 & 0.00\\' \
+        in comparison
+
+
+# ====================
+def test_export_latex_different_features(tmp_path):
+    """Test that evaluators with different features are rejected"""
+
+    systems_ = {
+        'system_a': systems['system_a'],
+        'system_c': FeatureRestorationEvaluator(
+            reference, reference, capitalization=False, feature_chars='.')
+    }
+    with pytest.raises(ValueError, match='system_c'):
+        export_latex(systems_, str(tmp_path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,64 @@
+import numpy as np
+
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.parallel import (SharedCorpus, WorkerPool,     # noqa: E402
+                          size_chunks)
+
+reference = [
+    'This is a sentence. This is another sentence.',
+    'This is Sentence 3',
+    'Ünïcödé tëxt, hëre.'
+] * 10
+hypothesis = [
+    'This is a sentence, this is another sentence.',
+    'Thisis Sentense 3',
+    'ünïcödé tëxt. Hëre'
+] * 10
+
+
+# ====================
+def test_shared_corpus():
+    """Test that documents are read back from shared memory"""
+
+    corpus = SharedCorpus(reference)
+    try:
+        assert list(corpus) == reference
+    finally:
+        corpus.release()
+
+
+# ====================
+def test_worker_pool():
+    """Test that counts from worker processes match serial scoring, and
+    that the pool can be reused"""
+
+    kwargs = {
+        'capitalization': True, 'feature_chars': '., ',
+        'get_wer_info_on_init': False, 'word_level': True
+    }
+    serial = FeatureRestorationEvaluator(reference, hypothesis, **kwargs)
+    with WorkerPool(2, chunk_size=4) as pool:
+        for alignment in [False, True]:
+            parallel = FeatureRestorationEvaluator(
+                reference, hypothesis, get_cms_on_init=False,
+                alignment=alignment, **kwargs)
+            parallel.get_cms_all(pool=pool)
+        assert len(pool.shared_corpora) == 1
+    assert np.array_equal(parallel.results.status[:3], [1, 1, 1])
+    assert np.array_equal(serial.results.status[:3], [1, -1, 1])
+    scored = serial.results.scored_docs()
+    for granularity in ['char', 'word']:
+        assert np.array_equal(
+            serial.results.counts[granularity][scored],
+            parallel.results.counts[granularity][scored])
+    assert len(parallel.alignment_info) == len(reference)
+
+
+# ====================
+def test_size_chunks():
+    """Test that the largest documents are scheduled first, in chunks
+    limited by number of documents and by total size"""
+
+    sizes = np.array([5, 100, 20, 30, 1, 1, 1, 1])
+    chunks = size_chunks(sizes, max_docs=3, max_size=50)
+    assert [c.tolist() for c in chunks] == [[1], [3, 2], [0, 4, 5], [6, 7]]
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pytest
+
+from fre import FeatureRestorationEvaluator
+from fre.corpus import TextFileCorpus
+from fre.partial_results import PartialResults, main
+
+reference = [
+    'Hello, world.', 'This is a test.', 'A b c', 'Another Test, here.',
+    'One more.'
+]
+hypothesis = [
+    'hello world.', 'This is a test', 'A b d', 'another test, here.',
+    'One more.'
+]
+settings = dict(capitalization=True, feature_chars='., ', word_level=True)
+
+
+# ====================
+def shard_results(bounds) -> list:
+
+    return [
+        FeatureRestorationEvaluator(
+            reference[start:stop], hypothesis[start:stop], **settings
+        ).to_partial_results(doc_offset=start, num_docs=len(reference))
+        for start, stop in zip(bounds, bounds[1:])
+    ]
+
+
+# ====================
+def test_merge_exact():
+    """Test that merged shard results give exactly the same totals and
+    per-document counts as evaluating the whole corpus, in any order"""
+
+    fre = FeatureRestorationEvaluator(reference, hypothesis, **settings)
+    shards = shard_results([0, 2, 3, 5])
+    for merged in [PartialResults.merge(shards),
+                   shards[2] + (shards[0] + shards[1]),
+                   (shards[1] + shards[2]) + shards[0]]:
+        results = merged.to_result_store()
+        assert (results.status == fre.results.status).all()
+        for granularity in ['char', 'word']:
+            assert (results.counts[granularity] ==
+                    fre.results.counts[granularity]).all()
+        assert (results.class_counts == fre.results.class_counts).all()
+        assert results.get_wer_info('all') == \
+            fre.results.get_wer_info('all')
+        assert results.get_error_rate_info('all') == \
+            fre.results.get_error_rate_info('all')
+
+
+# ====================
+def test_overlap_and_settings():
+    """Test that overlapping shards and shards with different settings
+    cannot be merged"""
+
+    shards = shard_results([0, 3, 5])
+    with pytest.raises(ValueError):
+        PartialResults.merge([shards[0], shards[0]])
+    other = FeatureRestorationEvaluator(
+        reference[3:], hypothesis[3:], capitalization=False,
+        feature_chars='., ', word_level=True
+    ).to_partial_results(doc_offset=3)
+    with pytest.raises(ValueError):
+        PartialResults.merge([shards[0], other])
+
+
+# ====================
+def test_doc_idxs_out_of_range():
+    """Test that document indices outside the corpus are rejected, both
+    when partial results are created and when they are merged"""
+
+    evaluator = FeatureRestorationEvaluator(
+        reference[3:], hypothesis[3:], **settings)
+    with pytest.raises(ValueError, match=r'\[4\]'):
+        evaluator.to_partial_results(doc_offset=3, num_docs=4)
+    with pytest.raises(ValueError, match='out of range'):
+        evaluator.to_partial_results(doc_offset=-1)
+    shards = shard_results([0, 3])
+    unsized = evaluator.to_partial_results(doc_offset=4)
+    with pytest.raises(ValueError, match=r'\[5\]'):
+        PartialResults.merge([shards[0], unsized])
+
+
+# ====================
+def test_save_load_cli(tmp_path):
+    """Test saving shards of a TextFileCorpus, which get their document
+    offsets from the corpus, and merging them with the CLI"""
+
+    for name, docs in [('ref.txt', reference), ('hyp.txt', hypothesis)]:
+        with open(tmp_path / name, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(docs) + '\n')
+    ref = TextFileCorpus(str(tmp_path / 'ref.txt'))
+    hyp = TextFileCorpus(str(tmp_path / 'hyp.txt'))
+    paths = []
+    for shard_idx in range(2):
+        fre = FeatureRestorationEvaluator(
+            ref.shard(2, shard_idx), hyp.shard(2, shard_idx), **settings)
+        path = str(tmp_path / f'shard_{shard_idx}.npz')
+        fre.to_partial_results().save(path)
+        paths.append(path)
+    output = str(tmp_path / 'merged.npz')
+    main(['merge', *paths, '-o', output])
+    assert os.path.exists(output)
+    merged = PartialResults.load(output)
+    assert merged.doc_idxs.tolist() == [0, 1, 2, 3, 4]
+    expected = PartialResults.merge(shard_results([0, 5]))
+    for key, array in expected.arrays.items():
+        assert np.array_equal(merged.arrays[key], array)
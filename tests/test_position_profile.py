@@ -0,0 +1,66 @@
+from fre import FeatureRestorationEvaluator
+from fre.misc import CAPS
+
+reference = ['Hello. World. Hello. World.', 'A b.']
+hypothesis = ['hello. World. hello World.', 'a b.']
+evaluator = FeatureRestorationEvaluator(
+    reference, hypothesis, capitalization=True, feature_chars='.',
+    get_wer_info_on_init=False
+)
+
+
+# ====================
+def test_absolute():
+    """Test that counts binned by absolute position add up to the counts
+    for the whole corpus"""
+
+    profile = evaluator.position_profile('absolute', bin_size=5)
+    assert profile.edges.tolist() == [0, 5, 10, 15, 20, 25]
+    assert (profile.counts.sum(axis=0) ==
+            evaluator.results.get_counts('all', 'char')).all()
+    arrays = profile.plot_arrays('.')
+    # The missing period is after base character 16 ('Hello World Hello')
+    assert arrays['FN'].tolist() == [0, 0, 0, 1, 0]
+
+
+# ====================
+def test_relative():
+    """Test that positions are binned by fraction of document length"""
+
+    profile = evaluator.position_profile('relative', num_bins=2)
+    profile_df = profile.to_dataframe()
+    # 12 and 11 base characters of the first document, and 2 and 1 of the
+    # second
+    assert profile_df[('positions', '')].tolist() == [14, 12]
+    assert profile_df[('all', 'FN')].tolist() == [2, 2]
+    assert profile_df[(CAPS, 'TP')].tolist() == [1, 1]
+
+
+# ====================
+def test_boundary():
+    """Test that positions are binned by distance to the nearest chunk
+    boundary"""
+
+    profile = evaluator.position_profile('boundary', bin_size=1, chunk_size=10)
+    assert profile.edges.tolist() == [0, 1, 2, 3, 4, 5, 6]
+    assert profile.positions.sum() == len('Hello World Hello WorldA b')
+    # Base characters 0, 10 and 20 of the first document and 0 of the
+    # second are at a boundary
+    assert profile.positions[0] == 4
+
+
+# ====================
+def test_word_case_totals():
+    """Test that profile totals equal the corpus counts when word case
+    features are scored on the reference's word starts"""
+
+    for alignment in [False, True]:
+        evaluator_word = FeatureRestorationEvaluator(
+            ['The NASA team won.', 'The NASA team won.'],
+            ['The NASAteam won.', 'The NASAteam wins.'],
+            capitalization='word', feature_chars='. ', alignment=alignment,
+            get_wer_info_on_init=False
+        )
+        profile = evaluator_word.position_profile('absolute', bin_size=5)
+        assert (profile.counts.sum(axis=0) ==
+                evaluator_word.results.get_counts('all', 'char')).all()
@@ -0,0 +1,67 @@
+import numpy as np
+from sklearn.metrics import precision_recall_fscore_support
+
+from fre.prf import average_prf_arrays, prf_arrays
+
+rng = np.random.default_rng(0)
+# Per-position feature labels for 4 documents of 50 positions and 3
+# features
+y_true = rng.random((4, 50, 3)) < 0.3
+y_pred = np.where(rng.random((4, 50, 3)) < 0.8, y_true, ~y_true)
+
+
+# ====================
+def counts_from_labels(y_true: np.ndarray, y_pred: np.ndarray) \
+        -> np.ndarray:
+
+    counts = np.zeros((*y_true.shape[:-2], y_true.shape[-1], 2, 2))
+    for i, ref in enumerate([True, False]):
+        for j, hyp in enumerate([True, False]):
+            counts[..., i, j] = ((y_true == ref) & (y_pred == hyp)).sum(
+                axis=-2)
+    return counts
+
+
+counts = counts_from_labels(y_true, y_pred)
+
+
+# ====================
+def test_averages_match_sklearn():
+    """Test that micro, macro, and weighted averages and F-beta match
+    scikit-learn for multi-label data"""
+
+    for average in ['micro', 'macro', 'weighted']:
+        for beta in [0.5, 1, 2]:
+            expected = precision_recall_fscore_support(
+                y_true.reshape(-1, 3), y_pred.reshape(-1, 3),
+                beta=beta, average=average)[:3]
+            assert np.allclose(
+                average_prf_arrays(counts, average, beta), expected)
+
+
+# ====================
+def test_macro_docs():
+    """Test that document-level macro averages are the mean of the
+    micro averages of each document"""
+
+    expected = np.mean([
+        precision_recall_fscore_support(
+            y_true[i], y_pred[i], average='micro')[:3]
+        for i in range(len(y_true))
+    ], axis=0)
+    assert np.allclose(average_prf_arrays(counts, 'macro_docs'), expected)
+
+
+# ====================
+def test_nan_semantics():
+    """Test that undefined values are NaN and are left out of macro
+    averages"""
+
+    counts_ = np.zeros((1, 2, 2, 2))
+    counts_[0, 0] = [[3, 1], [1, 10]]
+    # The second feature never appears in the reference or hypothesis
+    precision, recall, fscore = prf_arrays(counts_[0])
+    assert np.isnan(precision[1]) and np.isnan(fscore[1])
+    assert np.allclose(
+        average_prf_arrays(counts_, 'macro'), [0.75, 0.75, 0.75])
+    assert np.isnan(average_prf_arrays(counts_[:, 1:], 'weighted')).all()
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+
+from fre import FeatureRestorationEvaluator
+
+random.seed(0)
+words = 'the cat sat on the mat. then, it left. The End'.split(' ')
+reference = []
+hypothesis = []
+for _ in range(300):
+    ref = ' '.join(random.choices(words, k=random.choice([5, 20, 60])))
+    hyp = ''.join(
+        c if c not in '.,' or random.random() < 0.7 else random.choice('.,')
+        for c in ref.capitalize())
+    reference.append(ref.capitalize())
+    hypothesis.append(hyp)
+settings = dict(
+    capitalization=True, feature_chars='., ', get_cms_on_init=False,
+    get_wer_info_on_init=False)
+exact = FeatureRestorationEvaluator(reference, hypothesis, **settings)
+exact.get_cms_all()
+exact.get_wer_info_all()
+exact_fscores = [
+    exact.get_prfs('all')[f]['F-score'] for f in exact.features + ['all']]
+
+
+# ====================
+def test_estimate_covers_exact():
+    """Test that sampling stops before all documents are scored and that
+    the intervals contain the exact metrics"""
+
+    fre = FeatureRestorationEvaluator(reference, hypothesis, **settings)
+    estimate = fre.estimate_metrics(target_width=0.1, seed=0)
+    assert estimate.stop_reason == 'target_width'
+    assert estimate.num_sampled < len(reference)
+    estimates = estimate.to_dataframe()
+    for feature, fscore in zip(fre.features + ['all'], exact_fscores):
+        if feature == ' ':
+            continue
+        assert estimates.loc[feature, 'lower'] <= fscore \
+            <= estimates.loc[feature, 'upper']
+    wer_ = exact.results.get_wer_info('all')['wer']
+    assert estimates.loc['WER', 'lower'] <= wer_ \
+        <= estimates.loc['WER', 'upper']
+    # The same seed gives the same sample
+    fre_2 = FeatureRestorationEvaluator(reference, hypothesis, **settings)
+    assert fre_2.estimate_metrics(target_width=0.1, seed=0).to_dataframe() \
+        .equals(estimates)
+
+
+# ====================
+def test_exhausted_is_exact():
+    """Test that estimates are exact once every document is scored"""
+
+    fre = FeatureRestorationEvaluator(reference, hypothesis, **settings)
+    estimate = fre.estimate_metrics(target_width=0, include_wer=False)
+    assert estimate.stop_reason == 'exhausted'
+    estimates = estimate.to_dataframe()
+    assert 'WER' not in estimates.index
+    assert np.allclose(estimates['estimate'], exact_fscores)
+    assert np.allclose(estimates['width'], 0)
@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from fre import FeatureRestorationEvaluator
+from fre.misc import CAPS
+from fre.server import ScoringServer
+
+reference = ['Hello, world. Foo bar.', 'This is a test.', 'A b c']
+hypothesis = ['hello world, foo bar.', 'This is a test', 'A b d']
+
+
+# ====================
+@pytest.fixture(scope='module')
+def server_url():
+
+    server = ScoringServer(True, '., ', num_workers=1, max_wait_ms=20)
+    thread = threading.Thread(target=server.run, args=('127.0.0.1', 0))
+    thread.start()
+    assert server.ready.wait(30)
+    yield f'http://127.0.0.1:{server.port}'
+    server.stop()
+    thread.join(30)
+
+
+# ====================
+def post(url: str, payload: dict) -> dict:
+
+    request = urllib.request.Request(
+        url + '/score', data=json.dumps(payload).encode('utf-8'))
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+# ====================
+def test_score(server_url):
+    """Test that the server returns the same metrics as an evaluator, and
+    that pairs with different base characters are reported as skipped"""
+
+    response = post(server_url, {
+        'reference': reference, 'hypothesis': hypothesis})
+    fre = FeatureRestorationEvaluator(
+        reference, hypothesis, capitalization=True, feature_chars='., ')
+    prfs = fre.get_prfs('all')
+    assert response['skipped'] == [2]
+    assert response['prfs'][CAPS]['FN'] == 2
+    assert response['prfs']['.']['Recall'] == prfs['.']['Recall']
+    assert response['prfs'][',']['F-score'] is None
+    wer_info = fre.results.get_wer_info('all')
+    assert response['wer']['num_edits'] == wer_info['num_edits']
+
+
+# ====================
+def test_concurrent_requests(server_url):
+    """Test that concurrent requests batched together each get their own
+    results"""
+
+    responses = [None] * 8
+
+    def send(i: int):
+        responses[i] = post(server_url, {
+            'reference': reference[:1] * (i + 1),
+            'hypothesis': hypothesis[:1] * (i + 1),
+            'include_wer': False
+        })
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i, response in enumerate(responses):
+        assert response['num_docs'] == i + 1
+        assert response['prfs'][CAPS]['FN'] == 2 * (i + 1)
+        assert 'wer' not in response
+
+
+# ====================
+def test_bad_request(server_url):
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        post(server_url, {'reference': ['a'], 'hypothesis': ['a', 'b']})
+    assert e.value.code == 400
+
+
+# ====================
+def test_method_not_allowed(server_url):
+    """Test that other methods on /score get a 405 response with an Allow
+    header"""
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(server_url + '/score')
+    assert e.value.code == 405
+    assert e.value.headers['Allow'] == 'POST'
+    assert 'not allowed' in json.loads(e.value.read())['error']
+
+
+# ====================
+def test_stop_with_pending_pairs():
+    """Test that a request whose pairs are still being batched when the
+    server stops gets an error response rather than waiting forever"""
+
+    server = ScoringServer(True, '., ', num_workers=1, max_wait_ms=60000)
+    thread = threading.Thread(target=server.run, args=('127.0.0.1', 0))
+    thread.start()
+    assert server.ready.wait(30)
+    errors = []
+
+    def send():
+        with pytest.raises(urllib.error.HTTPError) as e:
+            post(f'http://127.0.0.1:{server.port}', {
+                'reference': reference, 'hypothesis': hypothesis})
+        errors.append(e.value)
+
+    client = threading.Thread(target=send)
+    client.start()
+    while not server.pending:
+        time.sleep(0.01)
+    server.stop()
+    thread.join(30)
+    client.join(30)
+    assert not thread.is_alive()
+    assert errors[0].code == 500
+    assert 'stopped' in json.loads(errors[0].read())['error']
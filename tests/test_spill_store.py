@@ -0,0 +1,55 @@
+import pickle
+
+import numpy as np
+
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.spill_store import SpillStore     # noqa: E402
+
+reference = [
+    'This is a sentence. This is another sentence.',
+    'This is Sentence 3',
+    'Here is one more, for good measure.'
+]
+hypothesis = [
+    'This is a sentence, this is another sentence',
+    'This is sentence three.',
+    'here is one more for good measure.'
+]
+
+
+# ====================
+def test_spill_store():
+    """Test that least recently used values are spilled to disk and read
+    back in when they are used"""
+
+    store = SpillStore(max_bytes=2500)
+    for key in range(5):
+        store[key] = np.full(100, key, dtype=np.int64)
+    assert store.memory_bytes <= 2500
+    assert store.num_spilled == 2
+    assert store[0][0] == 0 and store.num_loaded == 1
+    store[4] = np.zeros(3)
+    del store[1]
+    assert sorted(store) == [0, 2, 3, 4] and len(store) == 4
+    restored = pickle.loads(pickle.dumps(store))
+    assert all(np.array_equal(store[k], restored[k]) for k in store)
+
+
+# ====================
+def test_memory_budget():
+    """Test that an evaluator with a small memory budget gives the same
+    results as one without"""
+
+    settings = {
+        'capitalization': True, 'feature_chars': '., ', 'alignment': True
+    }
+    expected = FeatureRestorationEvaluator(reference, hypothesis, **settings)
+    evaluator = FeatureRestorationEvaluator(
+        reference, hypothesis, memory_budget=200, **settings)
+    assert isinstance(evaluator.results.counts['char'], np.memmap)
+    assert evaluator.grapheme_cache.docs.num_spilled > 0
+    assert np.array_equal(evaluator.results.counts['char'],
+                          expected.results.counts['char'])
+    for doc_idx in [0, 1, 'all']:
+        assert evaluator.get_prfs(doc_idx) == expected.get_prfs(doc_idx)
+    assert dict(evaluator.alignment_info) == dict(expected.alignment_info)
@@ -0,0 +1,75 @@
+import numpy as np
+
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.misc import CAPS_ALL, CAPS_INITIAL     # noqa: E402
+
+reference = [
+    'This is a sentence. This is another sentence.',
+    'This is Sentence 3'
+]
+hypothesis_a = [
+    'This is a sentence, this is another sentence.',
+    'This is sentence 3.'
+]
+hypothesis_b = [
+    'This is a sentence. this is another sentence',
+    'This is sentence 3.'
+]
+kwargs = {
+    'capitalization': True, 'feature_chars': '., ',
+    'get_wer_info_on_init': False
+}
+fre_a = FeatureRestorationEvaluator(reference, hypothesis_a, **kwargs)
+fre_b = FeatureRestorationEvaluator(reference, hypothesis_b, **kwargs)
+
+
+# ====================
+def test_system_diff_counts():
+    """Test that fixed, regressed, and unchanged errors are counted for
+    each feature"""
+
+    counts = fre_a.compare(fre_b).get_counts()
+    # The comma after 'sentence' is now a period, but the final period
+    # was dropped, and both systems add a period at the end of the second
+    # document
+    assert counts.loc['.'].tolist() == [1, 1, 1, 0]
+    assert counts.loc[','].tolist() == [1, 0, 0, 1]
+    # Two missing capitals in both systems
+    assert counts.loc['CAPS'].tolist() == [0, 0, 2, 0]
+    assert counts.loc['all', 'net'] == 1
+
+
+# ====================
+def test_system_diff_alignment():
+    """Test that positions are only compared where both hypotheses are
+    aligned with the reference"""
+
+    fre_c = FeatureRestorationEvaluator(
+        reference, ['This is a sentense. This is another sentence.',
+                    'This is Sentence 3'], alignment=True, **kwargs)
+    diff = fre_a.compare(fre_c, alignment=True)
+    labels = diff.doc_labels(0)
+    assert len(labels[0]) == len(diff.feature_set.parse(reference[0])[0]) - 1
+    assert np.array_equal(diff.get_counts(1)['fixed'].to_numpy(),
+                          [1, 1, 0, 0, 2])
+
+
+# ====================
+def test_system_diff_word_case():
+    """Test that a missing space between words is a regression for the
+    space only, and not for the case features of the words"""
+
+    kwargs_word = {
+        'capitalization': 'word', 'feature_chars': '. ',
+        'get_wer_info_on_init': False
+    }
+    reference_word = ['The NASA team won.']
+    fre_ref = FeatureRestorationEvaluator(
+        reference_word, reference_word, **kwargs_word)
+    fre_joined = FeatureRestorationEvaluator(
+        reference_word, ['The NASAteam won.'], **kwargs_word)
+    counts = fre_ref.compare(fre_joined).get_counts()
+    assert counts.loc[CAPS_INITIAL].tolist() == [0, 0, 0, 0]
+    assert counts.loc[CAPS_ALL].tolist() == [0, 0, 0, 0]
+    assert counts.loc[' '].tolist() == [0, 1, 0, -1]
+    assert counts.loc['all', 'net'] == -1
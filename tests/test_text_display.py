@@ -0,0 +1,62 @@
+import io
+import re
+
+import fre.text_display     # noqa: E402
+from fre import FeatureRestorationEvaluator     # noqa: E402
+from fre.misc import is_running_in_notebook     # noqa: E402
+from fre.text_display import (ANSI_CODES, ANSI_RESET,     # noqa: E402
+                              get_labels, show_text_display_,
+                              stream_text_display)
+
+reference = 'This is a sentence. This is another sentence.'
+hypothesis = 'This is a sentence, this is another sentence'
+evaluator = FeatureRestorationEvaluator(
+    [reference], [hypothesis], capitalization=True, feature_chars='., ')
+
+
+# ====================
+def test_stream_text_display():
+    """Test that the streamed display has the same text as the labelled
+    entries, with errors wrapped in ANSI colours"""
+
+    out = io.StringIO()
+    stream_text_display(reference, hypothesis, evaluator.feature_set, out=out)
+    labels = get_labels(reference, hypothesis, evaluator.feature_set, [])
+    assert re.sub(r'\x1b\[\d+m', '', out.getvalue()) == \
+        ''.join(text for text, _, _ in labels) + '\n'
+    assert f"{ANSI_CODES['fp']},{ANSI_RESET}" in out.getvalue()
+    assert f"{ANSI_CODES['fn']}t{ANSI_RESET}" in out.getvalue()
+
+
+# ====================
+def test_stream_text_display_rows():
+    """Test that only the requested rows are written"""
+
+    out = io.StringIO()
+    stream_text_display(reference, hypothesis, evaluator.feature_set,
+                        start_char=5, chars_per_row=10, num_rows=2, out=out)
+    rows = re.sub(r'\x1b\[\d+m', '', out.getvalue()).split('\n')
+    assert rows == ['is a sente', 'nce., this', '']
+
+
+# ====================
+def test_show_text_display_notebook_detection(monkeypatch, capsys):
+    """Test that HTML is displayed only in a notebook kernel, and that the
+    terminal display is used otherwise, even if IPython is installed"""
+
+    # IPython may be importable, but no kernel is running under pytest
+    assert is_running_in_notebook() is False
+    displayed = []
+    monkeypatch.setattr(
+        fre.text_display, 'display_or_print_html', displayed.append)
+    monkeypatch.setattr(
+        fre.text_display, 'is_running_in_notebook', lambda: True)
+    show_text_display_(reference, hypothesis, evaluator.feature_set)
+    assert len(displayed) == 1
+    assert '<span class="fp">,</span>' in displayed[0]
+    assert capsys.readouterr().out == ''
+    monkeypatch.setattr(
+        fre.text_display, 'is_running_in_notebook', lambda: False)
+    show_text_display_(reference, hypothesis, evaluator.feature_set)
+    assert len(displayed) == 1
+    assert f"{ANSI_CODES['fp']},{ANSI_RESET}" in capsys.readouterr().out